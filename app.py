@@ -7,39 +7,93 @@ from models.model_init import load_model
 from database.db_init import (
     load_grafa_database,
     load_hashtag_embeddings,
+    build_hashtag_vocabulary,
+    build_hashtag_matcher,
+    build_hashtag_suggester,
     load_hashtag_embedding_bin,
     load_annotation,
     load_encoded_frames,
-    faiss_database_processing,
+    load_frame_knn,
+    load_hashtag_postings,
 )
+from database.startup_loader import StartupLoader
+from database.index_registry import IndexRegistry
+from database.compressed_index import COMPRESSED_FAISS_DATABASES
+from database.sharded_index import SHARDED_FAISS_DATABASES
+from database.generation import read_generation
+from tools.text_embedding_cache import TextEmbeddingCache, set_text_embedding_cache
+from tools.traversal_cache import TraversalCache
+from tools.similar_hashtag_cache import SimilarHashtagCache
+from tools.encoding_scheduler import TextEncodeScheduler, set_text_encode_scheduler
+from tools.query_encoding import forward_texts
+from tools.compute_executor import ComputeExecutor
+from tools.nlp_pipeline import get_nlp
 
 #Creates a FastAPI instance
 app = FastAPI()
 
-# Initialize the model and its preprocessing function
-device, model = load_model()
+# Initialize the model and the databases concurrently in the background.
+# Each component is published on app.state as soon as it is loaded (see /healthz and /readyz);
+# the GRAFA graph is only needed by hashtag queries, so it does not gate readiness.
+startup_loader = StartupLoader(app.state)
+startup_loader.add('model', load_model, targets=('device', 'model'))
+startup_loader.add('grafa', load_grafa_database, required=False)
+startup_loader.add('hashtag_embeddings', load_hashtag_embeddings)
+startup_loader.add('hashtag_vocabulary', build_hashtag_vocabulary, after=('hashtag_embeddings',))
+startup_loader.add('hashtag_matcher', build_hashtag_matcher, after=('hashtag_vocabulary',), required=False)
+startup_loader.add('hashtag_suggester', build_hashtag_suggester, after=('hashtag_vocabulary', 'grafa'), required=False)
+startup_loader.add('hashtag_embedding_index', load_hashtag_embedding_bin)
+startup_loader.add('annotation', load_annotation, targets=('image_info_dict',))
+startup_loader.add('encoded_frames', lambda model: load_encoded_frames(model[0]), after=('model',))
+startup_loader.add('frame_knn', load_frame_knn, required=False)
+startup_loader.add('hashtag_postings', load_hashtag_postings, required=False)
 
-# Initialize the database
-G, sparse_matrix, node_mapping, reverse_node_mapping = load_grafa_database()
-hashtag_embeddings = load_hashtag_embeddings()
-hashtag_embedding_index = load_hashtag_embedding_bin()
-image_info_dict = load_annotation()
-encoded_frames = load_encoded_frames(device)
-clipv0_hnsw = faiss_database_processing('CLIP_v0')
-clipv2_hnsw = faiss_database_processing('CLIP_v2')
+def start_text_encode_scheduler(model):
+    # Micro-batch the text encoding of concurrent queries into shared forward passes
+    device, model = model
+    scheduler = TextEncodeScheduler(model, device, forward_texts, max_batch_size=64, max_wait_ms=5)
+    set_text_encode_scheduler(scheduler)
+    return scheduler
+
+startup_loader.add('text_encode_scheduler', start_text_encode_scheduler, after=('model',), required=False)
+# The shared spaCy pipeline of /process_query, loaded before the first keystroke needs it
+startup_loader.add('nlp', get_nlp, targets=(), required=False)
+# The FAISS indexes are owned by the registry, which keeps them resident and can hot-reload them
+index_registry = IndexRegistry()
+for database_name in index_registry.databases:
+    if database_name in COMPRESSED_FAISS_DATABASES:
+        # Compressed variants re-rank their candidates with the raw embeddings
+        startup_loader.add(database_name,
+                           lambda encoded_frames, database_name=database_name:
+                               index_registry.load(database_name, rerank_frames=encoded_frames),
+                           targets=(), after=('encoded_frames',), required=False)
+    else:
+        # The merged HNSW indexes gate readiness; sharded variants are optional
+        startup_loader.add(database_name, lambda database_name=database_name: index_registry.load(database_name),
+                           targets=(), required=database_name not in SHARDED_FAISS_DATABASES)
+startup_loader.start()
+
+# Cache CLIP text features of repeated sentences and hashtags, in memory and across restarts
+text_embedding_cache = TextEmbeddingCache(max_entries=50000, db_path='database/text_embedding_cache.sqlite')
+set_text_embedding_cache(text_embedding_cache)
+
+# Cache the graph traversal of each query hashtag, so editing one hashtag of a query only traverses that one
+traversal_cache = TraversalCache(max_bytes=128 * 1024 * 1024)
+
+# Cache the vocabulary hashtags resolved for unseen query hashtags, in memory and across restarts
+similar_hashtag_cache = SimilarHashtagCache(max_entries=10000, db_path='database/similar_hashtag_cache.sqlite')
+
+# Run the blocking search stages on a bounded pool; requests beyond its queue get a 503
+compute_executor = ComputeExecutor(max_workers=min(4, os.cpu_count() or 1), max_queue=16)
 
 # Initialize the shared database
-app.state.device = device
-app.state.model = model
-app.state.G = G
-app.state.sparse_matrix = sparse_matrix
-app.state.node_mapping = node_mapping
-app.state.reverse_node_mapping = reverse_node_mapping
-app.state.hashtag_embeddings = hashtag_embeddings
-app.state.hashtag_embedding_index = hashtag_embedding_index
-app.state.image_info_dict = image_info_dict
-app.state.encoded_frames = encoded_frames
-app.state.clipv0_hnsw = clipv0_hnsw
+app.state.startup_loader = startup_loader
+app.state.compute_executor = compute_executor
+app.state.index_registry = index_registry
+app.state.generation = read_generation()
+app.state.text_embedding_cache = text_embedding_cache
+app.state.traversal_cache = traversal_cache
+app.state.similar_hashtag_cache = similar_hashtag_cache
 app.state.FEEDBACK_STORE: Dict[str, Any] = {}
 app.state.TEMP_FEEDBACK_STORE: Dict[str, Any] = {}
 
@@ -50,6 +104,9 @@ from routers.data_router import router as data_router
 from routers.search_router import router as search_router
 from routers.feedback_router import router as feedback_router
 from routers.process_query_router import router as process_query_router
+from routers.health_router import router as health_router
+from routers.index_router import router as index_router
+from routers.hashtag_router import router as hashtag_router
 
 app.include_router(home_router)
 app.include_router(update_results_router)
@@ -57,6 +114,9 @@ app.include_router(data_router)
 app.include_router(search_router)
 app.include_router(feedback_router)
 app.include_router(process_query_router)
+app.include_router(health_router)
+app.include_router(index_router)
+app.include_router(hashtag_router)
 
 # Mount the content directory to serve static files
 app.mount('/static/style',
@@ -0,0 +1,252 @@
+# database/annotation_store.py
+import os
+import json
+import argparse
+import numpy as np
+
+from database.string_table import StringTable
+
+# Configure logging to output to the notebook
+import logging
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+ANNOTATION_FORMAT_VERSION = 1
+
+def timestamp_to_ms(timestamp_str):
+    """
+    Convert a 'HH:MM:SS[.ffffff]' timestamp string into milliseconds (0 for malformed strings).
+    """
+
+    parts = timestamp_str.split(":")
+    if len(parts) != 3:
+        return 0
+    return int(round((int(parts[0]) * 3600 + int(parts[1]) * 60 + float(parts[2])) * 1000))
+
+class AnnotationStore:
+    """
+    Columnar frame annotations indexed by database index, replacing `index_caption_hashtag_dict_v2.json`.
+
+    Columns (memory-mapped `.npy` files in the annotation directory):
+        video_code: int32 code of the video ID in the `videos_*` string table (-1 for missing rows).
+        frame_id: int64 frame ID, or a `frame_id_*` string table when the source frame IDs are not integers.
+        timestamp_ms: int64 timestamp in milliseconds, used for filtering.
+        timestamp_*: string table of the original timestamp strings, used for display.
+        frame_path_*: string table of the frame paths.
+
+    Looking up a frame is an array index instead of `image_info_dict[str(idx)]`. Item access (`store[idx]`)
+    still returns the JSON-style dict for callers that need all fields at once. Captions and hashtags of the
+    JSON file are not used by the app and are not converted.
+    """
+
+    def __init__(self, video_code, frame_id, timestamp_ms, timestamps, frame_paths, videos):
+        self.video_code = video_code
+        self.frame_id = frame_id
+        self.timestamp_ms = timestamp_ms
+        self.timestamps = timestamps
+        self.frame_paths = frame_paths
+        self.videos = videos
+        self._row_ids = None
+        self._video_rows = None
+
+    def __len__(self):
+        return len(self.video_code)
+
+    def __contains__(self, idx):
+        idx = int(idx)
+        return 0 <= idx < len(self.video_code) and self.video_code[idx] >= 0
+
+    def _check(self, idx):
+        idx = int(idx)
+        if not (0 <= idx < len(self.video_code)) or self.video_code[idx] < 0:
+            raise KeyError(idx)
+        return idx
+
+    def video_ID(self, idx):
+        return self.videos[self.video_code[self._check(idx)]]
+
+    def frame_ID(self, idx):
+        idx = self._check(idx)
+        if isinstance(self.frame_id, StringTable):
+            return self.frame_id[idx]
+        return int(self.frame_id[idx])
+
+    def timestamp(self, idx):
+        return self.timestamps[self._check(idx)]
+
+    def frame_path(self, idx):
+        return self.frame_paths[self._check(idx)]
+
+    def __getitem__(self, idx):
+        return {'video_ID': self.video_ID(idx),
+                'frame_ID': self.frame_ID(idx),
+                'timestamp': self.timestamp(idx),
+                'frame_path': self.frame_path(idx)}
+
+    def row_ids(self):
+        """
+        Return the database indices of all annotated frames, in ascending order.
+        """
+
+        if self._row_ids is None:
+            self._row_ids = np.flatnonzero(np.asarray(self.video_code) >= 0)
+        return self._row_ids
+
+    def video_rows(self, video_ID):
+        """
+        Return the database indices of the frames of a video, in ascending order.
+
+        Process:
+            The frames are grouped by video code once (a stable argsort and per-code offsets),
+            so each call is a binary search in the video table plus an array slice.
+        """
+
+        if self._video_rows is None:
+            codes = np.asarray(self.video_code)
+            order = np.argsort(codes, kind='stable')
+            offsets = np.searchsorted(codes[order], np.arange(len(self.videos) + 1), side='left')
+            self._video_rows = (order, offsets)
+        code = self.videos.find(video_ID)
+        if code < 0:
+            return np.empty(0, dtype=np.int64)
+        order, offsets = self._video_rows
+        return order[offsets[code]:offsets[code + 1]]
+
+    def values(self):
+        for idx in self.row_ids():
+            yield self[idx]
+
+    @classmethod
+    def from_dict(cls, image_info_dict):
+        """
+        Build an in-memory store from the JSON annotation dict (keys are `str(db_idx)`).
+        """
+
+        size = max((int(key) for key in image_info_dict), default=-1) + 1
+        video_names = sorted({info['video_ID'] for info in image_info_dict.values()})
+        video_codes = {video_ID: code for code, video_ID in enumerate(video_names)}
+        integer_frame_ids = all(isinstance(info['frame_ID'], int) for info in image_info_dict.values())
+
+        video_code = np.full(size, -1, dtype=np.int32)
+        frame_ids = np.zeros(size, dtype=np.int64) if integer_frame_ids else [''] * size
+        timestamp_ms = np.zeros(size, dtype=np.int64)
+        timestamps = [''] * size
+        frame_paths = [''] * size
+        for key, info in image_info_dict.items():
+            idx = int(key)
+            video_code[idx] = video_codes[info['video_ID']]
+            frame_ids[idx] = info['frame_ID'] if integer_frame_ids else str(info['frame_ID'])
+            timestamp_ms[idx] = timestamp_to_ms(info['timestamp'])
+            timestamps[idx] = info['timestamp']
+            frame_paths[idx] = info['frame_path']
+
+        return cls(video_code,
+                   frame_ids if integer_frame_ids else StringTable.from_strings(frame_ids, sortable=False),
+                   timestamp_ms,
+                   StringTable.from_strings(timestamps, sortable=False),
+                   StringTable.from_strings(frame_paths, sortable=False),
+                   StringTable.from_strings(video_names))
+
+    def extend(self, rows, start=None):
+        """
+        Return a new in-memory store with `rows` appended, e.g. the frames of a newly ingested video.
+
+        Args:
+            rows (list): JSON-style dicts with 'video_ID', 'frame_ID', 'timestamp' and 'frame_path'.
+            start (int, optional): The database index of the first row (default is `len(self)`); the rows
+                                   in between are left missing.
+
+        Returns:
+            AnnotationStore: The extended store. The codes of existing videos are unchanged; new videos are
+                             appended to the video table.
+        """
+
+        start = len(self) if start is None else start
+        if start < len(self):
+            raise ValueError(f"Cannot append at database index {start}: the store already has {len(self)} rows.")
+        size = start + len(rows)
+        gap = start - len(self)
+
+        new_videos = list(dict.fromkeys(row['video_ID'] for row in rows if self.videos.find(row['video_ID']) < 0))
+        videos = self.videos.extend(new_videos)
+        new_codes = {video_ID: len(self.videos) + offset for offset, video_ID in enumerate(new_videos)}
+        video_code = np.full(size, -1, dtype=np.int32)
+        video_code[:len(self)] = self.video_code
+        video_code[start:] = [new_codes.get(row['video_ID'], self.videos.find(row['video_ID'])) for row in rows]
+
+        timestamp_ms = np.zeros(size, dtype=np.int64)
+        timestamp_ms[:len(self)] = self.timestamp_ms
+        timestamp_ms[start:] = [timestamp_to_ms(row['timestamp']) for row in rows]
+
+        if not isinstance(self.frame_id, StringTable) and all(isinstance(row['frame_ID'], int) for row in rows):
+            frame_id = np.zeros(size, dtype=np.int64)
+            frame_id[:len(self)] = self.frame_id
+            frame_id[start:] = [row['frame_ID'] for row in rows]
+        else:
+            # Non-integer frame IDs turn the whole column into a string table
+            frame_id = self.frame_id
+            if not isinstance(frame_id, StringTable):
+                frame_id = StringTable.from_strings([str(value) for value in frame_id], sortable=False)
+            frame_id = frame_id.extend([''] * gap + [str(row['frame_ID']) for row in rows])
+
+        return AnnotationStore(video_code,
+                               frame_id,
+                               timestamp_ms,
+                               self.timestamps.extend([''] * gap + [row['timestamp'] for row in rows]),
+                               self.frame_paths.extend([''] * gap + [row['frame_path'] for row in rows]),
+                               videos)
+
+    def save(self, annotation_dir):
+        os.makedirs(annotation_dir, exist_ok=True)
+        np.save(os.path.join(annotation_dir, 'video_code.npy'), self.video_code)
+        np.save(os.path.join(annotation_dir, 'timestamp_ms.npy'), self.timestamp_ms)
+        if isinstance(self.frame_id, StringTable):
+            self.frame_id.save(os.path.join(annotation_dir, 'frame_id'))
+        else:
+            np.save(os.path.join(annotation_dir, 'frame_id.npy'), self.frame_id)
+        self.timestamps.save(os.path.join(annotation_dir, 'timestamp'))
+        self.frame_paths.save(os.path.join(annotation_dir, 'frame_path'))
+        self.videos.save(os.path.join(annotation_dir, 'videos'))
+        with open(os.path.join(annotation_dir, 'annotation_meta.json'), 'w') as f:
+            json.dump({'format_version': ANNOTATION_FORMAT_VERSION,
+                       'size': len(self),
+                       'n_frames': int(len(self.row_ids())),
+                       'n_videos': len(self.videos),
+                       'integer_frame_ids': not isinstance(self.frame_id, StringTable)}, f)
+
+    @classmethod
+    def load(cls, annotation_dir, mmap_mode='r'):
+        with open(os.path.join(annotation_dir, 'annotation_meta.json'), 'r') as f:
+            meta = json.load(f)
+        if meta['format_version'] != ANNOTATION_FORMAT_VERSION:
+            raise ValueError(f"Unsupported annotation format version {meta['format_version']} in {annotation_dir}.")
+        load = lambda name: np.load(os.path.join(annotation_dir, f'{name}.npy'), mmap_mode=mmap_mode)
+        table = lambda name: StringTable.load(os.path.join(annotation_dir, name), mmap_mode=mmap_mode)
+        return cls(load('video_code'),
+                   load('frame_id') if meta['integer_frame_ids'] else table('frame_id'),
+                   load('timestamp_ms'),
+                   table('timestamp'),
+                   table('frame_path'),
+                   table('videos'))
+
+def convert_annotation_json(image_info_dict_path='database/index_caption_hashtag_dict_v2.json',
+                            annotation_dir='database/annotation'):
+    """
+    One-time conversion of the JSON annotation dict into the memory-mappable columnar directory.
+    """
+
+    with open(image_info_dict_path, 'r') as openfile:
+        image_info_dict = json.load(openfile)
+    store = AnnotationStore.from_dict(image_info_dict)
+    store.save(annotation_dir)
+    logger.info(f"Converted {image_info_dict_path} to {annotation_dir}: "
+                f"{len(store.row_ids())} frames, {len(store.videos)} videos")
+    return store
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the JSON annotations into the columnar format.")
+    parser.add_argument('--image_info_dict_path', default='database/index_caption_hashtag_dict_v2.json')
+    parser.add_argument('--annotation_dir', default='database/annotation')
+    args = parser.parse_args()
+    convert_annotation_json(args.image_info_dict_path, args.annotation_dir)
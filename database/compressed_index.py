@@ -0,0 +1,237 @@
+# database/compressed_index.py
+import os
+import json
+import time
+import argparse
+import numpy as np
+
+import faiss
+
+from tools.faiss_retrieval import k_image_search, hnsw_search_parameters
+from tools.hnsw_benchmark import exact_neighbors
+
+# Configure logging to output to the notebook
+import logging
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Compressed variants of the HNSW databases: name -> (base database, kind, index file)
+COMPRESSED_FAISS_DATABASES = {
+    'CLIP_v0_sq8': ('CLIP_v0', 'sq8', 'database/merged_index_hnsw_sq8_v0.bin'),
+    'CLIP_v0_ivfpq': ('CLIP_v0', 'ivfpq', 'database/merged_index_ivfpq_v0.bin'),
+}
+
+def index_factory_string(kind, count, dim, pq_m=64, hnsw_m=32):
+    """
+    The FAISS factory string of a compressed index kind.
+
+    Args:
+        kind (str): 'sq8' (HNSW graph over 8-bit scalar-quantized vectors, 4x smaller than float32) or
+                    'ivfpq' (inverted lists of `pq_m`-byte product-quantized codes).
+        count (int): The number of vectors, used to size the IVF coarse quantizer.
+        dim (int): The vector dimension.
+        pq_m (int): The number of PQ sub-quantizers (bytes per vector) for 'ivfpq' (default is 64).
+        hnsw_m (int): The number of HNSW links per node for 'sq8' (default is 32).
+    """
+
+    if kind == 'sq8':
+        return f"HNSW{hnsw_m},SQ8"
+    if kind == 'ivfpq':
+        if dim % pq_m:
+            raise ValueError(f"The dimension {dim} is not a multiple of pq_m={pq_m}.")
+        nlist = int(max(16, min(65536, 4 * np.sqrt(count))))
+        return f"IVF{nlist},PQ{pq_m}x8"
+    raise ValueError(f"Unsupported index kind {kind!r}. Choose 'sq8' or 'ivfpq'.")
+
+def build_compressed_index(encoded_frames, kind, metric_type=faiss.METRIC_L2,
+                           pq_m=64, hnsw_m=32, nprobe=32, train_size=200000, chunk_size=65536, seed=0):
+    """
+    Train and fill a compressed index from the encoded frames, keeping their database indices as ids.
+
+    Args:
+        encoded_frames (EmbeddingStore): The encoded frames.
+        kind (str): 'sq8' or 'ivfpq' (see `index_factory_string`).
+        metric_type (int): The FAISS metric, which must match the HNSW index it replaces (default is L2).
+        pq_m (int): Bytes per vector of 'ivfpq' (default is 64).
+        hnsw_m (int): HNSW links per node of 'sq8' (default is 32).
+        nprobe (int): The number of inverted lists visited per query by 'ivfpq' (default is 32).
+        train_size (int): The maximum number of frames sampled to train the quantizers (default is 200000).
+        chunk_size (int): The number of frames added at a time (default is 65536).
+        seed (int): The seed of the training sample (default is 0).
+
+    Returns:
+        faiss.Index: The trained and filled index.
+    """
+
+    count, dim = len(encoded_frames), encoded_frames.shape[1]
+    factory = index_factory_string(kind, count, dim, pq_m, hnsw_m)
+    logger.info(f"Building {factory} over {count} frames")
+    index = faiss.index_factory(dim, factory, metric_type)
+
+    rng = np.random.default_rng(seed)
+    train_rows = np.sort(rng.choice(count, size=min(train_size, count), replace=False))
+    index.train(np.ascontiguousarray(encoded_frames[train_rows].cpu().numpy(), dtype=np.float32))
+
+    for start in range(0, count, chunk_size):
+        index.add(np.ascontiguousarray(encoded_frames[start:start + chunk_size].cpu().numpy(), dtype=np.float32))
+
+    ivf_index = faiss.try_extract_index_ivf(index)
+    if ivf_index is not None:
+        ivf_index.nprobe = nprobe
+        # Needed by `reconstruct_batch` (filtered brute-force search) when served without re-ranking
+        ivf_index.make_direct_map()
+    return index
+
+class RerankedIndex:
+    """
+    Serve a compressed index with exact re-ranking: search `k * k_factor` candidates in the compressed index,
+    then rank them by their exact distance to the query using the raw frame embeddings.
+
+    The wrapper exposes what the search code uses of a FAISS index (`search`, `reconstruct_batch`, `ntotal`,
+    `d`, `metric_type`), so it can be published in the index registry in place of the index.
+
+    Args:
+        index (faiss.Index): The compressed index; its ids must be the database indices.
+        encoded_frames (EmbeddingStore): The raw frame embeddings.
+        k_factor (int): The number of candidates re-ranked per requested result (default is 4).
+    """
+
+    def __init__(self, index, encoded_frames, k_factor=4):
+        self.index = index
+        self.encoded_frames = encoded_frames
+        self.k_factor = k_factor
+
+    @property
+    def ntotal(self):
+        return self.index.ntotal
+
+    @property
+    def d(self):
+        return self.index.d
+
+    @property
+    def metric_type(self):
+        return self.index.metric_type
+
+    def reconstruct_batch(self, ids):
+        return np.ascontiguousarray(self.encoded_frames[np.asarray(ids, dtype=np.int64)].cpu().numpy(),
+                                    dtype=np.float32)
+
+    def search(self, x, k, params=None):
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        # Search parameters sized for the candidate count, keeping the id selector of filtered searches
+        k_candidates = k * self.k_factor
+        params = hnsw_search_parameters(self.index, k_candidates, selector=params.sel if params is not None else None)
+        _, candidates = self.index.search(x, k_candidates, params=params)
+
+        inner_product = self.metric_type == faiss.METRIC_INNER_PRODUCT
+        distances = np.full((len(x), k), -np.inf if inner_product else np.inf, dtype=np.float32)
+        indices = np.full((len(x), k), -1, dtype=np.int64)
+        for row, (query, row_candidates) in enumerate(zip(x, candidates)):
+            row_candidates = row_candidates[row_candidates != -1]
+            if not len(row_candidates):
+                continue
+            vectors = self.reconstruct_batch(row_candidates)
+            if inner_product:
+                exact = vectors @ query
+                order = np.argsort(-exact, kind='stable')[:k]
+            else:
+                exact = ((vectors - query) ** 2).sum(axis=1)
+                order = np.argsort(exact, kind='stable')[:k]
+            distances[row, :len(order)] = exact[order]
+            indices[row, :len(order)] = row_candidates[order]
+        return distances, indices
+
+def compare_indexes(indexes, encoded_frames, k_nums=100, n_queries=200, seed=0):
+    """
+    Compare indexes built over the same frames: file size, build time, recall@k against exact search and
+    single-query latency.
+
+    Args:
+        indexes (dict): name -> {'index': index, 'path': index file or None, 'build_time': seconds or None}.
+        encoded_frames (EmbeddingStore): The encoded frames; queries are sampled from them.
+        k_nums (int): The number of neighbors (default is 100).
+        n_queries (int): The number of sampled query frames (default is 200).
+        seed (int): The seed of the query sample (default is 0).
+
+    Returns:
+        list: One dict per index with size_mb, build_time, recall, p50_ms, p99_ms and mean_ms.
+    """
+
+    rng = np.random.default_rng(seed)
+    query_indices = rng.choice(len(encoded_frames), size=min(n_queries, len(encoded_frames)), replace=False)
+    query_vectors = np.ascontiguousarray(encoded_frames[query_indices].cpu().numpy(), dtype=np.float32)
+    metric_type = next(iter(indexes.values()))['index'].metric_type
+    exact_indices = exact_neighbors(encoded_frames, query_vectors, k_nums, metric_type)
+
+    report = []
+    for name, entry in indexes.items():
+        latencies = []
+        recalls = []
+        for query_vector, exact in zip(query_vectors, exact_indices):
+            start_time = time.perf_counter()
+            _, indices = k_image_search(query_vector[None, :], entry['index'], 'cpu', k_nums=k_nums)
+            latencies.append((time.perf_counter() - start_time) * 1000)
+            recalls.append(len(set(indices) & set(exact.tolist())) / k_nums)
+        path = entry.get('path')
+        report.append({'name': name,
+                       'size_mb': os.path.getsize(path) / (1024 ** 2) if path and os.path.exists(path) else None,
+                       'build_time': entry.get('build_time'),
+                       'recall': float(np.mean(recalls)),
+                       'p50_ms': float(np.percentile(latencies, 50)),
+                       'p99_ms': float(np.percentile(latencies, 99)),
+                       'mean_ms': float(np.mean(latencies))})
+        logger.info(f"{name}: recall@{k_nums}={report[-1]['recall']:.4f}, p50={report[-1]['p50_ms']:.3f} ms")
+    return report
+
+def print_comparison(report, k_nums):
+    print(f"{'index':<22} {'size MB':>9} {'build s':>9} {f'recall@{k_nums}':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for row in report:
+        size = f"{row['size_mb']:.1f}" if row['size_mb'] is not None else '-'
+        build_time = f"{row['build_time']:.1f}" if row['build_time'] is not None else '-'
+        print(f"{row['name']:<22} {size:>9} {build_time:>9} {row['recall']:>10.4f} "
+              f"{row['p50_ms']:>8.3f} {row['p99_ms']:>8.3f}")
+
+if __name__ == "__main__":
+    from database.db_init import load_encoded_frames
+    from database.index_registry import FAISS_DATABASES, read_faiss_index
+
+    parser = argparse.ArgumentParser(description="Build compressed (SQ8 / IVF-PQ) variants of an HNSW database "
+                                                 "from the encoded frames and compare them with it.")
+    parser.add_argument('--database_name', default='CLIP_v0',
+                        help="The HNSW database to replace; it must be built from the encoded frames.")
+    parser.add_argument('--kinds', nargs='+', default=['sq8', 'ivfpq'], choices=['sq8', 'ivfpq'])
+    parser.add_argument('--pq_m', type=int, default=64)
+    parser.add_argument('--nprobe', type=int, default=32)
+    parser.add_argument('--k_factor', type=int, default=4, help="Candidates per result of the re-ranked variants.")
+    parser.add_argument('--k', type=int, default=100)
+    parser.add_argument('--n_queries', type=int, default=200)
+    parser.add_argument('--num_threads', type=int, default=None)
+    parser.add_argument('--report', default='database/compressed_index_report.json')
+    args = parser.parse_args()
+
+    if args.num_threads:
+        faiss.omp_set_num_threads(args.num_threads)
+    encoded_frames = load_encoded_frames('cpu')
+    hnsw_path = FAISS_DATABASES[args.database_name]
+    hnsw_index = read_faiss_index(hnsw_path)
+    indexes = {args.database_name: {'index': hnsw_index, 'path': hnsw_path, 'build_time': None}}
+
+    for name, (database_name, kind, index_path) in COMPRESSED_FAISS_DATABASES.items():
+        if database_name != args.database_name or kind not in args.kinds:
+            continue
+        start_time = time.time()
+        index = build_compressed_index(encoded_frames, kind, hnsw_index.metric_type,
+                                       pq_m=args.pq_m, nprobe=args.nprobe)
+        build_time = time.time() - start_time
+        faiss.write_index(index, index_path)
+        logger.info(f"Wrote {index_path} in {build_time:.1f}s")
+        indexes[name] = {'index': index, 'path': index_path, 'build_time': build_time}
+        indexes[f"{name}+rerank"] = {'index': RerankedIndex(index, encoded_frames, args.k_factor),
+                                     'path': index_path, 'build_time': build_time}
+
+    report = compare_indexes(indexes, encoded_frames, k_nums=args.k, n_queries=args.n_queries)
+    print_comparison(report, args.k)
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
@@ -1,9 +1,22 @@
+import os
 import json
 import torch
 
 import faiss
 import multiprocessing
 import pickle
+from database.grafa_store import GrafaGraph, load_grafa_pickle
+from database.annotation_store import AnnotationStore
+from database.embedding_store import EmbeddingStore
+from database.frame_knn_store import FrameKnnStore
+from database.hashtag_postings import HashtagPostings
+from database.string_table import StringTable
+from tools.lexical_hashtag_matcher import LexicalHashtagMatcher
+from tools.hashtag_suggester import HashtagSuggester
+from database.index_registry import FAISS_DATABASES, read_faiss_index
+from database.compressed_index import COMPRESSED_FAISS_DATABASES, RerankedIndex
+from database.sharded_index import SHARDED_FAISS_DATABASES
+from database.generation import GENERATION_MANIFEST, read_generation, generation_path
 
 # Configure logging to output to the notebook
 import logging
@@ -11,23 +24,50 @@ logging.basicConfig()
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-def load_grafa_database(grafa_path = 'database/graph_data_full.pkl'):
-    with open(grafa_path, 'rb') as f:
-        data = pickle.load(f)
-        G = data['G']
-        sparse_matrix = data['sparse_matrix']
-        node_mapping = data['node_mapping']
-        reverse_node_mapping = data['reverse_node_mapping']
-        logger.info(f"Load GRAFA database {grafa_path}: DONE!")
-    return G, sparse_matrix, node_mapping, reverse_node_mapping
-
-def load_hashtag_embeddings(hashtag_embeddings_path = 'database/hashtag_embeddings.pkl'):
+def load_grafa_database(grafa_path = 'database/graph_data_full.pkl',
+                        grafa_dir = 'database/grafa_csr',
+                        manifest_path = GENERATION_MANIFEST):
+    grafa_dir = generation_path('grafa', grafa_dir, manifest_path)
+    if os.path.exists(os.path.join(grafa_dir, 'grafa_meta.json')):
+        grafa = GrafaGraph.load(grafa_dir)
+        logger.info(f"Load GRAFA database {grafa_dir} (memory-mapped CSR): DONE!")
+        return grafa
+    # Fall back to the legacy pickle and convert it in memory
+    logger.info(f"{grafa_dir} not found, run `python -m database.grafa_store` to avoid unpickling {grafa_path}")
+    G, sparse_matrix, node_mapping, reverse_node_mapping = load_grafa_pickle(grafa_path)
+    grafa = GrafaGraph.from_networkx(sparse_matrix, node_mapping, reverse_node_mapping, G)
+    logger.info(f"Load GRAFA database {grafa_path}: DONE!")
+    return grafa
+
+def load_hashtag_embeddings(hashtag_embeddings_path = 'database/hashtag_embeddings.pkl',
+                            manifest_path = GENERATION_MANIFEST):
+    hashtag_embeddings_path = generation_path('hashtag_embeddings', hashtag_embeddings_path, manifest_path)
     with open(hashtag_embeddings_path, 'rb') as f:
         hashtag_embeddings = pickle.load(f)
     logger.info(f"Load hashtag embeddings {hashtag_embeddings_path}: DONE!")
     return hashtag_embeddings
 
-def load_hashtag_embedding_bin(hashtag_embedding_bin_path = 'database/hashtag_embeddings.bin'):
+def build_hashtag_vocabulary(hashtag_embeddings):
+    # Row i of the hashtag embedding index is the i-th hashtag of the embeddings dict
+    hashtag_vocabulary = StringTable.from_strings(list(hashtag_embeddings.keys()))
+    logger.info(f"Build hashtag vocabulary ({len(hashtag_vocabulary)} hashtags): DONE!")
+    return hashtag_vocabulary
+
+def build_hashtag_matcher(hashtag_vocabulary):
+    # Typos and plurals of vocabulary hashtags are matched by spelling instead of a CLIP forward pass
+    hashtag_matcher = LexicalHashtagMatcher(hashtag_vocabulary, n=3, threshold=0.8)
+    logger.info(f"Build lexical hashtag matcher ({len(hashtag_matcher)} hashtags): DONE!")
+    return hashtag_matcher
+
+def build_hashtag_suggester(hashtag_vocabulary, grafa):
+    # Hashtag autocomplete, ranked by the number of keyframes carrying each hashtag
+    hashtag_suggester = HashtagSuggester(hashtag_vocabulary, grafa)
+    logger.info(f"Build hashtag suggester ({len(hashtag_suggester)} hashtags): DONE!")
+    return hashtag_suggester
+
+def load_hashtag_embedding_bin(hashtag_embedding_bin_path = 'database/hashtag_embeddings.bin',
+                               manifest_path = GENERATION_MANIFEST):
+    hashtag_embedding_bin_path = generation_path('hashtag_embedding_index', hashtag_embedding_bin_path, manifest_path)
     num_threads = multiprocessing.cpu_count()
     logger.info(f"Number of threads: {num_threads}")
     faiss.omp_set_num_threads(num_threads)
@@ -35,30 +75,109 @@ def load_hashtag_embedding_bin(hashtag_embedding_bin_path = 'database/hashtag_em
     logger.info(f"The IndexFlatL2 index {hashtag_embedding_bin_path} is ready!!!")
     return hashtag_embedding_index
 
-def load_annotation(image_info_dict_path = 'database/index_caption_hashtag_dict_v2.json'):
+def load_annotation(image_info_dict_path = 'database/index_caption_hashtag_dict_v2.json',
+                    annotation_dir = 'database/annotation',
+                    manifest_path = GENERATION_MANIFEST):
+    annotation_dir = generation_path('annotation', annotation_dir, manifest_path)
+    if os.path.exists(os.path.join(annotation_dir, 'annotation_meta.json')):
+        image_info_dict = AnnotationStore.load(annotation_dir)
+        logger.info(f"Load annotation {annotation_dir} (memory-mapped columns): DONE!")
+        return image_info_dict
+    # Fall back to the JSON annotations and convert them in memory
+    logger.info(f"{annotation_dir} not found, run `python -m database.annotation_store` to avoid parsing {image_info_dict_path}")
     with open(image_info_dict_path, 'r') as openfile:
-        image_info_dict = json.load(openfile)
+        image_info_dict = AnnotationStore.from_dict(json.load(openfile))
     logger.info(f"Load annotation {image_info_dict_path}: DONE!")
     return image_info_dict
 
-def load_encoded_frames(device, encoded_frames_path = 'database/encoded_frames.pt'):
+def load_encoded_frames(device, encoded_frames_path = 'database/encoded_frames.pt',
+                        embeddings_dir = 'database/encoded_frames',
+                        manifest_path = GENERATION_MANIFEST):
+    generation = read_generation(manifest_path)
+    if generation is not None:
+        # Ingested frames are appended to the raw buffer; map the rows of the current generation only
+        embeddings_dir = generation['paths'].get('encoded_frames', embeddings_dir)
+        encoded_frames = EmbeddingStore.load(embeddings_dir, device, count=generation['n_frames'])
+        logger.info(f"Load encoded frames {embeddings_dir} (generation {generation['generation']}): DONE!")
+        return encoded_frames
+    if os.path.exists(os.path.join(embeddings_dir, 'meta.json')):
+        encoded_frames = EmbeddingStore.load(embeddings_dir, device)
+        logger.info(f"Load encoded frames {embeddings_dir} (memory-mapped {encoded_frames.dtype}): DONE!")
+        return encoded_frames
+    # Fall back to the torch file, which is deserialized into RAM
+    logger.info(f"{embeddings_dir} not found, run `python -m database.embedding_store` to memory-map {encoded_frames_path}")
     encoded_frames = torch.load(encoded_frames_path, 
-                                map_location=device, 
+                                map_location='cpu', 
                                 weights_only=True)
     logger.info(f"Load encoded frames {encoded_frames_path}: DONE!")
-    return encoded_frames
+    return EmbeddingStore.from_tensor(encoded_frames, device)
+
+def load_frame_knn(frame_knn_dir = 'database/frame_knn'):
+    if not os.path.exists(os.path.join(frame_knn_dir, 'frame_knn_meta.json')):
+        # Optional: "more like this" searches fall back to live HNSW queries
+        logger.info(f"{frame_knn_dir} not found, run `python -m database.frame_knn_store` to precompute frame neighbors")
+        return None
+    frame_knn = FrameKnnStore.load(frame_knn_dir)
+    logger.info(f"Load frame kNN {frame_knn_dir} ({len(frame_knn)} x {frame_knn.n_neighbors}): DONE!")
+    return frame_knn
+
+def load_hashtag_postings(postings_dir = 'database/hashtag_postings'):
+    if not os.path.exists(os.path.join(postings_dir, 'postings_meta.json')):
+        # Optional: hashtag-only queries fall back to traversing the graph
+        logger.info(f"{postings_dir} not found, run `python -m database.hashtag_postings` to precompute hashtag postings")
+        return None
+    hashtag_postings = HashtagPostings.load(postings_dir)
+    logger.info(f"Load hashtag postings {postings_dir} ({len(hashtag_postings)} hashtags, top {hashtag_postings.top_m}): DONE!")
+    return hashtag_postings
 
-def faiss_database_processing(database_name):
+def faiss_database_processing(database_name, encoded_frames=None):
     num_threads = multiprocessing.cpu_count()
     logger.info(f"Number of threads: {num_threads}")
-    if database_name == 'CLIP_v0':
-        database_path = 'database/merged_index_hnsw_baseline_v0.bin'
-    elif database_name == 'CLIP_v2':
-        database_path = 'database/merged_index_hnsw_baseline_v2.bin'
-    else:
-        raise ValueError("Unsupported database name. Choose 'CLIP_v0' or 'CLIP_v2'.")
+    databases = dict(FAISS_DATABASES)
+    databases.update({name: index_path for name, (_, _, index_path) in COMPRESSED_FAISS_DATABASES.items()})
+    databases.update({name: shard_dir for name, (_, shard_dir) in SHARDED_FAISS_DATABASES.items()})
+    if database_name not in databases:
+        raise ValueError(f"Unsupported database name. Choose one of {sorted(databases)}.")
+    database_path = databases[database_name]
     logger.info(f"Load database {database_name}: DONE!")
     faiss.omp_set_num_threads(num_threads)
-    index_hnsw = faiss.read_index(database_path, faiss.IO_FLAG_MMAP)
+    index_hnsw = read_faiss_index(database_path)
+    if encoded_frames is not None and database_name in COMPRESSED_FAISS_DATABASES:
+        # Re-rank the candidates of the compressed index with the raw embeddings
+        index_hnsw = RerankedIndex(index_hnsw, encoded_frames)
     logger.info(f"The HNSW index for {database_name} is ready!!!")
-    return index_hnsw
\ No newline at end of file
+    return index_hnsw
+
+def load_generation(state, index_registry, manifest_path = GENERATION_MANIFEST):
+    """
+    Load every artifact of the current generation and publish it on `state` without a restart.
+
+    All artifacts are loaded before anything is published. The frame data (embeddings, annotations, graph and
+    hashtag embeddings) is published before the indexes are swapped: an ingestion only appends frames, so queries
+    in flight on the old indexes only return frames that the new data also holds.
+
+    Returns:
+        dict: The manifest of the loaded generation.
+    """
+
+    generation = read_generation(manifest_path)
+    if generation is None:
+        raise ValueError(f"No generation has been published in {manifest_path}.")
+    loaded = {'encoded_frames': load_encoded_frames(state.device, manifest_path=manifest_path),
+              'image_info_dict': load_annotation(manifest_path=manifest_path),
+              'grafa': load_grafa_database(manifest_path=manifest_path),
+              'hashtag_embeddings': load_hashtag_embeddings(manifest_path=manifest_path),
+              'hashtag_embedding_index': load_hashtag_embedding_bin(manifest_path=manifest_path)}
+    loaded['hashtag_vocabulary'] = build_hashtag_vocabulary(loaded['hashtag_embeddings'])
+    loaded['hashtag_matcher'] = build_hashtag_matcher(loaded['hashtag_vocabulary'])
+    loaded['hashtag_suggester'] = build_hashtag_suggester(loaded['hashtag_vocabulary'], loaded['grafa'])
+    indexes = {database_name: index_path for database_name, index_path in generation['indexes'].items()
+               if database_name in index_registry}
+    prepared = index_registry.prepare(indexes, rerank_frames=loaded['encoded_frames'])
+
+    for name, value in loaded.items():
+        setattr(state, name, value)
+    index_registry.publish(prepared)
+    state.generation = generation
+    logger.info(f"Generation {generation['generation']} is live ({generation['n_frames']} frames)")
+    return generation
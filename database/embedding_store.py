@@ -0,0 +1,164 @@
+# database/embedding_store.py
+import os
+import json
+import argparse
+import numpy as np
+import torch
+
+# Configure logging to output to the notebook
+import logging
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+EMBEDDING_FORMAT_VERSION = 1
+
+class EmbeddingStore:
+    """
+    Frame embeddings backed by a memory-mapped raw buffer, replacing the in-RAM `encoded_frames.pt` tensor.
+
+    Files in the embeddings directory:
+        embeddings.raw: The row-major (count, dim) matrix, in float16 or float32.
+        meta.json: The dtype, dimension and row count.
+
+    The buffer is mapped read-only, so several uvicorn workers share one page-cache copy and startup does not
+    deserialize the matrix. Indexing the store (`store[idx]`, `store[list_of_idx]`, `store[tensor]`) reads only
+    the requested rows and returns them as a float32 torch tensor on the store's device, like indexing the
+    original tensor did.
+    """
+
+    def __init__(self, array, device='cpu'):
+        self.array = array
+        self.device = device
+
+    @property
+    def shape(self):
+        return self.array.shape
+
+    @property
+    def dtype(self):
+        return self.array.dtype
+
+    def __len__(self):
+        return self.array.shape[0]
+
+    def gather(self, indices):
+        """
+        Return the given rows as a float32 tensor on the store's device.
+
+        Args:
+            indices (int, slice, list, np.ndarray or torch.Tensor): The database indices of the rows.
+
+        Returns:
+            torch.Tensor: A (dim,) tensor for an integer index, a (n, dim) tensor otherwise.
+        """
+
+        if isinstance(indices, torch.Tensor):
+            indices = indices.cpu().numpy()
+        elif isinstance(indices, list):
+            indices = np.asarray(indices, dtype=np.int64)
+        # Only the requested rows are read from the mapping (and upcast when stored in float16)
+        rows = np.array(self.array[indices], dtype=np.float32)
+        return torch.from_numpy(rows).to(self.device)
+
+    __getitem__ = gather
+
+    @classmethod
+    def from_tensor(cls, tensor, device='cpu'):
+        """
+        Wrap an in-memory embedding tensor (e.g. loaded from `encoded_frames.pt`).
+        """
+
+        return cls(tensor.detach().cpu().numpy(), device)
+
+    def save(self, embeddings_dir, dtype='float16'):
+        os.makedirs(embeddings_dir, exist_ok=True)
+        np.ascontiguousarray(self.array, dtype=dtype).tofile(os.path.join(embeddings_dir, 'embeddings.raw'))
+        with open(os.path.join(embeddings_dir, 'meta.json'), 'w') as f:
+            json.dump({'format_version': EMBEDDING_FORMAT_VERSION,
+                       'dtype': dtype,
+                       'dim': int(self.shape[1]),
+                       'count': int(self.shape[0])}, f)
+
+    @classmethod
+    def load(cls, embeddings_dir, device='cpu', count=None):
+        """
+        Map the embeddings read-only.
+
+        Args:
+            embeddings_dir (str): The embeddings directory.
+            device (str): The device of the gathered rows (default is 'cpu').
+            count (int, optional): The number of rows to map, e.g. the row count of an ingestion generation
+                                   (default is the count in `meta.json`).
+        """
+
+        meta = read_embedding_meta(embeddings_dir)
+        array = np.memmap(os.path.join(embeddings_dir, 'embeddings.raw'),
+                          dtype=meta['dtype'], mode='r',
+                          shape=(meta['count'] if count is None else count, meta['dim']))
+        return cls(array, device)
+
+def read_embedding_meta(embeddings_dir):
+    with open(os.path.join(embeddings_dir, 'meta.json'), 'r') as f:
+        meta = json.load(f)
+    if meta['format_version'] != EMBEDDING_FORMAT_VERSION:
+        raise ValueError(f"Unsupported embedding format version {meta['format_version']} in {embeddings_dir}.")
+    return meta
+
+def append_embeddings(embeddings_dir, chunks, count):
+    """
+    Append rows to the raw buffer of an embedding store, after its first `count` rows.
+
+    The buffer is append-only: stores mapped on the first `count` rows (e.g. by a running server) are not
+    affected, and rows written after `count` by an ingestion that did not complete are overwritten. `meta.json`
+    is left unchanged; the new row count is published by the caller (see `database.ingest`).
+
+    Args:
+        embeddings_dir (str): The embeddings directory.
+        chunks (iterable): (n, dim) arrays of new rows, written one at a time.
+        count (int): The number of committed rows.
+
+    Returns:
+        int: The row count after the append.
+    """
+
+    meta = read_embedding_meta(embeddings_dir)
+    row_bytes = np.dtype(meta['dtype']).itemsize * meta['dim']
+    with open(os.path.join(embeddings_dir, 'embeddings.raw'), 'r+b') as f:
+        f.truncate(count * row_bytes)
+        f.seek(count * row_bytes)
+        for chunk in chunks:
+            chunk = np.ascontiguousarray(chunk, dtype=meta['dtype'])
+            if chunk.ndim != 2 or chunk.shape[1] != meta['dim']:
+                raise ValueError(f"Expected rows of dimension {meta['dim']}, got shape {chunk.shape}.")
+            f.write(chunk.tobytes())
+            count += len(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+    return count
+
+def convert_encoded_frames(encoded_frames_path='database/encoded_frames.pt',
+                           embeddings_dir='database/encoded_frames',
+                           dtype='float16'):
+    """
+    One-time conversion of `encoded_frames.pt` into the memory-mappable raw buffer.
+
+    Args:
+        encoded_frames_path (str): The path of the torch tensor file.
+        embeddings_dir (str): The output directory.
+        dtype (str): 'float16' (half the size; CLIP embeddings lose no meaningful precision) or 'float32'.
+    """
+
+    encoded_frames = torch.load(encoded_frames_path, map_location='cpu', weights_only=True)
+    store = EmbeddingStore.from_tensor(encoded_frames)
+    store.save(embeddings_dir, dtype=dtype)
+    logger.info(f"Converted {encoded_frames_path} to {embeddings_dir}: {store.shape} as {dtype}")
+    return store
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert encoded_frames.pt into a memory-mapped embedding store.")
+    parser.add_argument('--encoded_frames_path', default='database/encoded_frames.pt')
+    parser.add_argument('--embeddings_dir', default='database/encoded_frames')
+    parser.add_argument('--dtype', default='float16', choices=['float16', 'float32'])
+    args = parser.parse_args()
+    convert_encoded_frames(args.encoded_frames_path, args.embeddings_dir, args.dtype)
@@ -0,0 +1,188 @@
+# database/frame_knn_store.py
+import os
+import json
+import time
+import argparse
+import numpy as np
+
+# Configure logging to output to the notebook
+import logging
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+FRAME_KNN_FORMAT_VERSION = 1
+
+class FrameKnnStore:
+    """
+    Precomputed top-N neighbors of every encoded frame in a FAISS index, so that "more like this" searches and
+    refinement exploration are a row lookup instead of an HNSW query.
+
+    Files in the frame kNN directory:
+        frame_knn_indices.npy: (count, n_neighbors) int32 neighbor indices, nearest first (-1 for missing).
+        frame_knn_distances.npy: (count, n_neighbors) distances returned by the index, rounded to float16.
+        frame_knn_meta.json: The database name, metric, neighbor count, and the size and source file (real path,
+                             size and modification time) of the index it was built on.
+
+    Both matrices are memory-mapped read-only. The indices of row `i` are those returned by
+    `k_image_search(encoded_frames[i], index, k_nums=n_neighbors)` when the store was built, and the distances
+    are its distances rounded to float16. A lookup for k <= n_neighbors takes the first k columns of the row: the
+    search ran with the efSearch of k=n_neighbors, so the prefix can differ slightly from a live search with k.
+    """
+
+    def __init__(self, indices, distances, database_name=None, ntotal=None, source=None):
+        self.indices = indices
+        self.distances = distances
+        self.database_name = database_name
+        self.ntotal = len(indices) if ntotal is None else ntotal
+        self.source = source
+
+    def __len__(self):
+        return self.indices.shape[0]
+
+    @property
+    def n_neighbors(self):
+        return self.indices.shape[1]
+
+    def matches(self, index_hnsw, database_path=None):
+        """
+        Whether the store was built on this index: an index of the same size (it is stale after frames are added)
+        and, when `database_path` is given, the same index file (it is stale after the index is rebuilt or
+        replaced by another file, even of the same size). Stores without a recorded source only compare sizes.
+        """
+
+        if self.ntotal != index_hnsw.ntotal:
+            return False
+        if database_path is None or self.source is None:
+            return True
+        try:
+            return index_source(database_path) == self.source
+        except OSError:
+            return False
+
+    def covers(self, db_idx, k_nums):
+        """
+        Whether the neighbors of a frame were precomputed for at least `k_nums` results.
+        """
+
+        return 0 <= db_idx < len(self) and k_nums <= self.n_neighbors
+
+    def neighbors(self, db_idx, k_nums):
+        """
+        Look up the nearest frames of a frame.
+
+        Returns:
+            tuple: The valid distances (float32 array) and valid indices (list), like `k_image_search`.
+        """
+
+        row_indices = np.asarray(self.indices[db_idx, :k_nums], dtype=np.int64)
+        valid_indexs = [idx for idx in row_indices if idx != -1]
+        valid_distances = np.asarray(self.distances[db_idx, :len(valid_indexs)], dtype=np.float32)
+        return valid_distances, valid_indexs
+
+    def save(self, frame_knn_dir, database_name=None, metric_type=None):
+        os.makedirs(frame_knn_dir, exist_ok=True)
+        np.save(os.path.join(frame_knn_dir, 'frame_knn_indices.npy'), np.asarray(self.indices, dtype=np.int32))
+        np.save(os.path.join(frame_knn_dir, 'frame_knn_distances.npy'), np.asarray(self.distances, dtype=np.float16))
+        write_frame_knn_meta(frame_knn_dir, database_name or self.database_name, self.ntotal, len(self),
+                             self.n_neighbors, metric_type, self.source)
+
+    @classmethod
+    def load(cls, frame_knn_dir, mmap_mode='r'):
+        with open(os.path.join(frame_knn_dir, 'frame_knn_meta.json'), 'r') as f:
+            meta = json.load(f)
+        if meta['format_version'] != FRAME_KNN_FORMAT_VERSION:
+            raise ValueError(f"Unsupported frame kNN format version {meta['format_version']} in {frame_knn_dir}.")
+        indices = np.load(os.path.join(frame_knn_dir, 'frame_knn_indices.npy'), mmap_mode=mmap_mode)
+        distances = np.load(os.path.join(frame_knn_dir, 'frame_knn_distances.npy'), mmap_mode=mmap_mode)
+        return cls(indices, distances, meta['database_name'], meta['ntotal'], meta.get('source'))
+
+def index_source(database_path):
+    """
+    Identify an index file by its real path, size and modification time.
+    """
+
+    stat = os.stat(database_path)
+    return {'path': os.path.realpath(database_path), 'size': int(stat.st_size), 'mtime': stat.st_mtime}
+
+def write_frame_knn_meta(frame_knn_dir, database_name, ntotal, count, n_neighbors, metric_type=None, source=None):
+    with open(os.path.join(frame_knn_dir, 'frame_knn_meta.json'), 'w') as f:
+        json.dump({'format_version': FRAME_KNN_FORMAT_VERSION,
+                   'database_name': database_name,
+                   'metric_type': metric_type,
+                   'ntotal': int(ntotal),
+                   'count': int(count),
+                   'n_neighbors': int(n_neighbors),
+                   'source': source}, f)
+
+def build_frame_knn(encoded_frames, index_hnsw, frame_knn_dir,
+                    database_name='CLIP_v0', n_neighbors=100, chunk_size=4096, database_path=None):
+    """
+    Compute the top-N neighbors of every encoded frame and write them to a frame kNN directory.
+
+    Args:
+        encoded_frames (EmbeddingStore): The encoded frames (the queries of "more like this" searches).
+        index_hnsw (faiss.Index): The index searched at query time (the frames must be its vectors).
+        frame_knn_dir (str): The output directory.
+        database_name (str): The name of the index, recorded in the metadata (default is 'CLIP_v0').
+        n_neighbors (int): The number of neighbors kept per frame (default is 100).
+        chunk_size (int): The number of frames searched per FAISS call; FAISS spreads each call over its
+                          OpenMP threads (default is 4096).
+        database_path (str, optional): The file of the index, recorded so that the store is detected as stale
+                                       when the served index is replaced (default is None: size check only).
+
+    Returns:
+        FrameKnnStore: The memory-mapped store.
+    """
+
+    from tools.faiss_retrieval import k_image_search_batch
+
+    os.makedirs(frame_knn_dir, exist_ok=True)
+    count = len(encoded_frames)
+    # Write straight into the output files so the matrices never need to fit in RAM
+    indices = np.lib.format.open_memmap(os.path.join(frame_knn_dir, 'frame_knn_indices.npy'), mode='w+',
+                                        dtype=np.int32, shape=(count, n_neighbors))
+    distances = np.lib.format.open_memmap(os.path.join(frame_knn_dir, 'frame_knn_distances.npy'), mode='w+',
+                                          dtype=np.float16, shape=(count, n_neighbors))
+
+    start_time = time.time()
+    for start in range(0, count, chunk_size):
+        chunk_distances, chunk_indices = k_image_search_batch(encoded_frames[start:start + chunk_size],
+                                                              index_hnsw, 'cpu', k_nums=n_neighbors)
+        indices[start:start + len(chunk_indices)] = -1
+        distances[start:start + len(chunk_indices)] = 0
+        for row, (row_distances, row_indices) in enumerate(zip(chunk_distances, chunk_indices)):
+            indices[start + row, :len(row_indices)] = row_indices
+            distances[start + row, :len(row_indices)] = row_distances
+        logger.info(f"Frame kNN: {min(start + chunk_size, count)}/{count} frames ({time.time() - start_time:.1f}s)")
+
+    indices.flush()
+    distances.flush()
+    del indices, distances
+    write_frame_knn_meta(frame_knn_dir, database_name, index_hnsw.ntotal, count, n_neighbors,
+                         int(index_hnsw.metric_type), index_source(database_path) if database_path else None)
+    logger.info(f"Built {frame_knn_dir}: {count} frames x {n_neighbors} neighbors of {database_name}")
+    return FrameKnnStore.load(frame_knn_dir)
+
+if __name__ == "__main__":
+    import faiss
+    from database.db_init import load_encoded_frames
+    from database.index_registry import default_databases, read_faiss_index
+
+    parser = argparse.ArgumentParser(description="Precompute the top-N neighbors of every encoded frame.")
+    parser.add_argument('--database_name', default='CLIP_v0')
+    parser.add_argument('--database_path', default=None)
+    parser.add_argument('--frame_knn_dir', default='database/frame_knn')
+    parser.add_argument('--n_neighbors', type=int, default=100)
+    parser.add_argument('--chunk_size', type=int, default=4096)
+    parser.add_argument('--num_threads', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.num_threads:
+        faiss.omp_set_num_threads(args.num_threads)
+    database_path = args.database_path or default_databases()[args.database_name]
+    index_hnsw = read_faiss_index(database_path)
+    encoded_frames = load_encoded_frames('cpu')
+    build_frame_knn(encoded_frames, index_hnsw, args.frame_knn_dir,
+                    database_name=args.database_name, n_neighbors=args.n_neighbors, chunk_size=args.chunk_size,
+                    database_path=database_path)
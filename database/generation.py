@@ -0,0 +1,67 @@
+# database/generation.py
+import os
+import json
+import time
+
+# Configure logging to output to the notebook
+import logging
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+GENERATION_FORMAT_VERSION = 1
+
+# The manifest naming the artifacts of the current generation (absent before the first ingestion)
+GENERATION_MANIFEST = 'database/generation.json'
+
+# Where each generation writes its new artifacts
+GENERATIONS_DIR = 'database/generations'
+
+def read_generation(manifest_path=GENERATION_MANIFEST):
+    """
+    Read the generation manifest.
+
+    The manifest holds the generation number, the frame count and the path of every artifact that was
+    rewritten by an ingestion:
+        {'format_version': 1, 'generation': 3, 'created_at': ..., 'n_frames': 220504,
+         'paths': {'encoded_frames': ..., 'annotation': ..., 'grafa': ...,
+                   'hashtag_embeddings': ..., 'hashtag_embedding_index': ...},
+         'indexes': {'CLIP_v0': ..., 'CLIP_v2': ...}}
+
+    Returns:
+        dict: The manifest, or None when no generation has been ingested yet.
+    """
+
+    if manifest_path is None or not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, 'r') as f:
+        manifest = json.load(f)
+    if manifest['format_version'] != GENERATION_FORMAT_VERSION:
+        raise ValueError(f"Unsupported generation format version {manifest['format_version']} in {manifest_path}.")
+    return manifest
+
+def write_generation(manifest, manifest_path=GENERATION_MANIFEST):
+    """
+    Publish a generation: the manifest is written to a temporary file and renamed over the current one,
+    so readers see either the previous generation or the new one, never a partial manifest.
+    """
+
+    manifest = dict(manifest, format_version=GENERATION_FORMAT_VERSION, created_at=time.time())
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, manifest_path)
+    logger.info(f"Published generation {manifest['generation']} ({manifest['n_frames']} frames) in {manifest_path}")
+    return manifest
+
+def generation_path(artifact, default_path, manifest_path=GENERATION_MANIFEST):
+    """
+    The path of an artifact in the current generation, or `default_path` if no ingestion has rewritten it.
+    """
+
+    manifest = read_generation(manifest_path)
+    if manifest is None:
+        return default_path
+    return manifest['paths'].get(artifact, default_path)
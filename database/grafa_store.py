@@ -0,0 +1,303 @@
+# database/grafa_store.py
+import os
+import json
+import pickle
+import argparse
+import numpy as np
+
+from database.string_table import StringTable
+
+# Configure logging to output to the notebook
+import logging
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Node label codes stored in `node_labels.npy`
+LABEL_UNMAPPED = -1  # The matrix index has no entry in `reverse_node_mapping`
+LABEL_HASHTAG = 0
+LABEL_KEYFRAME = 1
+
+GRAFA_FORMAT_VERSION = 1
+
+class GrafaGraph:
+    """
+    The GRAFA hashtag/keyframe graph in a native CSR layout.
+
+    Files in the graph directory (all `.npy`, memory-mapped read-only on load so that worker processes share
+    the page cache instead of each unpickling its own copy):
+        indptr, indices, data: The CSR adjacency; `data` holds the edge weights of the networkx graph.
+        node_labels: One int8 label code per node (LABEL_HASHTAG, LABEL_KEYFRAME or LABEL_UNMAPPED).
+        keyframe_ids: The database index of each keyframe node (-1 for other nodes).
+        node_names_*: A string table mapping node ids to names, with a sorted order for name -> id lookups.
+        grafa_meta.json: The matrix shape and the format version.
+    """
+
+    def __init__(self, indptr, indices, data, node_labels, keyframe_ids, node_names, shape):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.node_labels = node_labels
+        self.keyframe_ids = keyframe_ids
+        self.node_names = node_names
+        self.shape = tuple(shape)
+        self._keyframe_degrees = None
+
+    def __len__(self):
+        return len(self.node_labels)
+
+    def node_id(self, name):
+        """
+        Return the node id of `name`, or -1 if it is not in the graph.
+        """
+
+        return self.node_names.find(name)
+
+    def node_name(self, node_idx):
+        return self.node_names[node_idx]
+
+    def neighbors(self, node_idx):
+        """
+        Return the neighbor ids and edge weights of a node, in the order of the original sparse matrix row.
+        """
+
+        start, end = self.indptr[node_idx], self.indptr[node_idx + 1]
+        return self.indices[start:end], self.data[start:end]
+
+    def weight(self, node_idx, neighbor_idx):
+        """
+        Return the weight of the edge between two nodes (0.0 if there is none).
+        """
+
+        neighbors, weights = self.neighbors(node_idx)
+        position = np.flatnonzero(neighbors == neighbor_idx)
+        return float(weights[position[0]]) if len(position) else 0.0
+
+    def is_keyframe(self, node_idx):
+        return self.node_labels[node_idx] == LABEL_KEYFRAME
+
+    def degrees(self):
+        return np.diff(self.indptr)
+
+    def keyframe_degrees(self):
+        """
+        Return the number of keyframe entries in each matrix row (computed once).
+        """
+
+        if self._keyframe_degrees is None:
+            is_keyframe = np.asarray(self.node_labels)[np.asarray(self.indices)] == LABEL_KEYFRAME
+            rows = np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+            self._keyframe_degrees = np.bincount(rows[is_keyframe], minlength=self.shape[0])
+        return self._keyframe_degrees
+
+    @classmethod
+    def from_networkx(cls, sparse_matrix, node_mapping, reverse_node_mapping, G):
+        """
+        Convert the pickled GRAFA objects (networkx graph, scipy matrix and mappings) into a GrafaGraph.
+
+        Args:
+            sparse_matrix (scipy.sparse.spmatrix): The hashtag co-occurrence matrix.
+            node_mapping (dict): Maps node names to matrix indices.
+            reverse_node_mapping (dict): Maps matrix indices back to node names.
+            G (networkx.Graph): The graph holding the edge weights and node labels.
+
+        Returns:
+            GrafaGraph: The in-memory graph.
+
+        Process:
+            1. Keep the explicit non-zero entries of each matrix row in their stored order, so that traversals
+               visit neighbors in the same order as `sparse_matrix[idx].nonzero()`.
+            2. Take each edge weight from `G`, falling back to the matrix value when `G` has no such edge.
+            3. Record the label, the name and, for keyframes, the database index (`int(node[0])`) of every node.
+        """
+
+        csr = sparse_matrix.tocsr()
+        n_nodes = max(csr.shape[0], csr.shape[1], len(node_mapping))
+
+        indptr = np.zeros(csr.shape[0] + 1, dtype=np.int64)
+        indices = []
+        data = []
+        for row in range(csr.shape[0]):
+            start, end = csr.indptr[row], csr.indptr[row + 1]
+            row_name = reverse_node_mapping.get(row, None)
+            for col, value in zip(csr.indices[start:end], csr.data[start:end]):
+                if value == 0:
+                    continue
+                col_name = reverse_node_mapping.get(int(col), None)
+                if row_name is not None and col_name is not None and G.has_edge(row_name, col_name):
+                    value = G[row_name][col_name]['weight']
+                indices.append(col)
+                data.append(value)
+            indptr[row + 1] = len(indices)
+
+        node_labels = np.full(n_nodes, LABEL_UNMAPPED, dtype=np.int8)
+        keyframe_ids = np.full(n_nodes, -1, dtype=np.int64)
+        names = [''] * n_nodes
+        for node_idx in range(n_nodes):
+            node = reverse_node_mapping.get(node_idx, None)
+            if node is None:
+                continue
+            names[node_idx] = node if isinstance(node, str) else str(node)
+            if node in G and G.nodes[node].get('label') == 'keyframe':
+                node_labels[node_idx] = LABEL_KEYFRAME
+                keyframe_ids[node_idx] = int(node[0])
+            else:
+                node_labels[node_idx] = LABEL_HASHTAG
+
+        return cls(indptr,
+                   np.asarray(indices, dtype=np.int32 if n_nodes < 2 ** 31 else np.int64),
+                   np.asarray(data, dtype=np.float64),
+                   node_labels, keyframe_ids,
+                   StringTable.from_strings(names),
+                   csr.shape)
+
+    def extend(self, keyframes, keyframe_weight=None, cooccurrence_weight=None):
+        """
+        Return a new in-memory graph with keyframe nodes, their hashtags and the co-occurrence edges added.
+
+        Args:
+            keyframes (list): (db_idx, hashtags) pairs of the new keyframes.
+            keyframe_weight (float, optional): The weight of the keyframe-hashtag edges (default is the median
+                                               weight of the existing keyframe-hashtag edges, or 1.0).
+            cooccurrence_weight (float, optional): Added to the weight of the edge between every pair of hashtags
+                                                   of a keyframe (default is the median weight of the existing
+                                                   hashtag-hashtag edges, or 1.0).
+
+        Returns:
+            GrafaGraph: The extended graph.
+
+        Process:
+            1. Give unseen hashtags and every new keyframe a node id after the existing nodes.
+            2. Add the increments of existing hashtag-hashtag edges to a copy of `data`.
+            3. Append the new edges (in both directions) and stably re-sort the entries by row, so that existing
+               neighbors keep their order and traversals of the old part of the graph are unchanged.
+        """
+
+        n_nodes = len(self)
+        n_rows = self.shape[0]
+        # Default to the typical weights of the existing graph, whatever normalization it was built with
+        if keyframe_weight is None:
+            keyframe_weight = self._median_weight(LABEL_HASHTAG, LABEL_KEYFRAME)
+        if cooccurrence_weight is None:
+            cooccurrence_weight = self._median_weight(LABEL_HASHTAG, LABEL_HASHTAG)
+
+        names = []
+        labels = []
+        kf_ids = []
+        new_ids = {}
+
+        def hashtag_node(hashtag):
+            node_idx = new_ids.get(hashtag)
+            if node_idx is None:
+                node_idx = self.node_id(hashtag)
+                if node_idx < 0:
+                    node_idx = n_nodes + len(names)
+                    names.append(hashtag)
+                    labels.append(LABEL_HASHTAG)
+                    kf_ids.append(-1)
+                new_ids[hashtag] = node_idx
+            return node_idx
+
+        increments = {}
+        new_edges = {}
+        for db_idx, hashtags in keyframes:
+            tags = sorted({hashtag_node(hashtag) for hashtag in hashtags})
+            keyframe_idx = n_nodes + len(names)
+            names.append(str((int(db_idx),)))
+            labels.append(LABEL_KEYFRAME)
+            kf_ids.append(int(db_idx))
+            for tag in tags:
+                new_edges[(keyframe_idx, tag)] = keyframe_weight
+                new_edges[(tag, keyframe_idx)] = keyframe_weight
+            for i, u in enumerate(tags):
+                for v in tags[i + 1:]:
+                    increments[(u, v)] = increments.get((u, v), 0.0) + cooccurrence_weight
+                    increments[(v, u)] = increments.get((v, u), 0.0) + cooccurrence_weight
+
+        data = np.array(self.data, dtype=np.float64)
+        for (u, v), increment in increments.items():
+            if u < n_rows:
+                start = self.indptr[u]
+                position = np.flatnonzero(np.asarray(self.indices[start:self.indptr[u + 1]]) == v)
+                if len(position):
+                    data[start + position[0]] += increment
+                    continue
+            new_edges[(u, v)] = increment
+
+        size = n_nodes + len(names)
+        rows = np.concatenate([np.repeat(np.arange(n_rows, dtype=np.int64), np.diff(self.indptr)),
+                               np.fromiter((u for u, _ in new_edges), dtype=np.int64, count=len(new_edges))])
+        cols = np.concatenate([np.asarray(self.indices, dtype=np.int64),
+                               np.fromiter((v for _, v in new_edges), dtype=np.int64, count=len(new_edges))])
+        data = np.concatenate([data, np.fromiter(new_edges.values(), dtype=np.float64, count=len(new_edges))])
+        order = np.argsort(rows, kind='stable')
+        indptr = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=size), out=indptr[1:])
+
+        return GrafaGraph(indptr,
+                          cols[order].astype(np.int32 if size < 2 ** 31 else np.int64),
+                          data[order],
+                          np.concatenate([np.asarray(self.node_labels), np.asarray(labels, dtype=np.int8)]),
+                          np.concatenate([np.asarray(self.keyframe_ids), np.asarray(kf_ids, dtype=np.int64)]),
+                          self.node_names.extend(names),
+                          (size, size))
+
+    def _median_weight(self, row_label, col_label):
+        rows = np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+        labels = np.asarray(self.node_labels)
+        mask = (labels[rows] == row_label) & (labels[np.asarray(self.indices)] == col_label)
+        return float(np.median(np.asarray(self.data)[mask])) if mask.any() else 1.0
+
+    def save(self, grafa_dir):
+        os.makedirs(grafa_dir, exist_ok=True)
+        np.save(os.path.join(grafa_dir, 'indptr.npy'), self.indptr)
+        np.save(os.path.join(grafa_dir, 'indices.npy'), self.indices)
+        np.save(os.path.join(grafa_dir, 'data.npy'), self.data)
+        np.save(os.path.join(grafa_dir, 'node_labels.npy'), self.node_labels)
+        np.save(os.path.join(grafa_dir, 'keyframe_ids.npy'), self.keyframe_ids)
+        self.node_names.save(os.path.join(grafa_dir, 'node_names'))
+        with open(os.path.join(grafa_dir, 'grafa_meta.json'), 'w') as f:
+            json.dump({'format_version': GRAFA_FORMAT_VERSION,
+                       'shape': list(self.shape),
+                       'n_nodes': len(self),
+                       'n_edges': len(self.indices)}, f)
+
+    @classmethod
+    def load(cls, grafa_dir, mmap_mode='r'):
+        with open(os.path.join(grafa_dir, 'grafa_meta.json'), 'r') as f:
+            meta = json.load(f)
+        if meta['format_version'] != GRAFA_FORMAT_VERSION:
+            raise ValueError(f"Unsupported GRAFA format version {meta['format_version']} in {grafa_dir}.")
+        load = lambda name: np.load(os.path.join(grafa_dir, f'{name}.npy'), mmap_mode=mmap_mode)
+        return cls(load('indptr'), load('indices'), load('data'),
+                   load('node_labels'), load('keyframe_ids'),
+                   StringTable.load(os.path.join(grafa_dir, 'node_names'), mmap_mode=mmap_mode),
+                   meta['shape'])
+
+def load_grafa_pickle(grafa_path):
+    """
+    Unpickle the legacy GRAFA database (requires networkx and scipy).
+    """
+
+    with open(grafa_path, 'rb') as f:
+        data = pickle.load(f)
+    return data['G'], data['sparse_matrix'], data['node_mapping'], data['reverse_node_mapping']
+
+def convert_grafa_pickle(grafa_path='database/graph_data_full.pkl',
+                         grafa_dir='database/grafa_csr'):
+    """
+    One-time conversion of `graph_data_full.pkl` into the memory-mappable CSR directory.
+    """
+
+    G, sparse_matrix, node_mapping, reverse_node_mapping = load_grafa_pickle(grafa_path)
+    grafa = GrafaGraph.from_networkx(sparse_matrix, node_mapping, reverse_node_mapping, G)
+    grafa.save(grafa_dir)
+    logger.info(f"Converted {grafa_path} to {grafa_dir}: {len(grafa)} nodes, {len(grafa.indices)} edges")
+    return grafa
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the pickled GRAFA database into the CSR format.")
+    parser.add_argument('--grafa_path', default='database/graph_data_full.pkl')
+    parser.add_argument('--grafa_dir', default='database/grafa_csr')
+    args = parser.parse_args()
+    convert_grafa_pickle(args.grafa_path, args.grafa_dir)
@@ -0,0 +1,230 @@
+# database/hashtag_postings.py
+import os
+import json
+import time
+import argparse
+import multiprocessing
+import numpy as np
+
+from database.grafa_store import GrafaGraph, LABEL_HASHTAG
+
+# Configure logging to output to the notebook
+import logging
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+HASHTAG_POSTINGS_FORMAT_VERSION = 2
+
+# The traversal parameters of the hashtag queries served by `cached_results`
+DEFAULT_TRAVERSAL_PARAMS = {'max_depth': 5, 'alpha': 0.7, 'min_score_threshold': 0.01,
+                            'max_keyframes': 10000, 'max_iterations': 10000}
+
+class HashtagPostings:
+    """
+    Precomputed top-M keyframes of hashtag nodes of the GRAFA graph, so that hashtag-only queries merge short
+    lists instead of traversing the graph.
+
+    Files in the postings directory:
+        postings_hashtags.npy: The sorted int32 node ids of the hashtags with postings.
+        postings_offsets.npy: int64 offsets of each hashtag's postings (len(hashtags) + 1).
+        postings_keyframes.npy: int32 keyframe node ids, highest weight first within each hashtag.
+        postings_weights.npy: float32 raw weights of the Dynamic Hashtag Exploration from the hashtag alone.
+        postings_totals.npy: float64 sum of the raw weights of every keyframe reached from each hashtag (not only
+                             the top M), which normalizes the scores as a live traversal does.
+        postings_meta.json: The traversal parameters, top M and the size of the graph the postings were built on.
+
+    The arrays are memory-mapped read-only. The postings of a hashtag are the first `top_m` keyframes of its
+    traversal in `traverse_seeds`. A single hashtag gets the same top k (k <= top_m) with the same scores, up to
+    the float32 precision of the weights. Queries with several seeds
+    only merge postings with `compose_seeds` (see `retrieve_by_hashtags`), which drops the keyframes that are
+    outside the top M of every one of them.
+    """
+
+    def __init__(self, hashtags, offsets, keyframes, weights, totals, top_m, params, n_nodes, n_edges):
+        self.hashtags = hashtags
+        self.offsets = offsets
+        self.keyframes = keyframes
+        self.weights = weights
+        self.totals = totals
+        self.top_m = top_m
+        self.params = dict(params)
+        self.n_nodes = n_nodes
+        self.n_edges = n_edges
+
+    def __len__(self):
+        return len(self.hashtags)
+
+    def matches(self, grafa):
+        """
+        Whether the postings were built on a graph of the same size (they are stale after an ingestion).
+        """
+
+        return self.n_nodes == len(grafa) and self.n_edges == len(grafa.indices)
+
+    def covers(self, grafa, k_num, max_depth, alpha, min_score_threshold, max_keyframes, max_iterations):
+        """
+        Whether the postings can answer a query for `k_num` keyframes with these traversal parameters.
+        """
+
+        return (self.matches(grafa) and k_num <= self.top_m
+                and self.params == {'max_depth': max_depth, 'alpha': alpha, 'min_score_threshold': min_score_threshold,
+                                    'max_keyframes': max_keyframes, 'max_iterations': max_iterations})
+
+    def _position(self, node_idx):
+        position = int(np.searchsorted(self.hashtags, node_idx))
+        if position == len(self.hashtags) or self.hashtags[position] != node_idx:
+            return None
+        return position
+
+    def get(self, node_idx):
+        """
+        Look up the postings of a hashtag node.
+
+        Returns:
+            tuple: The (keyframe node ids, float64 weights) arrays, or None when the hashtag has no postings.
+        """
+
+        position = self._position(node_idx)
+        if position is None:
+            return None
+        start, end = int(self.offsets[position]), int(self.offsets[position + 1])
+        return np.asarray(self.keyframes[start:end]), np.asarray(self.weights[start:end], dtype=np.float64)
+
+    def total_weight(self, node_idx):
+        """
+        The summed raw weight of every keyframe reached from a hashtag node (None when it has no postings).
+        """
+
+        position = self._position(node_idx)
+        return None if position is None else float(self.totals[position])
+
+    @classmethod
+    def load(cls, postings_dir, mmap_mode='r'):
+        with open(os.path.join(postings_dir, 'postings_meta.json'), 'r') as f:
+            meta = json.load(f)
+        if meta['format_version'] != HASHTAG_POSTINGS_FORMAT_VERSION:
+            raise ValueError(f"Unsupported hashtag postings format version {meta['format_version']} in {postings_dir}.")
+        load = lambda name: np.load(os.path.join(postings_dir, f'postings_{name}.npy'), mmap_mode=mmap_mode)
+        return cls(load('hashtags'), load('offsets'), load('keyframes'), load('weights'), load('totals'),
+                   meta['top_m'], meta['params'], meta['n_nodes'], meta['n_edges'])
+
+# The graph of a builder process, memory-mapped once by `_init_worker`
+_worker_grafa = None
+
+def _init_worker(grafa_dir):
+    global _worker_grafa
+    _worker_grafa = GrafaGraph.load(grafa_dir)
+
+def _build_chunk(args):
+    """
+    Traverse the graph from each hashtag of a chunk and keep its top-M keyframes.
+    """
+
+    from tools.graph_based_image_retrieval import propagate_frontier
+    from tools.traversal_cache import weight_vector
+
+    hashtag_nodes, top_m, params = args
+    postings = []
+    for node_idx in hashtag_nodes:
+        keyframes, weights = weight_vector(propagate_frontier(_worker_grafa, [node_idx], **params))
+        # Highest weight first; ties keep their first-arrival order
+        top = np.argsort(-weights, kind='stable')[:top_m]
+        # Summed in first-arrival order, like the normalization of a live traversal
+        postings.append((node_idx, keyframes[top], weights[top].astype(np.float32), sum(weights.tolist())))
+    return postings
+
+def build_hashtag_postings(grafa_dir, postings_dir, hashtag_nodes=None, top_m=500,
+                           processes=None, chunk_size=64, **params):
+    """
+    Compute the top-M keyframes of every hashtag (or of the given hot hashtags) and write them to a postings
+    directory.
+
+    Args:
+        grafa_dir (str): The CSR graph directory; every worker process memory-maps it.
+        postings_dir (str): The output directory.
+        hashtag_nodes (list, optional): The hashtag node ids to index (default is None: all hashtag nodes).
+        top_m (int): The number of keyframes kept per hashtag (default is 500).
+        processes (int, optional): The number of worker processes (default is None: one per CPU).
+        chunk_size (int): The number of hashtags traversed per task (default is 64).
+        **params: The traversal parameters (default to `DEFAULT_TRAVERSAL_PARAMS`).
+
+    Returns:
+        HashtagPostings: The memory-mapped postings.
+    """
+
+    params = dict(DEFAULT_TRAVERSAL_PARAMS, **params)
+    grafa = GrafaGraph.load(grafa_dir)
+    if hashtag_nodes is None:
+        hashtag_nodes = np.flatnonzero(np.asarray(grafa.node_labels) == LABEL_HASHTAG)
+    hashtag_nodes = np.unique(np.asarray(hashtag_nodes, dtype=np.int64))
+    chunks = [(hashtag_nodes[start:start + chunk_size].tolist(), top_m, params)
+              for start in range(0, len(hashtag_nodes), chunk_size)]
+
+    start_time = time.time()
+    keyframes, weights, totals, counts = [], [], [], []
+    with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(grafa_dir,)) as pool:
+        # `imap` keeps the chunks in node order
+        for chunk_number, postings in enumerate(pool.imap(_build_chunk, chunks), 1):
+            for _, node_keyframes, node_weights, node_total in postings:
+                keyframes.append(node_keyframes)
+                weights.append(node_weights)
+                totals.append(node_total)
+                counts.append(len(node_keyframes))
+            if chunk_number % 100 == 0 or chunk_number == len(chunks):
+                logger.info(f"Hashtag postings: {min(chunk_number * chunk_size, len(hashtag_nodes))}/"
+                            f"{len(hashtag_nodes)} hashtags ({time.time() - start_time:.1f}s)")
+
+    os.makedirs(postings_dir, exist_ok=True)
+    offsets = np.zeros(len(hashtag_nodes) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    np.save(os.path.join(postings_dir, 'postings_hashtags.npy'), hashtag_nodes.astype(np.int32))
+    np.save(os.path.join(postings_dir, 'postings_offsets.npy'), offsets)
+    np.save(os.path.join(postings_dir, 'postings_keyframes.npy'),
+            np.concatenate(keyframes) if keyframes else np.zeros(0, dtype=np.int32))
+    np.save(os.path.join(postings_dir, 'postings_weights.npy'),
+            np.concatenate(weights) if weights else np.zeros(0, dtype=np.float32))
+    np.save(os.path.join(postings_dir, 'postings_totals.npy'), np.asarray(totals, dtype=np.float64))
+    with open(os.path.join(postings_dir, 'postings_meta.json'), 'w') as f:
+        json.dump({'format_version': HASHTAG_POSTINGS_FORMAT_VERSION,
+                   'top_m': int(top_m),
+                   'params': params,
+                   'n_hashtags': len(hashtag_nodes),
+                   'n_postings': int(offsets[-1]),
+                   'n_nodes': len(grafa),
+                   'n_edges': len(grafa.indices)}, f)
+    logger.info(f"Built {postings_dir}: {len(hashtag_nodes)} hashtags, {int(offsets[-1])} postings "
+                f"in {time.time() - start_time:.1f}s")
+    return HashtagPostings.load(postings_dir)
+
+def read_hashtag_list(grafa, hashtags_path):
+    """
+    Read the hot hashtags to index (one per line, e.g. the most frequent hashtags of the query logs)
+    and return their node ids, skipping hashtags that are not in the graph.
+    """
+
+    with open(hashtags_path, 'r') as f:
+        hashtags = [line.strip() for line in f if line.strip()]
+    nodes = [grafa.node_id(hashtag) for hashtag in hashtags]
+    missing = sum(node < 0 for node in nodes)
+    if missing:
+        logger.info(f"{missing} of the {len(hashtags)} hashtags in {hashtags_path} are not in the graph")
+    return [node for node in nodes if node >= 0]
+
+if __name__ == "__main__":
+    from database.generation import generation_path
+
+    parser = argparse.ArgumentParser(description="Precompute the top-M keyframes of the hashtags of the GRAFA graph.")
+    parser.add_argument('--grafa_dir', default=None, help="Default: the graph of the current generation.")
+    parser.add_argument('--postings_dir', default='database/hashtag_postings')
+    parser.add_argument('--hashtags', default=None,
+                        help="Optional file of hot hashtags (one per line); default: every hashtag node.")
+    parser.add_argument('--top_m', type=int, default=500)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--chunk_size', type=int, default=64)
+    args = parser.parse_args()
+
+    grafa_dir = args.grafa_dir or generation_path('grafa', 'database/grafa_csr')
+    hashtag_nodes = read_hashtag_list(GrafaGraph.load(grafa_dir), args.hashtags) if args.hashtags else None
+    build_hashtag_postings(grafa_dir, args.postings_dir, hashtag_nodes,
+                           top_m=args.top_m, processes=args.processes, chunk_size=args.chunk_size)
@@ -0,0 +1,184 @@
+# database/index_registry.py
+import os
+import time
+import threading
+import multiprocessing
+
+import faiss
+
+from database.startup_loader import current_rss_mb
+from database.compressed_index import COMPRESSED_FAISS_DATABASES, RerankedIndex
+from database.sharded_index import SHARDED_FAISS_DATABASES, ShardedIndex
+from database.generation import read_generation
+
+# Configure logging to output to the notebook
+import logging
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Default location of each FAISS database
+FAISS_DATABASES = {
+    'CLIP_v0': 'database/merged_index_hnsw_baseline_v0.bin',
+    'CLIP_v2': 'database/merged_index_hnsw_baseline_v2.bin',
+}
+
+def available_compressed_databases():
+    """
+    The compressed databases whose index file has been built (see `python -m database.compressed_index`).
+    """
+
+    return {name: index_path for name, (_, _, index_path) in COMPRESSED_FAISS_DATABASES.items()
+            if os.path.exists(index_path)}
+
+def available_sharded_databases():
+    """
+    The sharded databases whose shards have been built (see `python -m database.sharded_index`).
+    """
+
+    return {name: shard_dir for name, (_, shard_dir) in SHARDED_FAISS_DATABASES.items()
+            if os.path.exists(os.path.join(shard_dir, 'shards_meta.json'))}
+
+def default_databases():
+    """
+    The index file of every database: the HNSW databases and the built compressed variants, replaced by the
+    files of the current ingestion generation (see `python -m database.ingest`).
+    """
+
+    generation = read_generation()
+    return {**FAISS_DATABASES, **available_compressed_databases(), **available_sharded_databases(),
+            **(generation['indexes'] if generation else {})}
+
+def read_faiss_index(database_path):
+    """
+    Read a FAISS index memory-mapped from disk (or the shards of a sharded database directory).
+    """
+
+    if os.path.isdir(database_path):
+        return ShardedIndex.load(database_path)
+    return faiss.read_index(database_path, faiss.IO_FLAG_MMAP)
+
+def index_file_size(database_path):
+    if os.path.isdir(database_path):
+        return sum(entry.stat().st_size for entry in os.scandir(database_path) if entry.is_file())
+    return os.path.getsize(database_path)
+
+class IndexRegistry:
+    """
+    Own every FAISS index by name and hand out already-loaded handles.
+
+    Indexes are read once (instead of once per query) and stay resident. `reload` reads a new index file next
+    to the current one and swaps the handle under a lock, so queries in flight keep using the old index and new
+    queries see the new one without a restart.
+
+    By default the registry serves the HNSW databases plus the compressed variants that have been built.
+    Compressed indexes can be wrapped in a `RerankedIndex` to re-rank their candidates with the raw embeddings.
+    """
+
+    def __init__(self, databases=None, num_threads=None, loader=read_faiss_index):
+        self.databases = dict(default_databases() if databases is None else databases)
+        self.loader = loader
+        self._rerank = {}
+        self._indexes = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+        # Configure the FAISS OpenMP pool once for the whole process
+        num_threads = num_threads or multiprocessing.cpu_count()
+        logger.info(f"Number of threads: {num_threads}")
+        faiss.omp_set_num_threads(num_threads)
+
+    def load(self, database_name, database_path=None, rerank_frames=None, k_factor=4):
+        """
+        Load (or reload) an index and publish it atomically.
+
+        Args:
+            database_name (str): The name of the database, e.g. 'CLIP_v0'.
+            database_path (str, optional): The index file; defaults to the registered path of the database.
+            rerank_frames (EmbeddingStore, optional): Re-rank the candidates of the index exactly with these
+                                                      embeddings (kept for later reloads of the database).
+            k_factor (int): The number of candidates re-ranked per result (default is 4).
+
+        Returns:
+            faiss.Index: The loaded index.
+        """
+
+        prepared = self._read(database_name, database_path, rerank_frames, k_factor)
+        self.publish({database_name: prepared})
+        return prepared[1]
+
+    reload = load
+
+    def prepare(self, database_paths, rerank_frames=None):
+        """
+        Read several indexes without publishing them (see `publish`).
+
+        Args:
+            database_paths (dict): database name -> index file.
+            rerank_frames (EmbeddingStore, optional): New embeddings for the databases served with re-ranking.
+
+        Returns:
+            dict: database name -> (path, index, stats), to be passed to `publish`.
+        """
+
+        return {database_name: self._read(database_name, database_path,
+                                          rerank_frames if database_name in self._rerank else None,
+                                          self._rerank.get(database_name, (None, 4))[1])
+                for database_name, database_path in database_paths.items()}
+
+    def publish(self, prepared):
+        """
+        Swap in indexes read by `prepare`, all under one lock.
+        """
+
+        with self._lock:
+            for database_name, (database_path, index, stats) in prepared.items():
+                self.databases[database_name] = database_path
+                self._indexes[database_name] = index
+                self._stats[database_name] = stats
+        for database_name, (database_path, _, stats) in prepared.items():
+            logger.info(f"The index for {database_name} is ready ({database_path}, ntotal={stats['ntotal']})!!!")
+
+    def _read(self, database_name, database_path=None, rerank_frames=None, k_factor=4):
+        database_path = database_path or self.databases.get(database_name)
+        if database_path is None:
+            raise ValueError(f"Unsupported database name {database_name!r}. Choose one of {sorted(self.databases)}.")
+
+        start_time = time.time()
+        start_rss = current_rss_mb()
+        index = self.loader(database_path)
+        if rerank_frames is not None:
+            self._rerank[database_name] = (rerank_frames, k_factor)
+        if database_name in self._rerank:
+            rerank_frames, k_factor = self._rerank[database_name]
+            index = RerankedIndex(index, rerank_frames, k_factor)
+        stats = {'path': database_path,
+                 'type': type(index).__name__ if rerank_frames is None else f"{type(index.index).__name__}+rerank",
+                 'ntotal': int(index.ntotal),
+                 'd': int(index.d),
+                 'file_size_mb': index_file_size(database_path) / (1024 ** 2) if os.path.exists(database_path) else None,
+                 'rss_delta_mb': current_rss_mb() - start_rss,
+                 'load_time': time.time() - start_time,
+                 'loaded_at': time.time()}
+        return database_path, index, stats
+
+    def get(self, database_name):
+        """
+        Return the loaded index of a database.
+        """
+
+        index = self._indexes.get(database_name)
+        if index is None:
+            raise ValueError(f"Database {database_name!r} is not loaded. Loaded: {sorted(self._indexes)}.")
+        return index
+
+    def __contains__(self, database_name):
+        return database_name in self._indexes
+
+    def stats(self):
+        """
+        Return the path, type, ntotal, dimension, size and load time of every loaded index.
+        """
+
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
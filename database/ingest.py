@@ -0,0 +1,323 @@
+# database/ingest.py
+import os
+import json
+import shutil
+import pickle
+import argparse
+import numpy as np
+import torch
+
+import faiss
+
+from database.annotation_store import AnnotationStore
+from database.grafa_store import GrafaGraph
+from database.embedding_store import append_embeddings, read_embedding_meta
+from database.index_registry import FAISS_DATABASES, available_compressed_databases
+from database.compressed_index import COMPRESSED_FAISS_DATABASES
+from database.generation import GENERATION_MANIFEST, GENERATIONS_DIR, read_generation, write_generation
+
+# Configure logging to output to the notebook
+import logging
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# The converted artifacts of generation 0 and the command that produces each of them
+BASE_ARTIFACTS = {
+    'encoded_frames': ('database/encoded_frames', 'meta.json', 'database.embedding_store'),
+    'annotation': ('database/annotation', 'annotation_meta.json', 'database.annotation_store'),
+    'grafa': ('database/grafa_csr', 'grafa_meta.json', 'database.grafa_store'),
+}
+BASE_HASHTAG_EMBEDDINGS = 'database/hashtag_embeddings.pkl'
+
+# The indexes built from the CLIP image embeddings alone (`encoded_frames`); every other index needs its own
+# embeddings at ingestion
+IMAGE_EMBEDDING_DATABASES = {'CLIP_v0', *(name for name, (database_name, _, _) in COMPRESSED_FAISS_DATABASES.items()
+                                          if database_name == 'CLIP_v0')}
+BASE_HASHTAG_EMBEDDING_INDEX = 'database/hashtag_embeddings.bin'
+
+def current_generation(manifest_path=GENERATION_MANIFEST):
+    """
+    The manifest of the current generation. Before the first ingestion this is generation 0, made of the
+    converted base artifacts and the default index files.
+    """
+
+    generation = read_generation(manifest_path)
+    if generation is not None:
+        return generation
+
+    paths = {}
+    for artifact, (path, meta_file, module) in BASE_ARTIFACTS.items():
+        if not os.path.exists(os.path.join(path, meta_file)):
+            raise FileNotFoundError(f"{path} not found, run `python -m {module}` before ingesting frames.")
+        paths[artifact] = path
+    paths['hashtag_embeddings'] = BASE_HASHTAG_EMBEDDINGS
+    paths['hashtag_embedding_index'] = BASE_HASHTAG_EMBEDDING_INDEX
+    return {'generation': 0,
+            'n_frames': read_embedding_meta(paths['encoded_frames'])['count'],
+            'paths': paths,
+            'indexes': {**FAISS_DATABASES, **available_compressed_databases()}}
+
+def read_frames(frames_path):
+    """
+    Read the annotations of a batch of new frames: a JSON list or one JSON object per line, with the fields of
+    `index_caption_hashtag_dict_v2.json` ('video_ID', 'frame_ID', 'timestamp', 'frame_path', 'hashtag_list').
+    """
+
+    with open(frames_path, 'r') as f:
+        if frames_path.endswith('.jsonl'):
+            return [json.loads(line) for line in f if line.strip()]
+        return json.load(f)
+
+def iter_chunks(array, chunk_size):
+    for start in range(0, len(array), chunk_size):
+        yield np.ascontiguousarray(array[start:start + chunk_size], dtype=np.float32)
+
+def add_to_index(index_path, output_path, vectors, n_frames, chunk_size=4096):
+    """
+    Append vectors to a copy of a FAISS index, whose ids must be the database indices `0..n_frames-1`.
+    """
+
+    # Read into memory: a memory-mapped index cannot be extended
+    index = faiss.read_index(index_path)
+    if index.ntotal != n_frames:
+        raise ValueError(f"{index_path} holds {index.ntotal} vectors but the generation has {n_frames} frames.")
+    if vectors.shape[1] != index.d:
+        raise ValueError(f"{index_path} has dimension {index.d}, the new vectors {vectors.shape[1]}.")
+    for chunk in iter_chunks(vectors, chunk_size):
+        index.add(chunk)
+    faiss.write_index(index, output_path)
+    logger.info(f"Added {len(vectors)} vectors to {index_path} -> {output_path} (ntotal={index.ntotal})")
+
+def add_hashtag_embeddings(hashtag_embeddings_path, hashtag_embedding_index_path, hashtags, hashtag_encoder,
+                           output_dir):
+    """
+    Encode unseen hashtags and append them to copies of the hashtag embeddings and of their FAISS index.
+
+    Returns:
+        tuple: The paths of the new embeddings and index files (the given paths when there is nothing to add).
+    """
+
+    with open(hashtag_embeddings_path, 'rb') as f:
+        hashtag_embeddings = pickle.load(f)
+    unseen = [hashtag for hashtag in dict.fromkeys(hashtags) if hashtag not in hashtag_embeddings]
+    if not unseen:
+        return hashtag_embeddings_path, hashtag_embedding_index_path
+    if hashtag_encoder is None:
+        logger.warning(f"{len(unseen)} new hashtags are added to the graph without embeddings, so queries can only "
+                       f"reach them through neighboring hashtags (pass --encode_hashtags to encode them)")
+        return hashtag_embeddings_path, hashtag_embedding_index_path
+
+    index = faiss.read_index(hashtag_embedding_index_path)
+    if index.ntotal != len(hashtag_embeddings):
+        raise ValueError(f"{hashtag_embedding_index_path} holds {index.ntotal} vectors "
+                         f"for {len(hashtag_embeddings)} hashtags.")
+    vectors = np.ascontiguousarray(hashtag_encoder(unseen), dtype=np.float32)
+    # The index rows follow the insertion order of the embeddings dict (see `find_similar_hashtags`)
+    index.add(vectors)
+    sample = next(iter(hashtag_embeddings.values()), None)
+    for hashtag, vector in zip(unseen, vectors):
+        if isinstance(sample, torch.Tensor):
+            vector = torch.from_numpy(vector).to(sample.dtype).reshape(sample.shape)
+        elif sample is not None:
+            vector = np.asarray(vector, dtype=sample.dtype).reshape(sample.shape)
+        hashtag_embeddings[hashtag] = vector
+
+    output_embeddings = os.path.join(output_dir, os.path.basename(hashtag_embeddings_path))
+    output_index = os.path.join(output_dir, os.path.basename(hashtag_embedding_index_path))
+    with open(output_embeddings, 'wb') as f:
+        pickle.dump(hashtag_embeddings, f)
+    faiss.write_index(index, output_index)
+    logger.info(f"Encoded {len(unseen)} new hashtags ({len(hashtag_embeddings)} in total)")
+    return output_embeddings, output_index
+
+def ingest_frames(frames, embeddings,
+                  index_embeddings=None,
+                  hashtag_encoder=None,
+                  manifest_path=GENERATION_MANIFEST,
+                  generations_dir=GENERATIONS_DIR,
+                  chunk_size=4096,
+                  keyframe_weight=None,
+                  cooccurrence_weight=None):
+    """
+    Append a batch of new frames to every database artifact and publish them as a new generation.
+
+    Args:
+        frames (list): The annotations of the new frames (see `read_frames`), in database-index order.
+        embeddings (np.ndarray): The (n, d) CLIP image embeddings of the frames (e.g. a memory-mapped `.npy`).
+        index_embeddings (dict, optional): database name -> (n, d) embeddings for indexes that are not built
+                                           from the image embeddings alone (e.g. CLIP_v2, frames + captions).
+                                           Required for every such index of the generation; only the indexes
+                                           in `IMAGE_EMBEDDING_DATABASES` fall back to `embeddings`.
+        hashtag_encoder (callable, optional): Maps a list of hashtags to an (n, d) array of normalized CLIP
+                                              text features; unseen hashtags are only encoded when it is given.
+        manifest_path (str): The generation manifest (default is `database/generation.json`).
+        generations_dir (str): The parent directory of the generation directories (default is
+                               `database/generations`).
+        chunk_size (int): The number of frames written or added to an index at a time (default is 4096).
+        keyframe_weight (float, optional): The keyframe-hashtag edge weight (see `GrafaGraph.extend`).
+        cooccurrence_weight (float, optional): The hashtag co-occurrence increment (see `GrafaGraph.extend`).
+
+    Returns:
+        dict: The manifest of the published generation.
+
+    Raises:
+        ValueError: When the embeddings do not match the frames, an index of the generation that is not built from
+                    the image embeddings has no entry in `index_embeddings`, or an entry names no index of the
+                    generation. Nothing is written in that case.
+
+    Process:
+        1. Add the vectors to a copy of every FAISS index of the current generation, in chunks; the new frames
+           get the database indices `n_frames..n_frames+n-1`.
+        2. Append the embeddings to the raw buffer of the embedding store, which running servers map only up
+           to their own generation's row count.
+        3. Write the extended annotation store, hashtag embeddings (for unseen hashtags) and GRAFA graph to the
+           new generation directory.
+        4. Publish the manifest with an atomic rename. Nothing is visible to servers before this step, and an
+           interrupted ingestion leaves the current generation intact.
+
+    Note:
+        Only one ingestion may run at a time. Servers pick the new generation up at startup or on
+        `POST /generation/reload`. The precomputed frame neighbors (`database/frame_knn`) are not extended:
+        they are detected as stale and replaced by live searches until rebuilt. Sharded databases are not
+        extended either; rebuild them with `python -m database.sharded_index`.
+    """
+
+    if len(frames) != len(embeddings):
+        raise ValueError(f"Got {len(frames)} frames but {len(embeddings)} embeddings.")
+    index_embeddings = index_embeddings or {}
+    for database_name, vectors in index_embeddings.items():
+        if len(vectors) != len(frames):
+            raise ValueError(f"Got {len(frames)} frames but {len(vectors)} embeddings for {database_name}.")
+
+    generation = current_generation(manifest_path)
+    unknown = sorted(set(index_embeddings) - set(generation['indexes']))
+    if unknown:
+        raise ValueError(f"Got embeddings for {unknown}, which are not indexes of generation "
+                         f"{generation['generation']} ({sorted(generation['indexes'])}).")
+    missing = sorted(database_name for database_name in generation['indexes']
+                     if database_name not in index_embeddings and database_name not in IMAGE_EMBEDDING_DATABASES)
+    if missing:
+        raise ValueError(f"No embeddings for {missing}: these indexes are not built from the image embeddings "
+                         f"alone, pass their own with `index_embeddings`.")
+
+    n_frames = generation['n_frames']
+    number = generation['generation'] + 1
+    output_dir = os.path.join(generations_dir, f"{number:06d}")
+    os.makedirs(output_dir, exist_ok=True)
+    paths = dict(generation['paths'])
+    logger.info(f"Ingesting {len(frames)} frames as generation {number} (database indices {n_frames}+)")
+
+    indexes = {}
+    for database_name, index_path in generation['indexes'].items():
+        output_path = os.path.join(output_dir, os.path.basename(index_path))
+        add_to_index(index_path, output_path, index_embeddings.get(database_name, embeddings), n_frames, chunk_size)
+        indexes[database_name] = output_path
+
+    count = append_embeddings(paths['encoded_frames'], iter_chunks(embeddings, chunk_size), n_frames)
+
+    annotation = AnnotationStore.load(paths['annotation']).extend(frames, start=n_frames)
+    paths['annotation'] = os.path.join(output_dir, 'annotation')
+    annotation.save(paths['annotation'])
+
+    hashtags = [hashtag for frame in frames for hashtag in frame.get('hashtag_list', [])]
+    paths['hashtag_embeddings'], paths['hashtag_embedding_index'] = add_hashtag_embeddings(
+        paths['hashtag_embeddings'], paths['hashtag_embedding_index'], hashtags, hashtag_encoder, output_dir)
+
+    keyframes = [(n_frames + offset, frame.get('hashtag_list', [])) for offset, frame in enumerate(frames)]
+    grafa = GrafaGraph.load(paths['grafa']).extend(keyframes, keyframe_weight, cooccurrence_weight)
+    paths['grafa'] = os.path.join(output_dir, 'grafa_csr')
+    grafa.save(paths['grafa'])
+
+    return write_generation({'generation': number,
+                             'n_frames': count,
+                             'paths': paths,
+                             'indexes': indexes}, manifest_path)
+
+def prune_generations(keep=2, manifest_path=GENERATION_MANIFEST, generations_dir=GENERATIONS_DIR):
+    """
+    Delete the generation directories older than the last `keep` generations.
+
+    Servers that still map files of a deleted generation keep reading them until they reload (the files are
+    unlinked, not truncated).
+    """
+
+    generation = read_generation(manifest_path)
+    if generation is None or not os.path.isdir(generations_dir):
+        return []
+    # Artifacts that were not rewritten since (e.g. the hashtag embeddings) stay in an older directory
+    referenced = {os.path.realpath(path) for path in [*generation['paths'].values(), *generation['indexes'].values()]}
+    removed = []
+    for name in sorted(os.listdir(generations_dir)):
+        generation_dir = os.path.realpath(os.path.join(generations_dir, name))
+        if any(os.path.commonpath([generation_dir, path]) == generation_dir for path in referenced):
+            continue
+        if name.isdigit() and int(name) <= generation['generation'] - keep:
+            shutil.rmtree(os.path.join(generations_dir, name))
+            removed.append(name)
+    if removed:
+        logger.info(f"Removed generations {removed}")
+    return removed
+
+def clip_hashtag_encoder():
+    """
+    Encode hashtags like `encode_hashtag`, in one batch (loads the CLIP model).
+    """
+
+    from models.model_init import load_model
+    from tools.query_encoding import encode_texts
+
+    device, model = load_model()
+
+    def encode(hashtags):
+        text_features = encode_texts(model, device, hashtags)
+        text_features /= text_features.norm(dim=-1, keepdim=True)
+        return text_features.cpu().numpy()
+    return encode
+
+def notify_server(server_url):
+    """
+    Ask a running server to load the latest generation.
+    """
+
+    from urllib.request import Request, urlopen
+
+    with urlopen(Request(f"{server_url.rstrip('/')}/generation/reload", method='POST'), timeout=600) as response:
+        logger.info(f"{server_url}: {response.read().decode('utf-8')}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Append new frames to the embedding store, FAISS indexes, "
+                                                 "annotations and GRAFA graph as a new generation.")
+    parser.add_argument('--frames', required=True,
+                        help="JSON or JSONL annotations of the new frames, with their 'hashtag_list'.")
+    parser.add_argument('--embeddings', required=True, help="(n, d) .npy CLIP image embeddings of the frames.")
+    parser.add_argument('--index_embeddings', nargs='*', default=[], metavar='DATABASE=PATH',
+                        help="Embeddings of indexes that are not built from the image embeddings, e.g. CLIP_v2=v2.npy "
+                             "(required for every such index of the current generation).")
+    parser.add_argument('--encode_hashtags', action='store_true',
+                        help="Encode unseen hashtags with CLIP so that they can seed hashtag queries.")
+    parser.add_argument('--chunk_size', type=int, default=4096)
+    parser.add_argument('--keyframe_weight', type=float, default=None)
+    parser.add_argument('--cooccurrence_weight', type=float, default=None)
+    parser.add_argument('--keep_generations', type=int, default=2)
+    parser.add_argument('--reload_url', default=None,
+                        help="URL of a running server to switch to the new generation, e.g. http://localhost:8000.")
+    args = parser.parse_args()
+
+    index_embeddings = {}
+    for entry in args.index_embeddings:
+        database_name, _, path = entry.partition('=')
+        if not path:
+            parser.error(f"Expected DATABASE=PATH, got {entry!r}.")
+        index_embeddings[database_name] = np.load(path, mmap_mode='r')
+
+    ingest_frames(read_frames(args.frames),
+                  np.load(args.embeddings, mmap_mode='r'),
+                  index_embeddings=index_embeddings,
+                  hashtag_encoder=clip_hashtag_encoder() if args.encode_hashtags else None,
+                  chunk_size=args.chunk_size,
+                  keyframe_weight=args.keyframe_weight,
+                  cooccurrence_weight=args.cooccurrence_weight)
+    prune_generations(args.keep_generations)
+    if args.reload_url:
+        notify_server(args.reload_url)
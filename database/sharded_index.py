@@ -0,0 +1,289 @@
+# database/sharded_index.py
+import os
+import json
+import time
+import heapq
+import argparse
+import itertools
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+import faiss
+
+from tools.faiss_retrieval import hnsw_search_parameters, k_image_search_filtered
+
+# Configure logging to output to the notebook
+import logging
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+SHARDED_FORMAT_VERSION = 1
+
+# Sharded variants of the HNSW databases: name -> (base database, shard directory)
+SHARDED_FAISS_DATABASES = {
+    'CLIP_v0_sharded': ('CLIP_v0', 'database/shards_v0'),
+}
+
+def video_group(video_ID):
+    """
+    The group of a video, e.g. 'L01' for 'L01_V001'.
+    """
+
+    return video_ID.split('_', 1)[0]
+
+class ShardedIndex:
+    """
+    Several HNSW indexes, each holding the frames of a group of videos, searched as one index.
+
+    Files in the shard directory:
+        <shard>.bin: The HNSW index of the shard, with local ids 0..n-1.
+        <shard>_ids.npy: The sorted database indices of the shard's frames (local id -> database index).
+        shards_meta.json: The shards with their video groups, the base database and the format version.
+
+    A search runs on every shard concurrently in the shared fan-out pool (see `get_shard_executor`; FAISS releases
+    the GIL while searching), then the per-shard top-k lists are merged into the global top-k with a heap merge.
+    Filtered searches only visit the shards that hold allowed frames, so a video filter skips the other shards
+    entirely. The wrapper exposes what the search code uses of a FAISS index (`search`, `reconstruct_batch`,
+    `ntotal`, `d`, `metric_type`), so it can be published in the index registry in place of the merged index.
+
+    Args:
+        shards (list): One dict per shard with its 'name', 'index' (faiss.Index), 'ids' (np.ndarray) and 'groups'.
+    """
+
+    def __init__(self, shards):
+        self.shards = shards
+        # Shared by every sharded index, so replacing one on reload leaves no threads behind
+        self._executor = get_shard_executor()
+        # Database index -> (shard, local id), for reconstructing rows
+        self.ntotal = sum(len(shard['ids']) for shard in shards)
+        size = max((int(shard['ids'][-1]) + 1 for shard in shards if len(shard['ids'])), default=0)
+        self.shard_of = np.full(size, -1, dtype=np.int32)
+        self.local_of = np.full(size, -1, dtype=np.int64)
+        for position, shard in enumerate(shards):
+            self.shard_of[shard['ids']] = position
+            self.local_of[shard['ids']] = np.arange(len(shard['ids']))
+
+    @property
+    def d(self):
+        return self.shards[0]['index'].d
+
+    @property
+    def metric_type(self):
+        return self.shards[0]['index'].metric_type
+
+    def _merge(self, results, k):
+        """
+        Merge per-shard results, each a list of (distances, database indices) per query, into the global top-k.
+        """
+
+        inner_product = self.metric_type == faiss.METRIC_INNER_PRODUCT
+        n_queries = len(results[0]) if results else 0
+        distances = np.full((n_queries, k), -np.inf if inner_product else np.inf, dtype=np.float32)
+        indices = np.full((n_queries, k), -1, dtype=np.int64)
+        for row in range(n_queries):
+            # Each shard list is already sorted by distance (descending for inner product)
+            merged = heapq.merge(*(zip(shard_rows[row][0], shard_rows[row][1]) for shard_rows in results),
+                                 key=lambda pair: pair[0], reverse=inner_product)
+            for column, (distance, idx) in enumerate(itertools.islice(merged, k)):
+                distances[row, column] = distance
+                indices[row, column] = idx
+        return distances, indices
+
+    def _search_shard(self, shard, x, k):
+        distances, local_ids = shard['index'].search(x, k, params=hnsw_search_parameters(shard['index'], k))
+        rows = []
+        for row_distances, row_ids in zip(distances, local_ids):
+            valid = row_ids != -1
+            rows.append((row_distances[valid], shard['ids'][row_ids[valid]]))
+        return rows
+
+    def search(self, x, k, params=None):
+        """
+        Search every shard and merge the results, like `faiss.Index.search`.
+
+        Each shard gets its own search parameters (efSearch scaled with k). Id selectors are not supported:
+        filtered searches go through `search_filtered`, which maps the allowed rows to each shard.
+        """
+
+        if params is not None and params.sel is not None:
+            raise ValueError("ShardedIndex does not take id selectors; use `search_filtered`.")
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        futures = [self._executor.submit(self._search_shard, shard, x, k) for shard in self.shards]
+        return self._merge([future.result() for future in futures], k)
+
+    def search_filtered(self, query_vector, k_nums, row_ids, ef_search=None):
+        """
+        Search the shards holding at least one allowed frame, each restricted to its allowed frames.
+
+        Args:
+            query_vector (np.ndarray): A (1, d) float32 query vector.
+            k_nums (int): The number of nearest neighbors to retrieve.
+            row_ids (np.ndarray): The sorted allowed database indices.
+            ef_search (int, optional): The HNSW efSearch of this search (default follows `adaptive_ef_search`).
+
+        Returns:
+            tuple: The valid distances and valid indices, as returned by `k_image_search`.
+        """
+
+        row_ids = row_ids[(row_ids >= 0) & (row_ids < len(self.shard_of))]
+        owners = self.shard_of[row_ids]
+
+        def search_shard(position):
+            shard = self.shards[position]
+            local_rows = self.local_of[row_ids[owners == position]]
+            # Brute force or selector search inside the shard, depending on how selective the filter is there
+            distances, local_ids = k_image_search_filtered(query_vector, shard['index'], 'cpu', k_nums=k_nums,
+                                                           row_ids=local_rows, ef_search=ef_search)
+            return [(np.asarray(distances), shard['ids'][np.asarray(local_ids, dtype=np.int64)])]
+
+        positions = [int(position) for position in np.unique(owners) if position >= 0]
+        futures = [self._executor.submit(search_shard, position) for position in positions]
+        distances, indices = self._merge([future.result() for future in futures], k_nums)
+        if not len(distances):
+            return np.empty(0, dtype=np.float32), []
+        valid_indexs = [idx for idx in indices[0] if idx != -1]
+        return distances[0][:len(valid_indexs)], valid_indexs
+
+    def reconstruct_batch(self, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.empty((len(ids), self.d), dtype=np.float32)
+        owners = self.shard_of[ids]
+        for position in np.unique(owners):
+            mask = owners == position
+            vectors[mask] = self.shards[position]['index'].reconstruct_batch(self.local_of[ids[mask]])
+        return vectors
+
+    @classmethod
+    def load(cls, shard_dir, mmap=True):
+        with open(os.path.join(shard_dir, 'shards_meta.json'), 'r') as f:
+            meta = json.load(f)
+        if meta['format_version'] != SHARDED_FORMAT_VERSION:
+            raise ValueError(f"Unsupported shard format version {meta['format_version']} in {shard_dir}.")
+        shards = []
+        for entry in meta['shards']:
+            index_path = os.path.join(shard_dir, f"{entry['name']}.bin")
+            shards.append({'name': entry['name'],
+                           'groups': entry['groups'],
+                           'index': faiss.read_index(index_path, faiss.IO_FLAG_MMAP) if mmap else faiss.read_index(index_path),
+                           'ids': np.load(os.path.join(shard_dir, f"{entry['name']}_ids.npy"))})
+        return cls(shards)
+
+# The pool searching the shards of every sharded index. It is separate from the stage and compute executors: the
+# searches are submitted from their threads, and waiting there for jobs queued on the same bounded pool could
+# deadlock.
+_shard_executor = None
+_shard_executor_lock = threading.Lock()
+
+def get_shard_executor(max_workers=None):
+    global _shard_executor
+    with _shard_executor_lock:
+        if _shard_executor is None:
+            _shard_executor = ThreadPoolExecutor(max_workers=max_workers or os.cpu_count() or 4,
+                                                 thread_name_prefix='shard-search')
+        return _shard_executor
+
+def shard_row_ids(image_info_dict, count, groups_per_shard=1):
+    """
+    Partition the database indices by video group.
+
+    Args:
+        image_info_dict (AnnotationStore): The columnar keyframe annotations.
+        count (int): The number of encoded frames.
+        groups_per_shard (int): The number of consecutive video groups per shard (default is 1, e.g. one shard
+                                per L01, L02, ...).
+
+    Returns:
+        dict: shard name -> (video groups, sorted database indices). Frames without annotations go to the
+              '_unassigned' shard, so that every frame stays searchable.
+    """
+
+    video_groups = [video_group(image_info_dict.videos[code]) for code in range(len(image_info_dict.videos))]
+    groups = sorted(set(video_groups))
+    group_ids = {group: position for position, group in enumerate(groups)}
+    group_of_code = np.array([group_ids[group] for group in video_groups], dtype=np.int64)
+
+    # The group of every frame (-1 for frames without annotations)
+    video_code = np.full(count, -1, dtype=np.int64)
+    annotated = min(count, len(image_info_dict))
+    video_code[:annotated] = np.asarray(image_info_dict.video_code[:annotated])
+    frame_groups = np.full(count, -1, dtype=np.int64)
+    frame_groups[video_code >= 0] = group_of_code[video_code[video_code >= 0]]
+
+    shards = {}
+    for start in range(0, len(groups), groups_per_shard):
+        shard_groups = groups[start:start + groups_per_shard]
+        name = shard_groups[0] if len(shard_groups) == 1 else f"{shard_groups[0]}-{shard_groups[-1]}"
+        rows = np.flatnonzero((frame_groups >= start) & (frame_groups < start + len(shard_groups)))
+        shards[name] = (shard_groups, rows)
+    unassigned = np.flatnonzero(frame_groups < 0)
+    if len(unassigned):
+        shards['_unassigned'] = ([], unassigned)
+    return shards
+
+def build_sharded_index(encoded_frames, image_info_dict, shard_dir,
+                        database_name='CLIP_v0', metric_type=faiss.METRIC_L2,
+                        groups_per_shard=1, hnsw_m=32, ef_construction=40, chunk_size=65536):
+    """
+    Build one HNSW index per video group from the encoded frames.
+
+    Args:
+        encoded_frames (EmbeddingStore): The encoded frames.
+        image_info_dict (AnnotationStore): The annotations, which give the video of each frame.
+        shard_dir (str): The output directory.
+        database_name (str): The database the shards replace, recorded in the metadata (default is 'CLIP_v0').
+        metric_type (int): The FAISS metric, which must match that database (default is L2).
+        groups_per_shard (int): The number of video groups per shard (default is 1).
+        hnsw_m (int): The number of HNSW links per node (default is 32).
+        ef_construction (int): The HNSW efConstruction (default is 40).
+        chunk_size (int): The number of frames added at a time (default is 65536).
+
+    Returns:
+        ShardedIndex: The sharded index, memory-mapped from the written files.
+    """
+
+    os.makedirs(shard_dir, exist_ok=True)
+    entries = []
+    for name, (groups, rows) in shard_row_ids(image_info_dict, len(encoded_frames), groups_per_shard).items():
+        start_time = time.time()
+        index = faiss.IndexHNSWFlat(encoded_frames.shape[1], hnsw_m, metric_type)
+        index.hnsw.efConstruction = ef_construction
+        for start in range(0, len(rows), chunk_size):
+            index.add(np.ascontiguousarray(encoded_frames[rows[start:start + chunk_size]].cpu().numpy(),
+                                           dtype=np.float32))
+        faiss.write_index(index, os.path.join(shard_dir, f"{name}.bin"))
+        np.save(os.path.join(shard_dir, f"{name}_ids.npy"), rows.astype(np.int64))
+        entries.append({'name': name, 'groups': groups, 'ntotal': int(len(rows))})
+        logger.info(f"Shard {name}: {len(rows)} frames ({time.time() - start_time:.1f}s)")
+
+    with open(os.path.join(shard_dir, 'shards_meta.json'), 'w') as f:
+        json.dump({'format_version': SHARDED_FORMAT_VERSION,
+                   'database_name': database_name,
+                   'metric_type': int(metric_type),
+                   'shards': entries}, f, indent=2)
+    return ShardedIndex.load(shard_dir)
+
+if __name__ == "__main__":
+    from database.db_init import load_encoded_frames, load_annotation
+    from database.index_registry import FAISS_DATABASES, read_faiss_index
+
+    parser = argparse.ArgumentParser(description="Split an HNSW database into one HNSW index per video group.")
+    parser.add_argument('--database_name', default='CLIP_v0',
+                        choices=sorted({database_name for database_name, _ in SHARDED_FAISS_DATABASES.values()}),
+                        help="The HNSW database to replace; it must be built from the encoded frames.")
+    parser.add_argument('--groups_per_shard', type=int, default=1)
+    parser.add_argument('--hnsw_m', type=int, default=32)
+    parser.add_argument('--ef_construction', type=int, default=40)
+    parser.add_argument('--num_threads', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.num_threads:
+        faiss.omp_set_num_threads(args.num_threads)
+    shard_dir = next(shard_dir for database_name, shard_dir in SHARDED_FAISS_DATABASES.values()
+                     if database_name == args.database_name)
+    metric_type = read_faiss_index(FAISS_DATABASES[args.database_name]).metric_type
+    build_sharded_index(load_encoded_frames('cpu'), load_annotation(), shard_dir,
+                        database_name=args.database_name, metric_type=metric_type,
+                        groups_per_shard=args.groups_per_shard, hnsw_m=args.hnsw_m,
+                        ef_construction=args.ef_construction)
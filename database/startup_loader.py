@@ -0,0 +1,181 @@
+# database/startup_loader.py
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Configure logging to output to the notebook
+import logging
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+def current_rss_mb():
+    """
+    Return the resident set size of the current process in megabytes.
+
+    Returns:
+        float: The resident memory of the process, or the peak resident memory when `/proc` is unavailable.
+    """
+
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 ** 2)
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class StartupLoader:
+    """
+    Load the application databases concurrently and publish each one on `app.state` as soon as it is ready.
+
+    Every component is loaded in a thread pool (torch, FAISS and file I/O release the GIL for most of their work),
+    and its status, load time and resident-memory delta are recorded for the `/healthz` and `/readyz` endpoints.
+    A component that fails to load is reported instead of taking down the process. Components registered with
+    `required=False` keep loading in the background and do not gate readiness.
+
+    Note:
+        Components load concurrently, so `rss_delta_mb` is an approximation: it is the growth of the whole
+        process while that component was loading.
+    """
+
+    def __init__(self, state, max_workers=None):
+        self.state = state
+        self.max_workers = max_workers
+        self._components = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self.started_at = None
+
+    def add(self, name, loader, targets=None, after=(), required=True):
+        """
+        Register a component to be loaded.
+
+        Args:
+            name (str): The name of the component.
+            loader (callable): Called with the loaded values of the `after` components, in order.
+            targets (tuple): Names of the `app.state` attributes receiving the loaded value. When more than one
+                             name is given, the loader must return a tuple of the same length; an empty tuple
+                             publishes nothing (default is `(name,)`).
+            after (tuple): Names of the components this one depends on.
+            required (bool): Whether the component gates readiness (default is True).
+        """
+
+        self._components[name] = {'loader': loader,
+                                  'targets': (name,) if targets is None else tuple(targets),
+                                  'after': tuple(after),
+                                  'required': required,
+                                  'status': 'pending',
+                                  'value': None,
+                                  'error': None,
+                                  'load_time': None,
+                                  'rss_delta_mb': None,
+                                  'done': threading.Event()}
+        # Publish placeholders so that handlers can read the state before the component is loaded
+        for target in self._components[name]['targets']:
+            setattr(self.state, target, None)
+
+    def start(self):
+        """
+        Submit every registered component to the thread pool without waiting for any of them.
+        """
+
+        self.started_at = time.time()
+        # Every component gets its own worker so that dependents waiting on a dependency cannot starve the pool
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers or max(1, len(self._components)),
+                                            thread_name_prefix='startup-loader')
+        for name in self._components:
+            self._executor.submit(self._load, name)
+        self._executor.shutdown(wait=False)
+
+    def _load(self, name):
+        try:
+            self._load_component(name)
+        finally:
+            self._components[name]['done'].set()
+
+    def _load_component(self, name):
+        component = self._components[name]
+
+        # Wait for the dependencies and fail fast if one of them failed
+        dependencies = []
+        for dependency in component['after']:
+            self._components[dependency]['done'].wait()
+            if self._components[dependency]['status'] != 'ready':
+                return self._fail(name, RuntimeError(f"dependency '{dependency}' failed to load"))
+            dependencies.append(self._components[dependency]['value'])
+
+        with self._lock:
+            component['status'] = 'loading'
+        start_time = time.time()
+        start_rss = current_rss_mb()
+        try:
+            value = component['loader'](*dependencies)
+        except Exception as e:
+            return self._fail(name, e)
+
+        targets = component['targets']
+        values = value if len(targets) > 1 else (value,)
+        for target, target_value in zip(targets, values):
+            setattr(self.state, target, target_value)
+
+        with self._lock:
+            component['value'] = value
+            component['load_time'] = time.time() - start_time
+            component['rss_delta_mb'] = current_rss_mb() - start_rss
+            component['status'] = 'ready'
+        logger.info(f"Loaded {name} in {component['load_time']:.2f}s (RSS +{component['rss_delta_mb']:.1f} MB)")
+
+    def _fail(self, name, error):
+        logger.error(f"Failed to load {name}: {error}")
+        with self._lock:
+            self._components[name]['status'] = 'failed'
+            self._components[name]['error'] = str(error)
+
+    def is_ready(self, name):
+        return self._components[name]['status'] == 'ready'
+
+    def missing(self, names):
+        """
+        Return the components, among `names`, that are not loaded yet or failed to load.
+        Names that were never registered with the loader are ignored.
+        """
+
+        return [name for name in names if name in self._components and not self.is_ready(name)]
+
+    def wait(self, names=None, timeout=None):
+        """
+        Block until the given components (default: all of them) have finished loading or failed.
+
+        Returns:
+            bool: True if all of them are ready.
+        """
+
+        names = list(names or self._components)
+        deadline = None if timeout is None else time.time() + timeout
+        for name in names:
+            remaining = None if deadline is None else max(0, deadline - time.time())
+            if not self._components[name]['done'].wait(timeout=remaining):
+                return False
+        return not self.missing(names)
+
+    def ready(self):
+        """
+        Return whether every required component is loaded.
+        """
+
+        return not self.missing([name for name, component in self._components.items() if component['required']])
+
+    def report(self):
+        """
+        Return the status, load time and memory delta of every component.
+        """
+
+        with self._lock:
+            return {name: {'status': component['status'],
+                           'required': component['required'],
+                           'load_time': component['load_time'],
+                           'rss_delta_mb': component['rss_delta_mb'],
+                           'error': component['error']}
+                    for name, component in self._components.items()}
@@ -0,0 +1,94 @@
+# database/string_table.py
+import os
+import numpy as np
+
+class StringTable:
+    """
+    A compact, memory-mappable table of strings.
+
+    The strings are stored as one UTF-8 blob (`<prefix>_blob.npy`) and an offsets array (`<prefix>_offsets.npy`),
+    so that looking up the i-th string is two array reads and a decode. An optional `<prefix>_order.npy` holds
+    the string ids sorted by value, which makes `find` a binary search instead of a Python dict lookup.
+    """
+
+    def __init__(self, blob, offsets, order=None):
+        self.blob = blob
+        self.offsets = offsets
+        self.order = order
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        return bytes(self.blob[self.offsets[idx]:self.offsets[idx + 1]]).decode('utf-8')
+
+    def find(self, value):
+        """
+        Return the id of `value`, or -1 if it is not in the table (requires the sorted order).
+        """
+
+        if self.order is None:
+            raise ValueError("This string table was saved without a sorted order.")
+        lo = self._lower_bound(value)
+        if lo < len(self.order) and self[self.order[lo]] == value:
+            return int(self.order[lo])
+        return -1
+
+    def _lower_bound(self, value):
+        lo, hi = 0, len(self.order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self[self.order[mid]] < value:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def extend(self, strings):
+        """
+        Return a new in-memory table holding these strings followed by `strings`.
+
+        Existing ids are unchanged. When the table has a sorted order, the new ids are merged into it with one
+        binary search per new string instead of re-sorting the whole table.
+        """
+
+        encoded = [s.encode('utf-8') for s in strings]
+        offsets = np.empty(len(self.offsets) + len(encoded), dtype=np.int64)
+        offsets[:len(self.offsets)] = self.offsets
+        np.cumsum([len(e) for e in encoded], out=offsets[len(self.offsets):])
+        offsets[len(self.offsets):] += self.offsets[-1]
+        blob = np.concatenate([np.asarray(self.blob), np.frombuffer(b''.join(encoded), dtype=np.uint8)])
+        order = None
+        if self.order is not None:
+            new_ids = sorted(range(len(strings)), key=strings.__getitem__)
+            positions = [self._lower_bound(strings[new_id]) for new_id in new_ids]
+            order = np.insert(np.asarray(self.order), positions, np.asarray(new_ids, dtype=np.int64) + len(self))
+        return StringTable(blob, offsets, order)
+
+    @classmethod
+    def from_strings(cls, strings, sortable=True):
+        """
+        Build an in-memory string table from a list of strings.
+        """
+
+        encoded = [s.encode('utf-8') for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        order = None
+        if sortable:
+            order = np.array(sorted(range(len(strings)), key=strings.__getitem__), dtype=np.int64)
+        return cls(blob, offsets, order)
+
+    def save(self, path_prefix):
+        np.save(f"{path_prefix}_blob.npy", self.blob)
+        np.save(f"{path_prefix}_offsets.npy", self.offsets)
+        if self.order is not None:
+            np.save(f"{path_prefix}_order.npy", self.order)
+
+    @classmethod
+    def load(cls, path_prefix, mmap_mode='r'):
+        order_path = f"{path_prefix}_order.npy"
+        return cls(np.load(f"{path_prefix}_blob.npy", mmap_mode=mmap_mode),
+                   np.load(f"{path_prefix}_offsets.npy", mmap_mode=mmap_mode),
+                   np.load(order_path, mmap_mode=mmap_mode) if os.path.exists(order_path) else None)
@@ -11,5 +11,6 @@ def load_model(model_name="ViT-B/32"):
     device = "cuda" if torch.cuda.is_available() else "cpu"
     logger.info(f"Device: {device}")
     model, preprocess = clip.load(model_name, device=device)
+    model.model_name = model_name  # Used to key the text-embedding cache
     logger.info(f"The CLIP model ({model_name}) is ready!!!")
     return device, model
@@ -8,6 +8,7 @@ from fastapi.responses import HTMLResponse
 from typing import Optional
 
 from tools.search_utils import cached_get_keyframes
+from routers.dependencies import require_components
 
 # Pass templates location to all views in FastAPI
 templates = Jinja2Templates(directory = 'templates')
@@ -25,10 +26,13 @@ async def data_page(request: Request,
                     video_ID: Optional[str] = 'L01_V001',
                     timestamp: Optional[str] = ''):
 
+    require_components(request, ['annotation'])
+
     logger.info(f"Received video_ID: {video_ID}")
     logger.info(f"Received timestamp: {timestamp}")
     per_page = 50
-    keyframes, total_count = cached_get_keyframes(page, 
+    keyframes, total_count = cached_get_keyframes(request.app.state.image_info_dict,
+                                                  page, 
                                                   per_page, 
                                                   video_ID, 
                                                   timestamp)
@@ -0,0 +1,101 @@
+##############################################
+#-------------Request Dependencies-------------
+##############################################
+
+from fastapi import HTTPException, Request
+
+from tools.compute_executor import ComputeExecutorFull
+from tools.search_filters import parse_filter_time
+
+# Components needed by every text or image search
+SEARCH_COMPONENTS = ['model', 'annotation', 'encoded_frames', 'CLIP_v0']
+# Components needed only when hashtags are supplied
+HASHTAG_COMPONENTS = ['grafa', 'hashtag_embeddings', 'hashtag_vocabulary', 'hashtag_embedding_index']
+
+def query_components(hiddenHashtags: str,
+                     database_name: str):
+    """
+    List the startup components needed to answer a query.
+
+    Args:
+        hiddenHashtags (str): A comma-separated string of hashtags.
+        database_name (str): The name of the FAISS database to query.
+
+    Returns:
+        list: The names of the components the query depends on.
+    """
+
+    components = SEARCH_COMPONENTS + [database_name]
+    if hiddenHashtags:
+        components += HASHTAG_COMPONENTS
+    return components
+
+def require_components(request: Request,
+                       components: list,
+                       retry_after: int = 5):
+    """
+    Reject the request with a 503 response while any of the given components is not loaded.
+
+    Args:
+        request (Request): The incoming request.
+        components (list): The names of the startup components the request depends on.
+        retry_after (int): The value of the Retry-After header in seconds (default is 5).
+
+    Raises:
+        HTTPException: 503 if a component is still loading or failed to load.
+    """
+
+    missing = request.app.state.startup_loader.missing(components)
+    if missing:
+        raise HTTPException(status_code=503,
+                            detail=f"Not ready: {', '.join(missing)}",
+                            headers={'Retry-After': str(retry_after)})
+
+def validate_time_range(start_time: str,
+                        end_time: str):
+    """
+    Reject the request with a 400 response when a time filter is not a 'HH:MM:SS[.ffffff]' timestamp.
+
+    Args:
+        start_time (str): The lower bound of the time filter ('' for none).
+        end_time (str): The upper bound of the time filter ('' for none).
+
+    Raises:
+        HTTPException: 400 if either bound is malformed.
+    """
+
+    for name, timestamp in [('start_time', start_time), ('end_time', end_time)]:
+        if not timestamp:
+            continue
+        try:
+            parse_filter_time(timestamp)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"{name}: {e}")
+
+async def run_compute(request: Request,
+                      fn,
+                      *args,
+                      retry_after: int = 2,
+                      **kwargs):
+    """
+    Run a blocking search stage on the shared compute executor, off the event loop.
+
+    Args:
+        request (Request): The incoming request.
+        fn (callable): The blocking function to run.
+        *args, **kwargs: The arguments of `fn`.
+        retry_after (int): The value of the Retry-After header in seconds (default is 2).
+
+    Returns:
+        The result of `fn`.
+
+    Raises:
+        HTTPException: 503 if the executor queue is full.
+    """
+
+    try:
+        return await request.app.state.compute_executor.run(fn, *args, **kwargs)
+    except ComputeExecutorFull as e:
+        raise HTTPException(status_code=503,
+                            detail=f"Server busy: {e}",
+                            headers={'Retry-After': str(retry_after)})
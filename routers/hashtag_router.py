@@ -0,0 +1,30 @@
+##############################################
+#-------------GET Request Routes--------------
+##############################################
+
+from fastapi import APIRouter, Request, Query
+from fastapi.responses import JSONResponse
+
+from routers.dependencies import require_components
+
+router = APIRouter()
+
+# Configure logging to output to the notebook
+import logging
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+@router.get("/hashtags/suggest")
+async def suggest_hashtags(request: Request,
+                           prefix: str = '',
+                           limit: int = Query(10, ge=1, le=100)):
+    """
+    Autocomplete a hashtag: the vocabulary hashtags starting with `prefix`, most frequent in the graph first.
+    """
+
+    require_components(request, ['hashtag_suggester'], retry_after=2)
+    suggestions = request.app.state.hashtag_suggester.suggest(prefix, limit)
+    return JSONResponse(content={'prefix': prefix,
+                                 'suggestions': [{'hashtag': hashtag, 'degree': degree}
+                                                 for hashtag, degree in suggestions]})
@@ -0,0 +1,61 @@
+##############################################
+#-------------GET Request Routes--------------
+##############################################
+
+import time
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+
+from database.startup_loader import current_rss_mb
+from tools.hashtags_generating import hashtag_cache_stats
+from tools.stage_graph import stage_stats
+
+router = APIRouter()
+
+# Configure logging to output to the notebook
+import logging
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+@router.get("/healthz")
+async def healthz(request: Request):
+    """
+    Liveness probe: the process is up and serving, whatever the state of the databases.
+    """
+
+    loader = request.app.state.startup_loader
+    return JSONResponse(content={'status': 'ok',
+                                 'uptime': time.time() - loader.started_at,
+                                 'rss_mb': current_rss_mb(),
+                                 'components': loader.report()})
+
+@router.get("/readyz")
+async def readyz(request: Request):
+    """
+    Readiness probe: 200 once every required component is loaded, 503 otherwise.
+    Background components (e.g. the GRAFA graph) are reported but do not gate readiness.
+    """
+
+    loader = request.app.state.startup_loader
+    ready = loader.ready()
+    return JSONResponse(status_code=200 if ready else 503,
+                        content={'ready': ready,
+                                 'components': {name: component['status']
+                                                for name, component in loader.report().items()}})
+
+@router.get("/metrics")
+async def metrics(request: Request):
+    """
+    Runtime counters of the caches and services shared by the search pipeline.
+    """
+
+    text_encode_scheduler = request.app.state.text_encode_scheduler
+    return JSONResponse(content={'rss_mb': current_rss_mb(),
+                                 'text_embedding_cache': request.app.state.text_embedding_cache.stats(),
+                                 'traversal_cache': request.app.state.traversal_cache.stats(),
+                                 'similar_hashtag_cache': request.app.state.similar_hashtag_cache.stats(),
+                                 'hashtag_generation_cache': hashtag_cache_stats(),
+                                 'pipeline_stages': stage_stats.stats(),
+                                 'text_encode_scheduler': text_encode_scheduler.stats() if text_encode_scheduler else None,
+                                 'compute_executor': request.app.state.compute_executor.stats()})
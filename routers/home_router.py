@@ -2,12 +2,10 @@ from fastapi import APIRouter, Request, Form
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse, RedirectResponse
 
-from tools.immediate_refining import immediate_refining
-from tools.aggregated_refining import aggregated_refining
-from tools.results_display import display_option_results
 from tools.utils import remove_first_n_elements
 
-from tools.search_utils import cached_results, paginate_results
+from tools.search_utils import search_and_refine, paginate_results
+from routers.dependencies import query_components, require_components, run_compute, validate_time_range
 
 # Pass templates location to all views in FastAPI
 templates = Jinja2Templates(directory = 'templates')
@@ -49,45 +47,25 @@ async def post_home(request: Request,
                     images_per_page: int = Form(50),
                     session_id: str = Form(None),
                     refine_status: bool = Form(False),
+                    video_ID: str = Form(''),
+                    start_time: str = Form(''),
+                    end_time: str = Form(''),
                     ):
 
-    device = request.app.state.device
-    image_info_dict = request.app.state.image_info_dict
-    encoded_frames = request.app.state.encoded_frames
-    clipv0_hnsw = request.app.state.clipv0_hnsw
+    validate_time_range(start_time, end_time)
+    require_components(request, query_components(hiddenHashtags, database_name))
+
     FEEDBACK_STORE = request.app.state.FEEDBACK_STORE
 
     logger.info(f"Submitting feedback for session_id: {session_id}")
-    results, hiddenInitialDBIdx, hiddenInitialDBScore = cached_results(query_text, hiddenHashtags,
-                                                                       database_name, k, display_option,
-                                                                       request.app)
-    logger.info(f"hiddenInitialDBIdx: {hiddenInitialDBIdx}")
-
-    if session_id in FEEDBACK_STORE:
-      feedback_status = FEEDBACK_STORE[session_id]
-    else:
-      feedback_status = {}
-
-    if refine_status == False and feedback_status:
-      logger.info(f"Received feedback: {feedback_status}")
-      refined_DBScore, refined_DBIdx = immediate_refining(hiddenInitialDBIdx, hiddenInitialDBScore,
-                                                          feedback_status, encoded_frames,)
-      results = display_option_results(display_option,
-                                      refined_DBScore, refined_DBIdx,
-                                      image_info_dict)
-      logger.info(f"hiddenRefinedDBIdx: {refined_DBIdx}")
-
-    else:
-      logger.info(f"Received feedback: {feedback_status}")
-      logger.info(f"Refine status: {refine_status}")
-      aggregated_DBScore, aggregated_DBIdx = aggregated_refining(hiddenInitialDBIdx, hiddenInitialDBScore,
-                                                                  feedback_status, encoded_frames, clipv0_hnsw, device,
-                                                                  exploration_ratio=0.2, original_weight=0.7,
-                                                                  decay_factor=0.9, window_size=50, time_weight_ratio=0.5,)
-      results = display_option_results(display_option,
-                                      aggregated_DBScore, aggregated_DBIdx,
-                                      image_info_dict)
-      logger.info(f"hiddenAggreatedDBIdx: {aggregated_DBIdx}")
+    # A snapshot: /submit_feedback may update the session's feedback while the refinement runs on another thread
+    feedback_status = dict(FEEDBACK_STORE.get(session_id, {}))
+
+    # Search and refine on the compute executor so the event loop keeps serving other requests
+    results = await run_compute(request, search_and_refine,
+                                query_text, hiddenHashtags, database_name, k, display_option,
+                                feedback_status, refine_status, request.app,
+                                video_ID, start_time, end_time)
 
     #save space
     if len(FEEDBACK_STORE) >= 100:
@@ -105,6 +83,9 @@ async def post_home(request: Request,
         'database_name': database_name,
         'display_option': display_option,
         'k': k,
+        'video_ID': video_ID,
+        'start_time': start_time,
+        'end_time': end_time,
         'paginated_results': paginated_results,
         'page': page,
         'images_per_page': images_per_page,
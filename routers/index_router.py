@@ -0,0 +1,96 @@
+##############################################
+#-------------Index Registry Routes-------------
+##############################################
+
+import os
+from fastapi import APIRouter, Request, Form, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+
+from tools.search_utils import cached_results, perform_search
+from database.db_init import load_generation
+from database.generation import read_generation
+
+router = APIRouter()
+
+# Configure logging to output to the notebook
+import logging
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Index files can only be reloaded from the database directory
+DATABASE_DIR = os.path.realpath('database')
+
+@router.get("/indexes")
+async def list_indexes(request: Request):
+    return JSONResponse(content=request.app.state.index_registry.stats())
+
+@router.post("/indexes/{database_name}/reload")
+async def reload_index(request: Request,
+                       database_name: str,
+                       database_path: str = Form('')):
+    """
+    Atomically swap a FAISS index for a new file (or re-read the current one) without a restart.
+
+    This is an unauthenticated admin route: do not expose it publicly (serve it on an internal interface only).
+
+    Reloading CLIP_v0 drops the precomputed frame neighbors: they serve again after a rebuild
+    (`python -m database.frame_knn_store`) and a restart.
+    """
+
+    index_registry = request.app.state.index_registry
+    if database_path and os.path.commonpath([DATABASE_DIR, os.path.realpath(database_path)]) != DATABASE_DIR:
+        raise HTTPException(status_code=400, detail="The index file must be inside the database directory.")
+    # Only registered databases can be reloaded: an unknown name would register a new database
+    if database_name not in index_registry.databases:
+        raise HTTPException(status_code=404, detail=f"Unknown database {database_name}.")
+
+    logger.info(f"Reloading index {database_name} from {database_path or 'its current path'}")
+    try:
+        await run_in_threadpool(index_registry.reload, database_name, database_path or None)
+    except Exception as e:
+        logger.error(f"Error reloading index {database_name}: {e}")
+        raise HTTPException(status_code=500, detail=f"Could not load the index: {e}")
+
+    # Cached results were computed on the previous index
+    cached_results.cache_clear()
+    perform_search.cache_clear()
+    if database_name == 'CLIP_v0':
+        # The precomputed frame neighbors were searched on the previous index
+        request.app.state.frame_knn = None
+    return JSONResponse(content=index_registry.stats()[database_name])
+
+@router.get("/generation")
+async def get_generation(request: Request):
+    """
+    Report the ingestion generation being served and the latest published one.
+    """
+
+    serving = request.app.state.generation
+    latest = read_generation()
+    return JSONResponse(content={'serving': serving['generation'] if serving else 0,
+                                 'latest': latest['generation'] if latest else 0,
+                                 'n_frames': serving['n_frames'] if serving else None})
+
+@router.post("/generation/reload")
+async def reload_generation(request: Request):
+    """
+    Pick up the latest ingestion generation (new frames, annotations, graph and indexes) without a restart.
+    """
+
+    state = request.app.state
+    if state.device is None:
+        raise HTTPException(status_code=503, detail="The model is still loading.")
+    logger.info("Reloading the latest ingestion generation")
+    try:
+        generation = await run_in_threadpool(load_generation, state, state.index_registry)
+    except Exception as e:
+        logger.error(f"Error reloading the generation: {e}")
+        raise HTTPException(status_code=500, detail=f"Could not load the generation: {e}")
+
+    # Cached results were computed on the previous generation
+    cached_results.cache_clear()
+    perform_search.cache_clear()
+    state.traversal_cache.clear()
+    return JSONResponse(content={'generation': generation['generation'], 'n_frames': generation['n_frames']})
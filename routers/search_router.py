@@ -17,12 +17,19 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 from tools.search_utils import perform_search
+from routers.dependencies import SEARCH_COMPONENTS, require_components, run_compute, validate_time_range
 
 @router.get("/search/{db_idx}", response_class=HTMLResponse)
 async def search_by_image(request: Request,
-                          db_idx: int):
+                          db_idx: int,
+                          video_ID: str = '',
+                          start_time: str = '',
+                          end_time: str = ''):
 
-    results = perform_search(db_idx, request.app)
+    validate_time_range(start_time, end_time)
+    require_components(request, SEARCH_COMPONENTS)
+    results = await run_compute(request, perform_search, db_idx, request.app,
+                                video_ID, start_time, end_time)
 
     logger.info("The retrieval process is completed!!!")
     return templates.TemplateResponse("v0_search_results.html", {
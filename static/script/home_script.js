@@ -111,6 +111,7 @@
         inputField.type = 'text';
         inputField.id = 'newHashtagInput';
         inputField.placeholder = 'Add new hashtag...';
+        inputField.setAttribute('list', 'hashtagSuggestions');
         inputField.addEventListener('keypress', function(event) {
             // Allow users to add a hashtag by pressing Enter
             if (event.key === 'Enter') {
@@ -118,7 +119,41 @@
                 addHashtag();
             }
         });
+        // Suggest in-vocabulary hashtags while the user types
+        inputField.addEventListener('input', function() {
+            clearTimeout(suggestTimer);
+            suggestTimer = setTimeout(() => fetchSuggestions(inputField.value.trim()), 100);
+        });
         hashtagsContainer.appendChild(inputField);
+
+        // The suggestion list attached to the input field
+        const suggestionList = document.createElement('datalist');
+        suggestionList.id = 'hashtagSuggestions';
+        hashtagsContainer.appendChild(suggestionList);
+    }
+
+    // Fetch the most frequent vocabulary hashtags starting with the typed prefix
+    let suggestTimer = null;
+    function fetchSuggestions(prefix) {
+        const suggestionList = document.getElementById('hashtagSuggestions');
+        if (!suggestionList) {
+            return;
+        }
+        if (!prefix.replace('#', '')) {
+            suggestionList.innerHTML = '';
+            return;
+        }
+        fetch(`/hashtags/suggest?prefix=${encodeURIComponent(prefix)}&limit=10`)
+        .then(response => response.ok ? response.json() : { suggestions: [] })
+        .then(data => {
+            suggestionList.innerHTML = '';
+            data.suggestions.forEach(suggestion => {
+                const option = document.createElement('option');
+                option.value = suggestion.hashtag;
+                suggestionList.appendChild(option);
+            });
+        })
+        .catch(error => console.error('Error:', error)); // Handle any errors from the fetch request
     }
 
     // Add a new hashtag to the list
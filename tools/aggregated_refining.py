@@ -10,7 +10,8 @@ def aggregated_refining(refined_indices, refined_scores,
                         feedback_status, encoded_frames, 
                         clipv0_hnsw, device,
                         exploration_ratio=0.2, original_weight=0.7,
-                        decay_factor=0.9, window_size=50, time_weight_ratio=0.5,):
+                        decay_factor=0.9, window_size=50, time_weight_ratio=0.5,
+                        frame_knn=None):
     
     """
     Refines a list of indices and their associated scores by incorporating user feedback and applying an 
@@ -20,7 +21,7 @@ def aggregated_refining(refined_indices, refined_scores,
         refined_indices (list): List of indices corresponding to refined items (e.g., recommended items).
         refined_scores (list): List of scores corresponding to the items in `refined_indices`.
         feedback_status (list): List representing user feedback for each item (positive, neutral, negative).
-        encoded_frames (tensor): Encoded features or frames to be used in the exploration process.
+        encoded_frames (EmbeddingStore): Encoded features or frames to be used in the exploration process.
         clipv0_hnsw (faiss.Index): FAISS index used for nearest-neighbor retrieval in the exploration process.
         device (str): Device where operations are performed ("cpu" or "cuda").
         exploration_ratio (float, optional): Factor controlling the balance between exploration and exploitation 
@@ -29,6 +30,8 @@ def aggregated_refining(refined_indices, refined_scores,
         decay_factor (float, optional): Controls how feedback influence decays over time (default is 0.9).
         window_size (int, optional): Number of recent interactions considered for feedback (default is 50).
         time_weight_ratio (float, optional): Weight applied to time-sensitive feedback adjustments (default is 0.5).
+        frame_knn (FrameKnnStore, optional): Precomputed frame neighbors used by the exploration instead of
+                                             live FAISS searches.
 
     Returns:
         list: Refined and adjusted scores based on feedback and exploration.
@@ -52,7 +55,7 @@ def aggregated_refining(refined_indices, refined_scores,
     # Step 1: Apply exploration to the refined scores using the diverse exploration method
     new_refined_scores, new_refined_indexes = diverse_exploration(refined_indices, refined_scores, feedback_status, 
                                                                   encoded_frames, clipv0_hnsw, device, k_num,
-                                                                  exploration_ratio, original_weight)
+                                                                  exploration_ratio, original_weight, frame_knn)
 
     # Step 2: If no feedback is available, return the newly refined scores and indices
     if not feedback_status:
@@ -0,0 +1,110 @@
+##############################################
+#--------------Helper Functions---------------
+##############################################
+
+# tools/compute_executor.py
+
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import logging
+# Set up logging
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+class ComputeExecutorFull(RuntimeError):
+    """
+    Raised when the compute executor already holds as many jobs as it accepts.
+    """
+
+class ComputeExecutor:
+    """
+    A size-limited thread pool for the blocking search stages (torch, FAISS and graph traversal).
+
+    Request handlers `await executor.run(fn, ...)` instead of calling `fn` on the event loop, so one slow query
+    no longer stalls the cheap requests served by the same worker. At most `max_workers` jobs run at once and at
+    most `max_queue` more wait for a thread; beyond that `run` raises `ComputeExecutorFull` right away so the
+    caller can answer 503 instead of piling up work it cannot finish in time. torch, FAISS and the graph code
+    release the GIL in their heavy loops, so threads (which share the loaded databases) are used rather than
+    processes.
+
+    Args:
+        max_workers (int): The number of compute threads (default is 4).
+        max_queue (int): The number of jobs allowed to wait for a thread (default is 16).
+    """
+
+    def __init__(self, max_workers=4, max_queue=16):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='compute')
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.in_flight = 0
+        self.running = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_queue_wait_ms = 0.0
+        self.total_run_ms = 0.0
+
+    def _call(self, submitted_at, fn, args, kwargs):
+        started_at = time.time()
+        with self._lock:
+            self.running += 1
+            self.total_queue_wait_ms += (started_at - submitted_at) * 1000
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.in_flight -= 1
+                self.completed += 1
+                self.total_run_ms += (time.time() - started_at) * 1000
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Queue a job, or raise `ComputeExecutorFull` if the queue limit is reached.
+
+        Returns:
+            concurrent.futures.Future: The future of the job.
+        """
+
+        with self._lock:
+            if self.in_flight >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise ComputeExecutorFull(f"{self.in_flight} compute jobs already queued or running.")
+            self.in_flight += 1
+            self.submitted += 1
+        return self._executor.submit(self._call, time.time(), fn, args, kwargs)
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Run a blocking job on the pool and await its result without blocking the event loop.
+        """
+
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def stats(self):
+        with self._lock:
+            return {'max_workers': self.max_workers,
+                    'max_queue': self.max_queue,
+                    'running': self.running,
+                    'queue_depth': self.in_flight - self.running,
+                    'submitted': self.submitted,
+                    'completed': self.completed,
+                    'failed': self.failed,
+                    'rejected': self.rejected,
+                    'mean_queue_wait_ms': self.total_queue_wait_ms / self.completed if self.completed else 0.0,
+                    'mean_run_ms': self.total_run_ms / self.completed if self.completed else 0.0}
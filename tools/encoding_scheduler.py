@@ -0,0 +1,149 @@
+##############################################
+#--------------Helper Functions---------------
+##############################################
+
+# tools/encoding_scheduler.py
+
+import time
+import queue
+import threading
+
+import logging
+# Set up logging
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+class _EncodeRequest:
+    def __init__(self, texts):
+        self.texts = texts
+        self.submitted_at = time.time()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class TextEncodeScheduler:
+    """
+    Micro-batch CLIP text encoding across concurrent requests.
+
+    Handlers call `encode(texts)` from their own threads. A single worker thread collects the pending requests
+    for up to `max_wait_ms` after the first one arrives (or until `max_batch_size` texts are pending), runs one
+    batched forward pass and hands every caller back its own rows. On CPU this trades a few milliseconds of
+    latency for much higher throughput than many batch-of-one passes.
+
+    Args:
+        model (CLIP model): The CLIP model used for encoding.
+        device (torch.device): The device (CPU or CUDA) to run the model on.
+        encode_fn (callable): Called as `encode_fn(model, device, texts)` to run the forward pass.
+        max_batch_size (int): The maximum number of texts per forward pass (default is 64).
+        max_wait_ms (float): How long to wait for more requests after the first one (default is 5).
+    """
+
+    HISTOGRAM_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+    def __init__(self, model, device, encode_fn, max_batch_size=64, max_wait_ms=5):
+        self.model = model
+        self.device = device
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.requests = 0
+        self.batches = 0
+        self.texts = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_observed_ms = 0.0
+        self.batch_size_histogram = {bucket: 0 for bucket in self.HISTOGRAM_BUCKETS + (float('inf'),)}
+
+        self._worker = threading.Thread(target=self._run, name='text-encode-scheduler', daemon=True)
+        self._worker.start()
+
+    def encode(self, texts):
+        """
+        Encode texts in the next batch and block until their features are ready.
+
+        Returns:
+            torch.Tensor: A (len(texts), dim) tensor of raw text features.
+        """
+
+        request = _EncodeRequest(list(texts))
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _collect(self):
+        # Block for the first request, then gather more until the window closes or the batch is full
+        batch = [self._queue.get()]
+        n_texts = len(batch[0].texts)
+        deadline = time.time() + self.max_wait_ms / 1000
+        while n_texts < self.max_batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            n_texts += len(request.texts)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started_at = time.time()
+            texts = [text for request in batch for text in request.texts]
+            try:
+                features = self.encode_fn(self.model, self.device, texts)
+                start = 0
+                for request in batch:
+                    request.result = features[start:start + len(request.texts)]
+                    start += len(request.texts)
+            except Exception as e:
+                logger.error(f"Error encoding a batch of {len(texts)} texts: {e}")
+                for request in batch:
+                    request.error = e
+            self._record(batch, len(texts), started_at)
+            for request in batch:
+                request.done.set()
+
+    def _record(self, batch, n_texts, started_at):
+        with self._lock:
+            self.requests += len(batch)
+            self.batches += 1
+            self.texts += n_texts
+            for request in batch:
+                wait_ms = (started_at - request.submitted_at) * 1000
+                self.total_wait_ms += wait_ms
+                self.max_wait_observed_ms = max(self.max_wait_observed_ms, wait_ms)
+            bucket = next(bucket for bucket in self.batch_size_histogram if n_texts <= bucket)
+            self.batch_size_histogram[bucket] += 1
+
+    def stats(self):
+        with self._lock:
+            return {'max_batch_size': self.max_batch_size,
+                    'max_wait_ms': self.max_wait_ms,
+                    'queue_depth': self._queue.qsize(),
+                    'requests': self.requests,
+                    'batches': self.batches,
+                    'texts': self.texts,
+                    'mean_batch_size': self.texts / self.batches if self.batches else 0.0,
+                    'mean_added_wait_ms': self.total_wait_ms / self.requests if self.requests else 0.0,
+                    'max_added_wait_ms': self.max_wait_observed_ms,
+                    'batch_size_histogram': {(f'>{self.HISTOGRAM_BUCKETS[-1]}' if bucket == float('inf') else f'<={bucket}'): count
+                                             for bucket, count in self.batch_size_histogram.items()}}
+
+# The process-wide scheduler used by the text encoders (None encodes in the caller's thread)
+_text_encode_scheduler = None
+
+def set_text_encode_scheduler(scheduler):
+    global _text_encode_scheduler
+    _text_encode_scheduler = scheduler
+
+def get_text_encode_scheduler():
+    return _text_encode_scheduler
@@ -4,10 +4,85 @@
 
 # tools/faiss_retrieval.py
 import numpy as np
+import faiss
+
+# Adaptive efSearch policy: explore EF_SEARCH_FACTOR candidates per requested neighbor, between EF_SEARCH_MIN and
+# EF_SEARCH_MAX, and never fewer than the efSearch saved in the index file
+EF_SEARCH_MIN = 64
+EF_SEARCH_FACTOR = 2
+EF_SEARCH_MAX = 1024
+
+# Filtered searches switch to exact brute force over the matching rows when at most BRUTE_FORCE_MAX_ROWS rows
+# (or less than BRUTE_FORCE_FRACTION of the index) match: HNSW then mostly walks through rejected nodes
+BRUTE_FORCE_MAX_ROWS = 20000
+BRUTE_FORCE_FRACTION = 0.02
+
+def adaptive_ef_search(k_nums, 
+                       index_ef_search=0, 
+                       ef_min=EF_SEARCH_MIN, ef_factor=EF_SEARCH_FACTOR, ef_max=EF_SEARCH_MAX):
+    """
+    Scales the HNSW efSearch with the number of requested neighbors. HNSW cannot return more than efSearch
+    neighbors, and its recall at k drops quickly once k gets close to efSearch.
+
+    Args:
+        k_nums (int): The number of nearest neighbors to retrieve.
+        index_ef_search (int): The efSearch saved in the index file, used as a lower bound (default is 0).
+        ef_min (int): The smallest efSearch used (default is EF_SEARCH_MIN).
+        ef_factor (float): The number of candidates explored per requested neighbor (default is EF_SEARCH_FACTOR).
+        ef_max (int): The largest efSearch used, unless k itself is larger (default is EF_SEARCH_MAX).
+
+    Returns:
+        int: The efSearch to use.
+    """
+
+    ef_search = min(max(ef_min, int(ef_factor * k_nums)), ef_max)
+    return max(ef_search, index_ef_search, k_nums)
+
+def hnsw_search_parameters(index_hnsw, 
+                           k_nums, 
+                           ef_search=None, 
+                           selector=None):
+    """
+    Builds per-request FAISS search parameters, leaving the shared index untouched so concurrent queries can
+    use different efSearch values.
+
+    Args:
+        index_hnsw (faiss.Index): The FAISS index for retrieval.
+        k_nums (int): The number of nearest neighbors to retrieve.
+        ef_search (int, optional): A fixed efSearch; by default it follows `adaptive_ef_search`.
+        selector (faiss.IDSelector, optional): Restricts the search to the selected ids.
+
+    Returns:
+        faiss.SearchParameters: The search parameters, or None for an unfiltered search of a non-HNSW index.
+    """
+
+    if not isinstance(index_hnsw, faiss.IndexHNSW):
+        if selector is None:
+            return None
+        # IVF indexes only accept IVF search parameters
+        ivf_index = faiss.try_extract_index_ivf(index_hnsw) if isinstance(index_hnsw, faiss.Index) else None
+        if ivf_index is not None:
+            return faiss.SearchParametersIVF(sel=selector, nprobe=ivf_index.nprobe)
+        return faiss.SearchParameters(sel=selector)
+    if ef_search is None:
+        ef_search = adaptive_ef_search(k_nums, index_hnsw.hnsw.efSearch)
+    if selector is not None:
+        return faiss.SearchParametersHNSW(efSearch=int(ef_search), sel=selector)
+    return faiss.SearchParametersHNSW(efSearch=int(ef_search))
+
+def id_selector(row_ids):
+    """
+    Builds a FAISS id selector from sorted database indices: a range test when the indices are contiguous
+    (e.g. the frames of one video), a hash-set lookup otherwise.
+    """
+
+    if len(row_ids) and row_ids[-1] - row_ids[0] + 1 == len(row_ids):
+        return faiss.IDSelectorRange(int(row_ids[0]), int(row_ids[-1]) + 1)
+    return faiss.IDSelectorBatch(np.ascontiguousarray(row_ids, dtype=np.int64))
 
 def k_image_search(query_vector, 
                    index_hnsw, 
-                   device, k_nums=5):
+                   device, k_nums=5, ef_search=None):
     """
     Retrieves the k-nearest images to the query vector using the FAISS library with an HNSW (Hierarchical Navigable 
     Small World) index. This function is typically used for fast approximate nearest neighbor search in high-dimensional
@@ -22,6 +97,8 @@ def k_image_search(query_vector,
                       will handle the data accordingly to ensure compatibility with the FAISS index.
         k_nums (int): The number of nearest neighbors to retrieve. Default is 5, but this can be adjusted depending 
                       on how many neighbors you need for your specific use case.
+        ef_search (int, optional): The HNSW efSearch of this search. By default it scales with `k_nums`
+                                   (see `adaptive_ef_search`).
 
     Returns:
         tuple: A tuple containing:
@@ -52,11 +129,152 @@ def k_image_search(query_vector,
 
     # Step 2: Perform k-nearest neighbor search on the HNSW index using FAISS
     distances_hnsw, indices_hnsw = index_hnsw.search(vector_data, 
-                                                     k_nums)
+                                                     k_nums, 
+                                                     params=hnsw_search_parameters(index_hnsw, k_nums, ef_search))
 
     # Step 3: Filter out invalid indices (-1) from the search results
     valid_indexs = [idx for idx in indices_hnsw[0] if idx != -1]  # Filter out invalid indices
     valid_distances = distances_hnsw[0][:len(valid_indexs)]  # Get distances corresponding to valid indices
 
     # Step 4: Return valid distances and valid indices as a tuple
-    return valid_distances, valid_indexs
\ No newline at end of file
+    return valid_distances, valid_indexs
+
+def k_image_search_batch(query_vectors, 
+                         index_hnsw, 
+                         device, k_nums=5, ef_search=None):
+    """
+    Retrieves the k-nearest images of several query vectors with a single FAISS search call, so that FAISS can
+    spread the queries over its OpenMP threads instead of paying the Python and dispatch overhead once per query.
+
+    Args:
+        query_vectors (torch.Tensor): An (n, d) matrix of query vectors (embeddings), one per row.
+        index_hnsw (faiss.Index): The FAISS index for retrieval.
+        device (str): The device where the query vectors are located ("cpu" or "cuda").
+        k_nums (int): The number of nearest neighbors to retrieve per query. Default is 5.
+        ef_search (int, optional): The HNSW efSearch of this search (default follows `adaptive_ef_search`).
+
+    Returns:
+        tuple: A tuple containing:
+               - valid_distances (list): For each query, the distances to its nearest neighbors.
+               - valid_indices (list): For each query, the indices of its nearest neighbors.
+               Both are filtered of invalid (-1) results exactly like `k_image_search`.
+
+    Process:
+        1. Convert the query matrix to a float32 NumPy array.
+        2. Search all queries at once in the index.
+        3. Filter out the invalid indices (-1) of each row together with their distances.
+    """
+
+    # Step 1: Convert the query matrix to NumPy, as FAISS operates on CPU-compatible data
+    if hasattr(query_vectors, 'cpu'):
+        vector_data = query_vectors.detach().cpu().numpy()
+    else:
+        vector_data = query_vectors
+    vector_data = np.ascontiguousarray(vector_data, dtype=np.float32)
+
+    if len(vector_data) == 0:
+        return [], []
+
+    # Step 2: Perform k-nearest neighbor search for all queries in one call
+    distances_hnsw, indices_hnsw = index_hnsw.search(vector_data, 
+                                                     k_nums, 
+                                                     params=hnsw_search_parameters(index_hnsw, k_nums, ef_search))
+
+    # Step 3: Filter out invalid indices (-1) row by row
+    valid_distances = []
+    valid_indexs = []
+    for distances, indices in zip(distances_hnsw, indices_hnsw):
+        row_indexs = [idx for idx in indices if idx != -1]
+        valid_indexs.append(row_indexs)
+        valid_distances.append(distances[:len(row_indexs)])
+
+    return valid_distances, valid_indexs
+
+
+def brute_force_search(query_vector, 
+                       index_hnsw, 
+                       row_ids, k_nums=5, chunk_size=65536):
+    """
+    Exact k-nearest neighbor search restricted to some database indices, using the vectors stored in the index.
+
+    Args:
+        query_vector (np.ndarray): A (1, d) float32 query vector.
+        index_hnsw (faiss.Index): The FAISS index holding the vectors (it must support `reconstruct_batch`).
+        row_ids (np.ndarray): The sorted database indices to search.
+        k_nums (int): The number of nearest neighbors to retrieve. Default is 5.
+        chunk_size (int): The number of vectors reconstructed at a time (default is 65536).
+
+    Returns:
+        tuple: The distances and indices of the nearest rows, ordered like a FAISS search with the index metric.
+    """
+
+    query = query_vector.reshape(-1)
+    distances = np.empty(len(row_ids), dtype=np.float32)
+    for start in range(0, len(row_ids), chunk_size):
+        vectors = index_hnsw.reconstruct_batch(row_ids[start:start + chunk_size])
+        if index_hnsw.metric_type == faiss.METRIC_INNER_PRODUCT:
+            distances[start:start + chunk_size] = vectors @ query
+        else:
+            distances[start:start + chunk_size] = ((vectors - query) ** 2).sum(axis=1)
+
+    # Larger is better for inner product, smaller for L2
+    order_keys = -distances if index_hnsw.metric_type == faiss.METRIC_INNER_PRODUCT else distances
+    k_nums = min(k_nums, len(row_ids))
+    top = np.argpartition(order_keys, k_nums - 1)[:k_nums] if k_nums < len(row_ids) else np.arange(len(row_ids))
+    top = top[np.argsort(order_keys[top], kind='stable')]
+    return distances[top], [idx for idx in row_ids[top]]
+
+def k_image_search_filtered(query_vector, 
+                            index_hnsw, 
+                            device, k_nums=5, 
+                            row_ids=None, ef_search=None):
+    """
+    Retrieves the k-nearest images to the query vector among the allowed database indices (e.g. the frames of a
+    video or a time range), applying the filter inside the FAISS search instead of discarding results afterwards.
+
+    Args:
+        query_vector (torch.Tensor): The query vector (embedding) to search for.
+        index_hnsw (faiss.Index): The FAISS index for retrieval.
+        device (str): The device where the query vector is located ("cpu" or "cuda").
+        k_nums (int): The number of nearest neighbors to retrieve. Default is 5.
+        row_ids (np.ndarray, optional): The sorted allowed database indices (None searches the whole index).
+        ef_search (int, optional): The HNSW efSearch of this search (default follows `adaptive_ef_search`).
+
+    Returns:
+        tuple: The valid distances and valid indices, as returned by `k_image_search`.
+
+    Process:
+        1. Without a filter, fall back to `k_image_search`.
+        2. When few rows match, rank them exactly with `brute_force_search`.
+        3. Otherwise, search the index with an id selector of the allowed rows.
+    """
+
+    if row_ids is None:
+        return k_image_search(query_vector, index_hnsw, device, k_nums=k_nums, ef_search=ef_search)
+    if len(row_ids) == 0:
+        return np.empty(0, dtype=np.float32), []
+
+    # Step 1: Convert the query vector to a float32 NumPy array
+    if hasattr(query_vector, 'cpu'):
+        vector_data = query_vector.detach().cpu().numpy()
+    else:
+        vector_data = query_vector
+    vector_data = np.ascontiguousarray(vector_data, dtype=np.float32).reshape(1, -1)
+
+    # A sharded index restricts each shard to its own allowed rows and skips the shards without any
+    if hasattr(index_hnsw, 'search_filtered'):
+        return index_hnsw.search_filtered(vector_data, k_nums, row_ids, ef_search)
+
+    # Step 2: Exact search when the filter is selective
+    if len(row_ids) <= max(BRUTE_FORCE_MAX_ROWS, BRUTE_FORCE_FRACTION * index_hnsw.ntotal):
+        return brute_force_search(vector_data, index_hnsw, row_ids, k_nums)
+
+    # Step 3: Filtered search inside the index (the selector must outlive the search)
+    selector = id_selector(row_ids)
+    distances_hnsw, indices_hnsw = index_hnsw.search(vector_data, 
+                                                     k_nums, 
+                                                     params=hnsw_search_parameters(index_hnsw, k_nums, ef_search,
+                                                                                   selector))
+    valid_indexs = [idx for idx in indices_hnsw[0] if idx != -1]
+    valid_distances = distances_hnsw[0][:len(valid_indexs)]
+    return valid_distances, valid_indexs
@@ -9,7 +9,7 @@ import torch.nn.functional as F
 import random
 import numpy as np
 from collections import OrderedDict
-from tools.faiss_retrieval import k_image_search
+from tools.faiss_retrieval import k_image_search, k_image_search_batch
 
 
 def convert2binary_scores(refined_indexes, 
@@ -193,21 +193,25 @@ def max_min_scale(scores):
 def perform_exploit(db_idx: int, 
                     encoded_frames, 
                     clipv0_hnsw, 
-                    device, k_nums = 50):
+                    device, k_nums = 50, frame_knn = None):
     """
     Performs nearest-neighbor retrieval to find items similar to the given index.
 
     Args:
         db_idx (int): Database index for the query item.
-        encoded_frames (torch.Tensor): Encoded frame features for the items.
+        encoded_frames (EmbeddingStore): Encoded frame features for the items.
         clipv0_hnsw (faiss.Index): FAISS index for retrieval.
         device (str): Device used for processing ("cpu" or "cuda").
         k_nums (int, optional): Number of items to retrieve (default is 50).
+        frame_knn (FrameKnnStore, optional): Precomputed frame neighbors, looked up instead of searching.
 
     Returns:
         tuple: Retrieved distances and indices.
     """
 
+    if frame_knn is not None and frame_knn.matches(clipv0_hnsw) and frame_knn.covers(db_idx, k_nums):
+        return frame_knn.neighbors(db_idx, k_nums)
+
     query_vector = encoded_frames[db_idx].unsqueeze(0)
     clipv0_distances, clipv0_indexs = k_image_search(query_vector, 
                                                      clipv0_hnsw, 
@@ -215,10 +219,51 @@ def perform_exploit(db_idx: int,
 
     return clipv0_distances, clipv0_indexs
 
+def perform_exploit_batch(db_indices, 
+                          encoded_frames, 
+                          clipv0_hnsw, 
+                          device, k_nums = 50, frame_knn = None):
+    """
+    Performs nearest-neighbor retrieval for several indices with a single FAISS search.
+
+    Args:
+        db_indices (list): Database indices of the query items.
+        encoded_frames (EmbeddingStore): Encoded frame features for the items.
+        clipv0_hnsw (faiss.Index): FAISS index for retrieval.
+        device (str): Device used for processing ("cpu" or "cuda").
+        k_nums (int, optional): Number of items to retrieve per index (default is 50).
+        frame_knn (FrameKnnStore, optional): Precomputed frame neighbors; only the indices it does not cover
+                                             are searched.
+
+    Returns:
+        tuple: Retrieved distances and indices, one list per query index.
+    """
+
+    clipv0_distances = [None] * len(db_indices)
+    clipv0_indexs = [None] * len(db_indices)
+
+    # Look up the precomputed neighbors first
+    if frame_knn is not None and frame_knn.matches(clipv0_hnsw):
+        for i, db_idx in enumerate(db_indices):
+            if frame_knn.covers(db_idx, k_nums):
+                clipv0_distances[i], clipv0_indexs[i] = frame_knn.neighbors(db_idx, k_nums)
+
+    # Search the remaining indices live, in one FAISS call
+    missing = [i for i, indexs in enumerate(clipv0_indexs) if indexs is None]
+    if missing:
+        query_vectors = encoded_frames[[db_indices[i] for i in missing]]
+        missing_distances, missing_indexs = k_image_search_batch(query_vectors, 
+                                                                 clipv0_hnsw, 
+                                                                 device, k_nums)
+        for i, distances, indexs in zip(missing, missing_distances, missing_indexs):
+            clipv0_distances[i], clipv0_indexs[i] = distances, indexs
+
+    return clipv0_distances, clipv0_indexs
+
 def diverse_exploration(refined_indices, refined_scores, 
                         feedback_status, encoded_frames, 
                         clipv0_hnsw, device, k_nums = 50,
-                        exploration_ratio=0.2, original_weight=0.7):
+                        exploration_ratio=0.2, original_weight=0.7, frame_knn=None):
     """
     Applies exploration to refine scores and indices, balancing feedback and exploration.
 
@@ -226,12 +271,13 @@ def diverse_exploration(refined_indices, refined_scores,
         refined_indices (list): List of refined item indices.
         refined_scores (list): List of corresponding scores.
         feedback_status (dict): User feedback data.
-        encoded_frames (torch.Tensor): Encoded frame features for retrieval.
+        encoded_frames (EmbeddingStore): Encoded frame features for retrieval.
         clipv0_hnsw (faiss.Index): FAISS index for nearest-neighbor retrieval.
         device (str): Device used for processing ("cpu" or "cuda").
         k_nums (int, optional): Number of items for retrieval (default is 50).
         exploration_ratio (float, optional): Exploration ratio (default is 0.2).
         original_weight (float, optional): Weight of original scores in final results (default is 0.7).
+        frame_knn (FrameKnnStore, optional): Precomputed frame neighbors used instead of live searches.
 
     Returns:
         tuple: Refined scores and indices after exploration.
@@ -245,18 +291,26 @@ def diverse_exploration(refined_indices, refined_scores,
     expanded_indexes = []
     expanded_distances = []
 
-    # Perform exploitation for each selected index
+    # Drop the indices that are not in the database before searching them all at once
+    valid_exploit_indices = []
     for idx in exploit_indices:
-        try:
-            clipv0_distances, clipv0_indexes = perform_exploit(idx, 
-                                                               encoded_frames, 
-                                                               clipv0_hnsw, 
-                                                               device, k_nums)
-
-            expanded_indexes.extend(clipv0_indexes)
-            expanded_distances.extend(clipv0_distances)
-        except Exception as e:
-            print(f"Error in perform_search for index {idx}: {str(e)}")
+        if isinstance(idx, (int, np.integer)) and 0 <= idx < len(encoded_frames):
+            valid_exploit_indices.append(idx)
+        else:
+            print(f"Error in perform_search for index {idx}: index out of range")
+
+    # Perform exploitation for all selected indices in one FAISS call
+    try:
+        clipv0_distances, clipv0_indexes = perform_exploit_batch(valid_exploit_indices, 
+                                                                 encoded_frames, 
+                                                                 clipv0_hnsw, 
+                                                                 device, k_nums, frame_knn)
+
+        for distances, indexes in zip(clipv0_distances, clipv0_indexes):
+            expanded_indexes.extend(indexes)
+            expanded_distances.extend(distances)
+    except Exception as e:
+        print(f"Error in perform_search for indices {valid_exploit_indices}: {str(e)}")
 
     # Remove duplicates and preserve order
     expanded_results = OrderedDict((idx, score) for idx, score in zip(expanded_indexes, expanded_distances)
@@ -7,6 +7,8 @@
 import numpy as np
 from collections import defaultdict, deque
 from tools.hashtags_processing import calculate_score, initialize_queue_with_hashtags
+from tools.traversal_cache import weight_vector, merge_traversals
+from database.grafa_store import LABEL_KEYFRAME, LABEL_UNMAPPED
 
 import logging
 # Set up logging
@@ -14,19 +16,19 @@ logging.basicConfig()
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-def retrieve_by_hashtags(sparse_matrix, node_mapping, reverse_node_mapping, G,
+def retrieve_by_hashtags(grafa,
                          query_hashtags, hashtag_embeddings, hashtag_index, clip, device, model, 
                          k_num=5, max_depth=5, alpha=0.7, similarity_num = 10,
-                         min_score_threshold=0.01, max_keyframes=1000, max_iterations=10000):
+                         min_score_threshold=0.01, max_keyframes=1000, max_iterations=10000,
+                         engine='bfs', track_paths=False, traversal_cache=None, postings=None,
+                         similar_cache=None, hashtag_vocabulary=None, lexical_matcher=None, compose_seeds=False):
     """
     Retrieve keyframes based on a list of query hashtags using a graph-based approach called Dynamic Hashtag Exploration.
     Combines neighbor frequency and path information to rank keyframes.
     
     Args:
-    sparse_matrix (scipy.sparse.csr_matrix): Sparse matrix representing the hashtag co-occurrence graph.
-    node_mapping (dict): Maps hashtags to indices in the sparse matrix.
-    reverse_node_mapping (dict): Maps matrix indices back to hashtags.
-    G (networkx.Graph): Graph of hashtag nodes and relationships.
+    grafa (GrafaGraph): CSR graph of hashtag and keyframe nodes, with edge weights and node labels
+                        (see `database/grafa_store.py`); networkx is not needed.
     query_hashtags (list): Initial hashtags to start exploring the graph.
     hashtag_embeddings (dict): Precomputed embeddings for each hashtag.
     hashtag_index (dict): Mapping of hashtags to their respective indices in the embedding matrix.
@@ -40,6 +42,25 @@ def retrieve_by_hashtags(sparse_matrix, node_mapping, reverse_node_mapping, G,
     min_score_threshold (float): Minimum score threshold to include a hashtag (default is 0.01).
     max_keyframes (int): Maximum number of keyframes to retrieve (default is 1000).
     max_iterations (int): Maximum number of iterations to perform (default is 10000).
+    engine (str): 'bfs' walks the graph one hashtag at a time (`traverse_bfs`); 'frontier' propagates whole levels
+                  with array operations over the CSR matrix (`propagate_frontier`) and gives the same results
+                  (default is 'bfs').
+    track_paths (bool): Whether the 'bfs' engine materializes every path as a tuple of hashtags; by default it only
+                        counts unique paths and path lengths, which gives the same scores (see `traverse_bfs`).
+    traversal_cache (TraversalCache, optional): When given, the keyframe weights of single-seed queries are cached
+                                                per seed hashtag (see `traverse_seeds`) (default is None).
+    postings (HashtagPostings, optional): Precomputed top keyframes of hot hashtags; when they cover the query
+                                          (same graph and parameters, k_num <= top M), a single-seed query with
+                                          postings is not traversed (default is None).
+    compose_seeds (bool): Also answer queries with several seeds from the per-seed traversals and postings, summing
+                          the weights of the seeds instead of one joint traversal. This changes the rankings (see
+                          `traverse_seeds` and `python -m tools.graph_engine_benchmark`) (default is False).
+    similar_cache (SimilarHashtagCache, optional): Cache of the similar hashtags resolved for unseen hashtags
+                                                   (default is None).
+    hashtag_vocabulary (StringTable, optional): The hashtag of each row of `hashtag_index`, built once at load time
+                                                (default is None: the keys of `hashtag_embeddings`).
+    lexical_matcher (LexicalHashtagMatcher, optional): Resolves misspelled or plural hashtags before the CLIP
+                                                       similarity search (default is None).
 
     Returns:
     tuple: A tuple containing two lists:
@@ -71,23 +92,148 @@ def retrieve_by_hashtags(sparse_matrix, node_mapping, reverse_node_mapping, G,
     - A list of scores and a list of keyframes, both sorted in descending order.
     """
 
-    # Dictionary to accumulate scores for each keyframe
-    global_weight_dict = defaultdict(float)
-    # Dictionary to store unique paths leading to each keyframe
-    path_dict = defaultdict(set)
-    # Set to track visited hashtags
-    visited = set()
-
-    iteration_count = 0
-    keyframe_count = 0
-
     # Initialize the exploration queue with the given query hashtags
     queue = initialize_queue_with_hashtags(query_hashtags, 
                                            hashtag_embeddings, 
                                            hashtag_index, 
                                            clip, device, model, 
-                                           similarity_num)
+                                           similarity_num,
+                                           similar_cache=similar_cache,
+                                           hashtag_vocabulary=hashtag_vocabulary,
+                                           lexical_matcher=lexical_matcher)
     logger.info(f'Initial hashtags in queue: {list(queue)}')
+    # Resolve the hashtags to node ids (-1 for hashtags that are not in the graph)
+    queue = deque((grafa.node_id(hashtag), depth, path, score) for hashtag, depth, path, score in queue)
+
+    if engine not in ('bfs', 'frontier'):
+        raise ValueError(f"Unsupported graph engine {engine!r}. Choose 'bfs' or 'frontier'.")
+    if postings is not None and not postings.covers(grafa, k_num,
+                                                    max_depth, alpha, min_score_threshold, max_keyframes, max_iterations):
+        logger.info("The hashtag postings do not cover this query, traversing the graph")
+        postings = None
+    # A single seed gives the same weights on its own; several seeds are only composed on request
+    if (traversal_cache is not None or postings is not None) and (compose_seeds or len(queue) == 1):
+        # Postings are truncated to the top M: their totals cover every keyframe of the traversal
+        global_weight_dict, total_weight = traverse_seeds(grafa, [item[0] for item in queue], traversal_cache,
+                                                          engine, max_depth, alpha, min_score_threshold,
+                                                          max_keyframes, max_iterations, postings)
+    else:
+        if engine == 'frontier':
+            global_weight_dict = propagate_frontier(grafa, [item[0] for item in queue],
+                                                    max_depth, alpha, min_score_threshold, max_keyframes,
+                                                    max_iterations)
+        else:
+            global_weight_dict = traverse_bfs(grafa, queue,
+                                              max_depth, alpha, min_score_threshold, max_keyframes, max_iterations,
+                                              track_paths)
+        total_weight = sum(global_weight_dict.values())
+
+    # Normalize scores to make them proportional
+    if total_weight > 0:
+        for keyframe in global_weight_dict:
+            global_weight_dict[keyframe] /= total_weight
+
+    # Sort keyframes by score and select the top k
+    sorted_results = sorted(global_weight_dict.items(), key=lambda x: x[1], reverse=True)
+
+    results = [keyframe for keyframe, _ in sorted_results[:k_num]]
+    scores = [score for _, score in sorted_results[:k_num]]
+
+    # Map keyframe nodes to their database indices
+    indices = [int(grafa.keyframe_ids[keyframe]) for keyframe in results]
+    
+    return scores, indices
+
+def traverse_seeds(grafa, seed_nodes, traversal_cache=None, engine='frontier',
+                   max_depth=5, alpha=0.7, min_score_threshold=0.01, max_keyframes=1000, max_iterations=10000,
+                   postings=None):
+    """
+    Dynamic Hashtag Exploration from each seed hashtag on its own, with precomputed or cached per-seed results.
+
+    Args:
+        grafa (GrafaGraph): The CSR hashtag/keyframe graph.
+        seed_nodes (list): The node ids of the query hashtags (-1 for hashtags that are not in the graph).
+        traversal_cache (TraversalCache, optional): The cache of per-seed keyframe weights.
+        engine (str): The engine traversing the seeds that are not cached ('bfs' or 'frontier').
+        postings (HashtagPostings, optional): The precomputed top keyframes of hot hashtags, used instead of
+                                              traversing them (the caller checks that they cover the query).
+
+    Returns:
+        tuple: The summed raw weight of every keyframe node reached from the seeds, in first-arrival order (only
+               the top M keyframes of the seeds read from postings), and the total raw weight of the traversals
+               (including the keyframes left out of the postings), which normalizes the scores.
+
+    Note:
+        Each seed gets its own visited set and its own `max_keyframes` / `max_iterations` budget, so for several
+        seeds the weights differ from a joint traversal, where the seeds share them: a hashtag reached from two
+        seeds contributes to both, instead of only to the first one. A single seed gives the same weights.
+    """
+
+    vectors = []
+    total_weight = 0.0
+    for seed_node in dict.fromkeys(seed_nodes):
+        if seed_node < 0:
+            continue
+        vector = postings.get(seed_node) if postings is not None else None
+        if vector is not None:
+            vectors.append(vector)
+            total_weight += postings.total_weight(seed_node)
+            continue
+        key = (seed_node, max_depth, alpha, min_score_threshold, max_keyframes, max_iterations)
+        vector = traversal_cache.get_traversal(grafa, key) if traversal_cache is not None else None
+        if vector is None:
+            if engine == 'frontier':
+                weight_dict = propagate_frontier(grafa, [seed_node],
+                                                 max_depth, alpha, min_score_threshold, max_keyframes, max_iterations)
+            else:
+                weight_dict = traverse_bfs(grafa, deque([(seed_node, 0, (), 1.0)]),
+                                           max_depth, alpha, min_score_threshold, max_keyframes, max_iterations,
+                                           track_paths=False)
+            if traversal_cache is not None:
+                vector = traversal_cache.put_traversal(grafa, key, weight_dict)
+            else:
+                vector = weight_vector(weight_dict)
+        vectors.append(vector)
+        total_weight += sum(vector[1].tolist())
+    return merge_traversals(vectors), total_weight
+
+def traverse_bfs(grafa, queue,
+                 max_depth=5, alpha=0.7, min_score_threshold=0.01, max_keyframes=1000, max_iterations=10000,
+                 track_paths=True):
+    """
+    Dynamic Hashtag Exploration, one hashtag at a time (see `retrieve_by_hashtags` for the scoring and the
+    stopping criteria).
+
+    Args:
+        grafa (GrafaGraph): The CSR hashtag/keyframe graph.
+        queue (deque): The seed (node id, depth, path, score) tuples.
+        track_paths (bool): Whether to materialize the paths (default is True). Without them, queue entries carry
+                            the path length instead of the path, and each keyframe keeps a count of unique paths.
+
+    Returns:
+        defaultdict: The raw (unnormalized) weight of every reached keyframe node, in first-arrival order.
+
+    Note:
+        A hashtag is expanded at most once, so all the paths through it end with the same path to it and the paths
+        of two different hashtags differ. The unique paths to a keyframe are therefore counted by adding one the
+        first time each expanded hashtag reaches it, level after level, and the length of a path is the length of
+        its parent's path plus one. Both modes give the same weights.
+    """
+
+    # Dictionary to accumulate scores for each keyframe node
+    global_weight_dict = defaultdict(float)
+    # Dictionary to store unique paths leading to each keyframe node
+    path_dict = defaultdict(set)
+    # Without paths: the number of unique paths to each keyframe and the last hashtag that reached it
+    path_counts = defaultdict(int)
+    last_parent = {}
+    if not track_paths:
+        queue = deque((node, depth, len(path), score) for node, depth, path, score in queue)
+    # Set to track visited hashtag nodes
+    visited = set()
+
+    iteration_count = 0
+    keyframe_count = 0
 
     for depth in range(max_depth):
         # List to store scores of neighbors at the current depth
@@ -96,7 +242,7 @@ def retrieve_by_hashtags(sparse_matrix, node_mapping, reverse_node_mapping, G,
         next_level_queue = deque()
 
         while queue:  # Process the current level of the queue
-            hashtag, current_depth, path, current_score = queue.popleft()
+            hashtag_idx, current_depth, path, current_score = queue.popleft()
 
             # Check stopping criteria
             if current_score < min_score_threshold:
@@ -111,40 +257,47 @@ def retrieve_by_hashtags(sparse_matrix, node_mapping, reverse_node_mapping, G,
             iteration_count += 1
 
             # Skip already visited hashtags
-            if hashtag in visited:
-                continue
-            visited.add(hashtag)
-
-            # Skip hashtags not in the node mapping
-            if hashtag not in node_mapping:
+            if hashtag_idx in visited:
                 continue
+            visited.add(hashtag_idx)
 
-            # Skip invalid indices
-            hashtag_idx = node_mapping[hashtag]
-            if hashtag_idx >= sparse_matrix.shape[0]:
+            # Skip hashtags not in the node mapping and invalid indices
+            if hashtag_idx < 0 or hashtag_idx >= grafa.shape[0]:
                 continue
 
-            # Retrieve and validate neighbors
-            neighbors = sparse_matrix[hashtag_idx].nonzero()[1]
-            valid_neighbors = [(neighbor_idx, reverse_node_mapping.get(neighbor_idx, None))
-                               for neighbor_idx in neighbors if neighbor_idx < sparse_matrix.shape[1]]
+            # Retrieve the neighbors and their edge weights
+            neighbors, weights = grafa.neighbors(hashtag_idx)
 
             # Process each valid neighbor
-            for neighbor_idx, neighbor in valid_neighbors:
-                if neighbor is None:
+            for neighbor, neighbor_freq in zip(neighbors.tolist(), weights.tolist()):
+                label = grafa.node_labels[neighbor]
+                if label == LABEL_UNMAPPED:
                     continue
 
-                new_path = path + (hashtag,)
-                new_score = current_score * calculate_score(G, 
-                                                            hashtag, 
+                if track_paths:
+                    new_path = path + (hashtag_idx,)
+                    path_length = len(new_path)
+                else:
+                    # `path` holds the length of the parent's path
+                    new_path = path_length = path + 1
+                new_score = current_score * calculate_score(None, 
+                                                            hashtag_idx, 
                                                             neighbor, 
-                                                            new_path, 
-                                                            alpha)
+                                                            None, 
+                                                            alpha,
+                                                            neighbor_freq,
+                                                            path_length)
 
-                if G.nodes[neighbor].get('label') == 'keyframe':
+                if label == LABEL_KEYFRAME:
                     # Update keyframe score based on the new score and unique paths
-                    path_dict[neighbor].add(new_path)
-                    unique_paths = len(path_dict[neighbor])
+                    if track_paths:
+                        path_dict[neighbor].add(new_path)
+                        unique_paths = len(path_dict[neighbor])
+                    else:
+                        if last_parent.get(neighbor) != hashtag_idx:
+                            last_parent[neighbor] = hashtag_idx
+                            path_counts[neighbor] += 1
+                        unique_paths = path_counts[neighbor]
                     global_weight_dict[neighbor] += new_score * np.log(1 + unique_paths)
                     keyframe_count += 1
                 else:
@@ -163,18 +316,128 @@ def retrieve_by_hashtags(sparse_matrix, node_mapping, reverse_node_mapping, G,
         if keyframe_count >= max_keyframes or iteration_count >= max_iterations:
             break
 
-    # Normalize scores to make them proportional
-    total_weight = sum(global_weight_dict.values())
-    if total_weight > 0:
-        for keyframe in global_weight_dict:
-            global_weight_dict[keyframe] /= total_weight
+    return global_weight_dict
 
-    # Sort keyframes by score and select the top k
-    sorted_results = sorted(global_weight_dict.items(), key=lambda x: x[1], reverse=True)
+def propagate_frontier(grafa, seed_nodes,
+                       max_depth=5, alpha=0.7, min_score_threshold=0.01, max_keyframes=1000, max_iterations=10000):
+    """
+    Dynamic Hashtag Exploration, one whole level at a time: the frontier of a level is expanded by gathering
+    the CSR rows of its hashtags at once, and scores are propagated with array operations instead of a Python loop
+    per edge. The results are the same as `traverse_bfs`, including the floating-point sums.
 
-    results = [keyframe for keyframe, _ in sorted_results[:k_num]]
-    scores = [score for _, score in sorted_results[:k_num]]
+    Args:
+        grafa (GrafaGraph): The CSR hashtag/keyframe graph.
+        seed_nodes (list): The node ids of the query hashtags (-1 for hashtags that are not in the graph).
 
-    indices = [int(info[0]) for info in results]
-    
-    return scores, indices
\ No newline at end of file
+    Returns:
+        dict: The raw (unnormalized) weight of every reached keyframe node, in first-arrival order.
+
+    Process:
+        1. Drop the frontier entries scoring below `min_score_threshold`; among the others, only the first
+           occurrence of a hashtag that was not visited at an earlier level is expanded.
+        2. Find where the sequential walk would have stopped: at the first entry reached with `max_keyframes`
+           keyframe edges or `max_iterations` entries already processed (from the per-row keyframe degrees).
+        3. Gather the edges of the expanded rows and score them with `calculate_score`'s formula; the path factor
+           only depends on the level.
+        4. Keyframe edges add `score * log(1 + unique_paths)`. A hashtag is expanded at most once, so the number of
+           unique paths to a keyframe is the number of distinct expanded hashtags that reached it so far. The
+           additions run in the order of the sequential walk (`np.add.at`).
+        5. Hashtag edges form the next frontier, reordered so that entries at or above the mean score come first.
+
+    Note:
+        A plain sparse matrix-vector product cannot replace step 4: the `log(1 + unique_paths)` factor depends on
+        the arrival rank of each edge, and the order of the floating-point additions must be kept for identical
+        rankings.
+    """
+
+    indptr = np.asarray(grafa.indptr)
+    indices = grafa.indices
+    data = grafa.data
+    labels = np.asarray(grafa.node_labels)
+    keyframe_degrees = grafa.keyframe_degrees()
+    n_nodes = len(labels)
+    n_rows = grafa.shape[0]
+
+    # calculate_score's path-length factor for each level (the path of a level-d edge has d + 1 hashtags)
+    path_factors = 1 / (1 + np.log(np.arange(1, max_depth + 1)))
+
+    weights = np.zeros(n_nodes, dtype=np.float64)
+    unique_paths = np.zeros(n_nodes, dtype=np.int64)
+    first_arrival = []
+    # The last slot stands for the hashtags that are not in the graph (node id -1)
+    visited = np.zeros(n_nodes + 1, dtype=bool)
+
+    nodes = np.asarray(seed_nodes, dtype=np.int64)
+    scores = np.ones(len(nodes), dtype=np.float64)
+    iteration_count = 0
+    keyframe_count = 0
+
+    for depth in range(max_depth):
+        # Step 1: Frontier entries that are processed, and the first occurrences of unvisited hashtags
+        passing = scores >= min_score_threshold
+        nodes, scores = nodes[passing], scores[passing]
+        slots = np.where(nodes < 0, n_nodes, nodes)
+        first = np.zeros(len(nodes), dtype=bool)
+        first[np.unique(slots, return_index=True)[1]] = True
+        expand = first & ~visited[slots]
+        valid = expand & (nodes >= 0) & (nodes < n_rows)
+
+        # Step 2: Stop where the sequential walk would have stopped
+        keyframe_edges = np.where(valid, keyframe_degrees[np.clip(nodes, 0, n_rows - 1)], 0)
+        keyframes_before = keyframe_count + np.cumsum(keyframe_edges) - keyframe_edges
+        iterations_before = iteration_count + np.arange(len(nodes))
+        stopped = np.flatnonzero((keyframes_before >= max_keyframes) | (iterations_before >= max_iterations))
+        stop = stopped[0] if len(stopped) else len(nodes)
+        iteration_count += int(stop)
+        keyframe_count += int(keyframe_edges[:stop].sum())
+        visited[slots[:stop][expand[:stop]]] = True
+        parents = nodes[:stop][valid[:stop]]
+        parent_scores = scores[:stop][valid[:stop]]
+
+        # Step 3: Gather and score the edges of the expanded hashtags, in row order
+        starts = indptr[parents]
+        counts = indptr[parents + 1] - starts
+        parent_of_edge = np.repeat(np.arange(len(parents)), counts)
+        edge_positions = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(int(counts.sum()))
+        neighbors = np.asarray(indices[edge_positions], dtype=np.int64)
+        neighbor_labels = labels[neighbors]
+        edge_scores = parent_scores[parent_of_edge] * (alpha * np.asarray(data[edge_positions], dtype=np.float64)
+                                                       + (1 - alpha) * path_factors[depth])
+
+        # Step 4: Keyframe edges, weighted by their number of unique paths so far
+        is_keyframe = neighbor_labels == LABEL_KEYFRAME
+        keyframes = neighbors[is_keyframe]
+        if len(keyframes):
+            keyframe_parents = parent_of_edge[is_keyframe]
+            order = np.argsort(keyframes, kind='stable')
+            sorted_keyframes = keyframes[order]
+            sorted_parents = keyframe_parents[order]
+            new_group = np.ones(len(order), dtype=bool)
+            new_group[1:] = sorted_keyframes[1:] != sorted_keyframes[:-1]
+            # A repeated entry of the same row adds no new path
+            new_path = new_group.copy()
+            new_path[1:] |= sorted_parents[1:] != sorted_parents[:-1]
+            paths_so_far = np.cumsum(new_path)
+            group_starts = np.flatnonzero(new_group)
+            paths_so_far -= np.repeat(paths_so_far[group_starts] - 1, np.diff(np.append(group_starts, len(order))))
+            edge_paths = np.empty(len(order), dtype=np.int64)
+            edge_paths[order] = unique_paths[sorted_keyframes] + paths_so_far
+
+            reached, first_positions = np.unique(keyframes, return_index=True)
+            new_keyframes = unique_paths[reached] == 0
+            first_arrival.extend(reached[new_keyframes][np.argsort(first_positions[new_keyframes])].tolist())
+            np.add.at(weights, keyframes, edge_scores[is_keyframe] * np.log(1 + edge_paths))
+            np.add.at(unique_paths, sorted_keyframes, new_path)
+
+        # Step 5: Hashtag edges form the next frontier, high scores first
+        is_hashtag = ~is_keyframe & (neighbor_labels != LABEL_UNMAPPED)
+        nodes, scores = neighbors[is_hashtag], edge_scores[is_hashtag]
+        if len(scores):
+            high = scores >= np.mean(scores)
+            nodes = np.concatenate([nodes[high], nodes[~high]])
+            scores = np.concatenate([scores[high], scores[~high]])
+
+        if keyframe_count >= max_keyframes or iteration_count >= max_iterations:
+            break
+
+    return {keyframe: weights[keyframe] for keyframe in first_arrival}
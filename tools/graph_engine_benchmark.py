@@ -0,0 +1,178 @@
+##############################################
+#--------------Main Functions---------------
+##############################################
+
+# tools/graph_engine_benchmark.py
+import time
+import json
+import random
+import argparse
+from collections import deque
+
+import numpy as np
+
+from database.grafa_store import LABEL_HASHTAG
+from tools.graph_based_image_retrieval import traverse_bfs, propagate_frontier, traverse_seeds
+
+import logging
+# Set up logging
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+def sample_seed_lists(grafa, n_queries=100, max_hashtags=4, seed=0):
+    """
+    Samples query hashtag lists (as node ids) among the hashtag nodes of the graph.
+    """
+
+    rng = random.Random(seed)
+    hashtag_nodes = np.flatnonzero(np.asarray(grafa.node_labels) == LABEL_HASHTAG).tolist()
+    return [rng.sample(hashtag_nodes, rng.randint(1, min(max_hashtags, len(hashtag_nodes))))
+            for _ in range(n_queries)]
+
+def compare_engines(grafa, seed_lists,
+                    max_depth=5, alpha=0.7, min_score_threshold=0.01, max_keyframes=10000, max_iterations=10000):
+    """
+    Checks that the path-count BFS and the frontier engine reproduce the BFS traversal with materialized paths,
+    and compares the latency of the three.
+
+    Args:
+        grafa (GrafaGraph): The CSR hashtag/keyframe graph.
+        seed_lists (list): The query hashtags of each query, as node ids.
+        max_depth, alpha, min_score_threshold, max_keyframes, max_iterations: The traversal parameters
+            (default to the values used by `cached_results`).
+
+    Returns:
+        dict: The number of queries, the number of queries where an engine differs from the reference, the maximum
+              absolute weight difference and the p50/p99/mean latency in ms of each engine.
+
+    Process:
+        1. Run every engine on every query.
+        2. A query matches when the engines reach the same keyframes in the same first-arrival order with the same
+           raw weights, which makes the normalized top-k rankings identical.
+    """
+
+    params = (max_depth, alpha, min_score_threshold, max_keyframes, max_iterations)
+    engines = {'bfs_paths': lambda seed_nodes: traverse_bfs(grafa, deque((node, 0, (), 1.0) for node in seed_nodes),
+                                                            *params, track_paths=True),
+               'bfs_counts': lambda seed_nodes: traverse_bfs(grafa, deque((node, 0, (), 1.0) for node in seed_nodes),
+                                                             *params, track_paths=False),
+               'frontier': lambda seed_nodes: propagate_frontier(grafa, seed_nodes, *params)}
+    latencies = {engine: [] for engine in engines}
+    mismatches = 0
+    max_difference = 0.0
+    for seed_nodes in seed_lists:
+        weights = {}
+        for engine, traverse in engines.items():
+            start_time = time.perf_counter()
+            weights[engine] = traverse(seed_nodes)
+            latencies[engine].append((time.perf_counter() - start_time) * 1000)
+
+        reference = weights['bfs_paths']
+        matches = True
+        for engine_weights in weights.values():
+            if list(engine_weights) != list(reference):
+                matches = False
+                continue
+            difference = max((abs(reference[node] - engine_weights[node]) for node in reference), default=0.0)
+            max_difference = max(max_difference, float(difference))
+            matches &= difference == 0
+        mismatches += not matches
+
+    report = {'queries': len(seed_lists), 'mismatches': int(mismatches), 'max_difference': max_difference}
+    for engine, values in latencies.items():
+        report[engine] = {'p50_ms': float(np.percentile(values, 50)),
+                          'p99_ms': float(np.percentile(values, 99)),
+                          'mean_ms': float(np.mean(values))}
+    report['speedup'] = report['bfs_paths']['mean_ms'] / max(report['frontier']['mean_ms'], 1e-9)
+    return report
+
+def top_k(weight_dict, k):
+    """
+    The top k keyframe nodes of a traversal and their normalized scores, ranked as in `retrieve_by_hashtags`.
+    """
+
+    total_weight = sum(weight_dict.values())
+    ranked = sorted(weight_dict.items(), key=lambda x: x[1], reverse=True)[:k]
+    return [(keyframe, weight / total_weight if total_weight > 0 else weight) for keyframe, weight in ranked]
+
+def compare_composition(grafa, seed_lists, k=100,
+                        max_depth=5, alpha=0.7, min_score_threshold=0.01, max_keyframes=10000, max_iterations=10000):
+    """
+    Measures how far the rankings of `compose_seeds` (the per-seed traversals summed by `traverse_seeds`) drift
+    from the joint frontier traversal on the queries with several hashtags.
+
+    Args:
+        grafa (GrafaGraph): The CSR hashtag/keyframe graph.
+        seed_lists (list): The query hashtags of each query, as node ids (single-seed queries are skipped: they
+                           give the same weights).
+        k (int): The number of top keyframes compared (default is 100).
+        max_depth, alpha, min_score_threshold, max_keyframes, max_iterations: The traversal parameters.
+
+    Returns:
+        dict: The number of multi-hashtag queries, the number whose top k differs (keyframes or order), the mean and
+              minimum top-k overlap and the maximum normalized score difference of the keyframes in both top k.
+    """
+
+    params = (max_depth, alpha, min_score_threshold, max_keyframes, max_iterations)
+    overlaps = []
+    changed = 0
+    max_score_difference = 0.0
+    for seed_nodes in seed_lists:
+        if len(seed_nodes) < 2:
+            continue
+        joint = top_k(propagate_frontier(grafa, seed_nodes, *params), k)
+        composed = top_k(traverse_seeds(grafa, seed_nodes, None, 'frontier', *params)[0], k)
+        changed += [keyframe for keyframe, _ in joint] != [keyframe for keyframe, _ in composed]
+        joint_scores, composed_scores = dict(joint), dict(composed)
+        common = joint_scores.keys() & composed_scores.keys()
+        overlaps.append(len(common) / max(len(joint_scores), 1))
+        max_score_difference = max([max_score_difference,
+                                    *(abs(joint_scores[node] - composed_scores[node]) for node in common)])
+    return {'queries': len(overlaps),
+            'changed': int(changed),
+            'mean_overlap': float(np.mean(overlaps)) if overlaps else 1.0,
+            'min_overlap': float(np.min(overlaps)) if overlaps else 1.0,
+            'max_score_difference': float(max_score_difference)}
+
+def print_report(report):
+    print(f"{report['queries']} queries, {report['mismatches']} mismatches "
+          f"(max weight difference {report['max_difference']:.3g})")
+    print(f"{'engine':<12} {'p50 ms':>9} {'p99 ms':>9} {'mean ms':>9}")
+    for engine in ('bfs_paths', 'bfs_counts', 'frontier'):
+        row = report[engine]
+        print(f"{engine:<12} {row['p50_ms']:>9.3f} {row['p99_ms']:>9.3f} {row['mean_ms']:>9.3f}")
+    print(f"frontier speedup over bfs_paths: {report['speedup']:.1f}x")
+    composition = report.get('composition')
+    if composition:
+        print(f"compose_seeds on {composition['queries']} multi-hashtag queries: top {composition['k']} changed on "
+              f"{composition['changed']}, overlap mean {composition['mean_overlap']:.3f} / "
+              f"min {composition['min_overlap']:.3f}, max score difference {composition['max_score_difference']:.3g}")
+
+if __name__ == "__main__":
+    from database.db_init import load_grafa_database
+
+    parser = argparse.ArgumentParser(description="Check the path-count BFS and the frontier graph engine against the "
+                                                 "BFS traversal, compare their latency on sampled hashtag queries and "
+                                                 "report the ranking drift of compose_seeds.")
+    parser.add_argument('--n_queries', type=int, default=100)
+    parser.add_argument('--max_hashtags', type=int, default=4)
+    parser.add_argument('--max_keyframes', type=int, default=10000)
+    parser.add_argument('--max_iterations', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--k', type=int, default=100, help="The top k compared for the `compose_seeds` drift.")
+    parser.add_argument('--output', default=None, help="Optional JSON file receiving the report.")
+    args = parser.parse_args()
+
+    grafa = load_grafa_database()
+    seed_lists = sample_seed_lists(grafa, args.n_queries, args.max_hashtags, args.seed)
+    report = compare_engines(grafa, seed_lists, max_keyframes=args.max_keyframes, max_iterations=args.max_iterations)
+    report['composition'] = {'k': args.k, **compare_composition(grafa, seed_lists, args.k,
+                                                                max_keyframes=args.max_keyframes,
+                                                                max_iterations=args.max_iterations)}
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if report['mismatches']:
+        raise SystemExit(f"The graph engines differ from the BFS traversal on {report['mismatches']} queries.")
@@ -0,0 +1,82 @@
+##############################################
+#--------------Helper Functions---------------
+##############################################
+
+# tools/hashtag_suggester.py
+
+import time
+from bisect import bisect_left
+
+import numpy as np
+
+from database.grafa_store import LABEL_HASHTAG
+from tools.lexical_hashtag_matcher import normalize_hashtag
+
+import logging
+# Set up logging
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+class HashtagSuggester:
+    """
+    Prefix completion over the hashtag vocabulary, ranked by how many keyframes carry each hashtag in the GRAFA
+    graph.
+
+    The hashtags of the embedding vocabulary and the hashtag nodes of the graph are merged into one list sorted by
+    normalized name (no '#', lowercase), with an int32 array of keyframe degrees in the same order. A prefix is a
+    contiguous range of the list (two binary searches), and its top hashtags are selected with a partial sort of the
+    range's degrees, so a lookup stays well under a millisecond even for one-letter prefixes.
+
+    Args:
+        hashtag_vocabulary (StringTable or list): The hashtags of the embedding vocabulary.
+        grafa (GrafaGraph, optional): The graph whose keyframe degrees rank the suggestions (default is None:
+                                      all hashtags rank equally, in alphabetical order).
+    """
+
+    def __init__(self, hashtag_vocabulary, grafa=None):
+        start_time = time.time()
+        degrees = {}
+        for i in range(len(hashtag_vocabulary)):
+            degrees[hashtag_vocabulary[i]] = 0
+        if grafa is not None:
+            keyframe_degrees = grafa.keyframe_degrees()
+            for node_idx in np.flatnonzero(np.asarray(grafa.node_labels) == LABEL_HASHTAG).tolist():
+                degrees[grafa.node_name(node_idx)] = int(keyframe_degrees[node_idx])
+
+        entries = sorted((normalize_hashtag(hashtag), hashtag) for hashtag in degrees)
+        self.keys = [key for key, _ in entries]
+        self.hashtags = [hashtag for _, hashtag in entries]
+        self.degrees = np.fromiter((degrees[hashtag] for hashtag in self.hashtags),
+                                   dtype=np.int32, count=len(self.hashtags))
+        logger.info(f"Built the hashtag suggestion index: {len(self.hashtags)} hashtags "
+                    f"in {time.time() - start_time:.2f}s")
+
+    def __len__(self):
+        return len(self.hashtags)
+
+    def suggest(self, prefix, limit=10):
+        """
+        Suggest the most frequent hashtags starting with a prefix.
+
+        Args:
+            prefix (str): The typed prefix, with or without '#' (case-insensitive).
+            limit (int): The maximum number of suggestions (default is 10).
+
+        Returns:
+            list: (hashtag, keyframe degree) tuples, most frequent first (ties in alphabetical order).
+        """
+
+        key = normalize_hashtag(prefix)
+        start = bisect_left(self.keys, key)
+        end = bisect_left(self.keys, key + '\U0010ffff', lo=start)
+        if start == end or limit <= 0:
+            return []
+        degrees = self.degrees[start:end]
+        if end - start > limit:
+            top = np.argpartition(-degrees, limit - 1)[:limit]
+        else:
+            top = np.arange(end - start)
+        # Most frequent first; equal degrees keep the alphabetical order
+        top = top[np.lexsort((top, -degrees[top]))]
+        return [(self.hashtags[start + i], int(degrees[i])) for i in top.tolist()]
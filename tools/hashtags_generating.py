@@ -4,38 +4,34 @@
 
 # tools/hashtags_generating.py
 
-import spacy
+import threading
+from collections import OrderedDict
+
 import logging
-# Load the spaCy model for English
-nlp = spacy.load('en_core_web_sm')
+from tools.nlp_pipeline import get_nlp
 
 # Set up logging
 logging.basicConfig()
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-def generate_hashtags(query: str):
+# Generated hashtags of recent queries: /process_query is called again whenever the query box changes
+HASHTAG_CACHE_SIZE = 4096
+_hashtag_cache = OrderedDict()
+_hashtag_cache_lock = threading.Lock()
+_hashtag_cache_stats = {'hits': 0, 'misses': 0}
+
+def hashtags_from_doc(doc):
     """
-    Generates contextual hashtags based on the input query.
+    Builds hashtags from the runs of proper nouns, nouns and adjectives of a spaCy document.
 
     Args:
-        query (str): The input text query for which hashtags are to be generated.
+        doc (spacy.tokens.Doc): The processed query.
 
     Returns:
         list: A list of generated hashtags.
     """
 
-    logger.info("Generating hashtags...")
-    query = query.strip()
-
-    if not query:
-        return []
-    try:
-        doc = nlp(query)
-    except Exception as e:
-        logger.error(f"Error processing query with spaCy: {e}")
-        return []
-    
     hashtags = []
 
     phrase = []
@@ -55,4 +51,83 @@ def generate_hashtags(query: str):
 
     final_hashtags = [hashtag for hashtag in hashtags if not any(hashtag in h and hashtag != h for h in hashtags)]
     
-    return final_hashtags
\ No newline at end of file
+    return final_hashtags
+
+def _cached_hashtags(query):
+    with _hashtag_cache_lock:
+        hashtags = _hashtag_cache.get(query)
+        if hashtags is None:
+            _hashtag_cache_stats['misses'] += 1
+            return None
+        _hashtag_cache.move_to_end(query)
+        _hashtag_cache_stats['hits'] += 1
+        return list(hashtags)
+
+def _cache_hashtags(query, hashtags):
+    with _hashtag_cache_lock:
+        _hashtag_cache[query] = tuple(hashtags)
+        _hashtag_cache.move_to_end(query)
+        while len(_hashtag_cache) > HASHTAG_CACHE_SIZE:
+            _hashtag_cache.popitem(last=False)
+
+def generate_hashtags(query: str):
+    """
+    Generates contextual hashtags based on the input query.
+
+    Args:
+        query (str): The input text query for which hashtags are to be generated.
+
+    Returns:
+        list: A list of generated hashtags.
+    """
+
+    logger.info("Generating hashtags...")
+    query = query.strip()
+
+    if not query:
+        return []
+    hashtags = _cached_hashtags(query)
+    if hashtags is not None:
+        return hashtags
+    try:
+        doc = get_nlp()(query)
+    except Exception as e:
+        logger.error(f"Error processing query with spaCy: {e}")
+        return []
+    
+    hashtags = hashtags_from_doc(doc)
+    _cache_hashtags(query, hashtags)
+    return hashtags
+
+def generate_hashtags_batch(queries, batch_size=256, n_process=1):
+    """
+    Generates the hashtags of many queries at once (e.g. for offline jobs), running the uncached ones through
+    `nlp.pipe`.
+
+    Args:
+        queries (list): The input text queries.
+        batch_size (int): The number of texts spaCy processes per batch (default is 256).
+        n_process (int): The number of spaCy worker processes (default is 1).
+
+    Returns:
+        list: One list of generated hashtags per query.
+    """
+
+    queries = [query.strip() for query in queries]
+    results = {query: _cached_hashtags(query) for query in dict.fromkeys(queries) if query}
+    missing = [query for query, hashtags in results.items() if hashtags is None]
+    if missing:
+        logger.info(f"Generating hashtags for {len(missing)} queries...")
+        for query, doc in zip(missing, get_nlp().pipe(missing, batch_size=batch_size, n_process=n_process)):
+            results[query] = hashtags_from_doc(doc)
+            _cache_hashtags(query, results[query])
+    return [list(results[query]) if query else [] for query in queries]
+
+def hashtag_cache_stats():
+    with _hashtag_cache_lock:
+        lookups = _hashtag_cache_stats['hits'] + _hashtag_cache_stats['misses']
+        return {'entries': len(_hashtag_cache),
+                'max_entries': HASHTAG_CACHE_SIZE,
+                'hits': _hashtag_cache_stats['hits'],
+                'misses': _hashtag_cache_stats['misses'],
+                'hit_rate': _hashtag_cache_stats['hits'] / lookups if lookups else 0.0}
@@ -4,13 +4,9 @@
 
 # tools/hashtags_processing.py
 
-import torch
 import numpy as np
 from collections import deque
-
-import spacy
-# Load the spaCy model for English
-nlp = spacy.load('en_core_web_sm')
+from tools.query_encoding import encode_texts
 
 import logging
 # Set up logging
@@ -30,11 +26,26 @@ def encode_hashtag(hashtag,
 
     Returns:
         torch.Tensor: The normalized feature vector of the encoded hashtag.
+
+    Note:
+        The raw features come from `encode_texts`, so repeated hashtags are served by the text-embedding cache.
     """
-    text_inputs = clip.tokenize([hashtag], truncate=True).to(device)  # Tokenize and move to device (e.g., GPU)
+    return encode_hashtags([hashtag], clip, device, model)
+
+def encode_hashtags(hashtags, 
+                    clip, 
+                    device, 
+                    model):
+    """
+    Encode several hashtags into feature vectors with one CLIP forward pass.
+
+    Args:
+        hashtags (list): The hashtags to encode.
 
-    with torch.no_grad():
-        text_features = model.encode_text(text_inputs)
+    Returns:
+        torch.Tensor: A (len(hashtags), 512) tensor of normalized feature vectors.
+    """
+    text_features = encode_texts(model, device, hashtags)  # Tokenize and encode (or look up) the hashtags
 
     text_features /= text_features.norm(dim=-1, 
                                         keepdim=True)  # Normalize the features
@@ -57,54 +68,90 @@ def similarity_score(distance):
 def find_similar_hashtags(unseen_hashtag, 
                           hashtag_embeddings, 
                           index, clip, 
-                          device, model, k = 10):
+                          device, model, k = 10,
+                          hashtag_vocabulary = None):
     """
     Find hashtags that are semantically similar to an unseen hashtag.
 
     Args:
         unseen_hashtag (str): The hashtag to find similar hashtags for.
         hashtag_embeddings (dict): A dictionary mapping hashtags to their embeddings.
+        hashtag_vocabulary (StringTable, optional): The hashtag of each row of `index`, built once at load time
+                                                    (default is None: the keys of `hashtag_embeddings`).
 
     Returns:
         list: A list of hashtags that are similar to the unseen hashtag.
     """
 
-    unseen_embedding = encode_hashtag(unseen_hashtag, 
-                                      clip, device, model)
+    if hashtag_vocabulary is None:
+        hashtag_vocabulary = list(hashtag_embeddings.keys())
 
-    word_list = list(hashtag_embeddings.keys())
+    return find_similar_hashtags_batch([unseen_hashtag], 
+                                       hashtag_vocabulary, 
+                                       index, clip, 
+                                       device, model, k)[0]
+
+def find_similar_hashtags_batch(unseen_hashtags, 
+                                hashtag_vocabulary, 
+                                index, clip, 
+                                device, model, k = 10):
+    """
+    Find the hashtags that are semantically similar to several unseen hashtags, with one CLIP forward pass
+    and one FAISS search for all of them.
+
+    Args:
+        unseen_hashtags (list): The hashtags to find similar hashtags for.
+        hashtag_vocabulary (StringTable or list): The hashtag of each row of `index`.
+
+    Returns:
+        list: One list of similar hashtags per unseen hashtag.
+    """
+
+    if not unseen_hashtags:
+        return []
+
+    unseen_embeddings = encode_hashtags(unseen_hashtags, 
+                                        clip, device, model)
 
     # Perform the similarity search
-    distances, indices = index.search(unseen_embedding, 
+    distances, indices = index.search(unseen_embeddings.cpu().numpy(), 
                                       k)
     
-    similar_hashtags = [word_list[idx] for dist, idx in zip(distances[0], indices[0]) 
-                        if similarity_score(dist) >= 0.85]
-    
-    return similar_hashtags
+    return [[hashtag_vocabulary[idx] for dist, idx in zip(row_distances, row_indices) 
+             if idx != -1 and similarity_score(dist) >= 0.85]
+            for row_distances, row_indices in zip(distances, indices)]
 
 def calculate_score(G, hashtag, 
                     neighbor, 
-                    path, alpha=0.7):
+                    path, alpha=0.7,
+                    neighbor_freq=None,
+                    path_length=None):
     """
     Calculate the score for a neighbor based on both neighbor frequency and path length.
 
     Args:
         G (networkx.Graph): Graph containing hashtag nodes and their relationships.
+                            Not used (and may be None) when `neighbor_freq` is given.
         hashtag (str): The current hashtag for which the score is being calculated.
         neighbor (str): The neighbor hashtag whose score is to be computed.
         path (tuple): The path from the original hashtag to the current neighbor.
         alpha (float): Weight for balancing neighbor frequency and path length (0-1, default is 0.7).
+        neighbor_freq (float, optional): The edge weight between the hashtag and the neighbor, e.g. read from
+                                         the CSR `data` array of the GRAFA graph (default is None: read it from `G`).
+        path_length (int, optional): The length of the path, when the traversal does not materialize it
+                                     (default is None: `len(path)`).
 
     Returns:
         float: Calculated score combining neighbor frequency and path length.
     """
 
     # Get the frequency of the edge between the current hashtag and the neighbor
-    neighbor_freq = G[hashtag][neighbor]['weight']
+    if neighbor_freq is None:
+        neighbor_freq = G[hashtag][neighbor]['weight']
 
     # Calculate the path length factor, which decreases with longer paths
-    path_length = len(path)
+    if path_length is None:
+        path_length = len(path)
     path_factor = 1 / (1 + np.log(path_length))
 
     # Combine neighbor frequency and path factor into a single score
@@ -116,7 +163,10 @@ def initialize_queue_with_hashtags(query_hashtags,
                                    hashtag_embeddings, 
                                    hashtag_index, 
                                    clip, device, model, 
-                                   k = 10):
+                                   k = 10,
+                                   similar_cache = None,
+                                   hashtag_vocabulary = None,
+                                   lexical_matcher = None):
     """
     Initialize a queue with known hashtags or find similar hashtags if not directly available.
     
@@ -128,6 +178,13 @@ def initialize_queue_with_hashtags(query_hashtags,
         device (torch.device): Device to run the model on (CPU or GPU).
         model (torch.nn.Module): The neural network model to compute embeddings.
         k (int): Number of similar hashtags to find for unseen hashtags (default is 10).
+        similar_cache (SimilarHashtagCache, optional): Cache of the similar hashtags found for unseen hashtags
+                                                       (default is None: search them on every call).
+        hashtag_vocabulary (StringTable, optional): The hashtag of each row of `hashtag_index`, built once at load
+                                                    time (default is None: the keys of `hashtag_embeddings`).
+        lexical_matcher (LexicalHashtagMatcher, optional): Matches unseen hashtags to vocabulary hashtags by spelling
+                                                           (typos, plurals) before the CLIP similarity search
+                                                           (default is None: CLIP only).
 
     Returns:
         deque: A deque containing tuples with hashtags, their exploration depth, path, and initial score.
@@ -135,19 +192,43 @@ def initialize_queue_with_hashtags(query_hashtags,
 
     queue = deque()
 
+    # Resolve all the unseen hashtags of the query at once
+    unseen_hashtags = list(dict.fromkeys(hashtag for hashtag in query_hashtags if hashtag not in hashtag_embeddings))
+    resolved = {}
+    if unseen_hashtags:
+        logger.info(f"{unseen_hashtags} are not in hashtag_embeddings!!!")
+        if lexical_matcher is not None:
+            # Near-misses of vocabulary hashtags do not need a CLIP forward pass
+            for hashtag in unseen_hashtags:
+                matches = lexical_matcher.match(hashtag)
+                if matches:
+                    logger.info(f"{hashtag} matches {matches} lexically")
+                    resolved[hashtag] = matches
+            unseen_hashtags = [hashtag for hashtag in unseen_hashtags if hashtag not in resolved]
+    if unseen_hashtags:
+        if hashtag_vocabulary is None:
+            hashtag_vocabulary = list(hashtag_embeddings.keys())
+        cached = similar_cache.get_many(unseen_hashtags, k, len(hashtag_vocabulary)) if similar_cache is not None \
+            else [None] * len(unseen_hashtags)
+        resolved.update((hashtag, similar_hashtags) for hashtag, similar_hashtags in zip(unseen_hashtags, cached)
+                        if similar_hashtags is not None)
+        missing = [hashtag for hashtag in unseen_hashtags if hashtag not in resolved]
+        # Find similar hashtags for the hashtags that are not directly available
+        found = find_similar_hashtags_batch(missing, 
+                                            hashtag_vocabulary, 
+                                            hashtag_index, 
+                                            clip, 
+                                            device, model, 
+                                            k)
+        resolved.update(zip(missing, found))
+        if similar_cache is not None and missing:
+            similar_cache.put_many(missing, found, k, len(hashtag_vocabulary))
+
     for hashtag in query_hashtags:
         if hashtag in hashtag_embeddings:
             # Directly add known hashtags to the queue with an initial score of 1.0
             queue.append((hashtag, 0, (), 1.0))
         else:
-            # Find similar hashtags if the current hashtag is not directly available
-            logger.info(f"{hashtag} is not in hashtag_embeddings!!!")
-            similar_hashtags = find_similar_hashtags(hashtag, 
-                                                     hashtag_embeddings, 
-                                                     hashtag_index, 
-                                                     clip, 
-                                                     device, model, 
-                                                     k)
-            queue.extend((h, 0, (), 1.0) for h in similar_hashtags)  # Add similar hashtags with initial score of 1.0
+            queue.extend((h, 0, (), 1.0) for h in resolved[hashtag])  # Add similar hashtags with initial score of 1.0
 
     return queue
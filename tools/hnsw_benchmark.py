@@ -0,0 +1,133 @@
+##############################################
+#--------------Main Functions---------------
+##############################################
+
+# tools/hnsw_benchmark.py
+import time
+import json
+import argparse
+
+import numpy as np
+import faiss
+
+from tools.faiss_retrieval import k_image_search, adaptive_ef_search
+
+import logging
+# Set up logging
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+def exact_neighbors(encoded_frames, query_vectors, k_nums, metric_type=faiss.METRIC_INNER_PRODUCT, chunk_size=65536):
+    """
+    Computes the exact k-nearest neighbors of the query vectors over all encoded frames (brute force).
+
+    Args:
+        encoded_frames (EmbeddingStore): The encoded frames the index was built from.
+        query_vectors (np.ndarray): An (n, d) float32 matrix of query vectors.
+        k_nums (int): The number of nearest neighbors to retrieve.
+        metric_type (int): The FAISS metric of the approximate index (default is inner product).
+        chunk_size (int): The number of frames upcast to float32 at a time (default is 65536).
+
+    Returns:
+        np.ndarray: An (n, k_nums) matrix of the exact neighbor indices.
+    """
+
+    flat_index = faiss.IndexFlat(query_vectors.shape[1], metric_type)
+    for start in range(0, len(encoded_frames), chunk_size):
+        chunk = encoded_frames[start:start + chunk_size].cpu().numpy()
+        flat_index.add(np.ascontiguousarray(chunk, dtype=np.float32))
+    _, exact_indices = flat_index.search(query_vectors, k_nums)
+    return exact_indices
+
+def benchmark_ef_search(index_hnsw, encoded_frames,
+                        k_values=(5, 50, 100, 200),
+                        ef_values=(16, 32, 64, 128, 256, 512),
+                        n_queries=200, seed=0):
+    """
+    Measures recall@k against exact search and the per-query latency of an HNSW index, for fixed efSearch
+    values and for the adaptive policy of `adaptive_ef_search`.
+
+    Args:
+        index_hnsw (faiss.IndexHNSW): The HNSW index to benchmark.
+        encoded_frames (EmbeddingStore): The encoded frames the index was built from; queries are sampled from them.
+        k_values (tuple): The numbers of neighbors to benchmark (default is (5, 50, 100, 200)).
+        ef_values (tuple): The fixed efSearch values to benchmark (default is (16, 32, 64, 128, 256, 512)).
+        n_queries (int): The number of sampled query frames (default is 200).
+        seed (int): The seed of the query sample (default is 0).
+
+    Returns:
+        list: One dict per (k, efSearch) operating point with the recall@k and the p50/p99/mean latency in ms.
+
+    Process:
+        1. Sample query frames and compute their exact neighbors for the largest k.
+        2. For every k and every efSearch (fixed or adaptive), search the queries one at a time, as the API does,
+           timing each search and comparing its results with the exact top k.
+    """
+
+    rng = np.random.default_rng(seed)
+    query_indices = rng.choice(len(encoded_frames), size=min(n_queries, len(encoded_frames)), replace=False)
+    query_vectors = np.ascontiguousarray(encoded_frames[query_indices].cpu().numpy(), dtype=np.float32)
+
+    logger.info(f"Computing exact neighbors of {len(query_vectors)} queries over {len(encoded_frames)} frames")
+    exact_indices = exact_neighbors(encoded_frames, query_vectors, max(k_values), index_hnsw.metric_type)
+
+    report = []
+    for k_nums in k_values:
+        settings = [(ef_search, ef_search) for ef_search in ef_values]
+        settings.append(('adaptive', adaptive_ef_search(k_nums, index_hnsw.hnsw.efSearch)))
+        for label, ef_search in settings:
+            latencies = []
+            recalls = []
+            for query_vector, exact in zip(query_vectors, exact_indices):
+                start_time = time.perf_counter()
+                _, indices = k_image_search(query_vector[None, :], index_hnsw, 'cpu', k_nums=k_nums,
+                                            ef_search=ef_search)
+                latencies.append((time.perf_counter() - start_time) * 1000)
+                recalls.append(len(set(indices) & set(exact[:k_nums].tolist())) / k_nums)
+
+            report.append({'k': int(k_nums),
+                           'ef_search': label,
+                           'effective_ef_search': int(ef_search),
+                           'recall': float(np.mean(recalls)),
+                           'p50_ms': float(np.percentile(latencies, 50)),
+                           'p99_ms': float(np.percentile(latencies, 99)),
+                           'mean_ms': float(np.mean(latencies))})
+            logger.info(f"k={k_nums} efSearch={label}: recall@k={report[-1]['recall']:.4f}, "
+                        f"p50={report[-1]['p50_ms']:.3f} ms, p99={report[-1]['p99_ms']:.3f} ms")
+    return report
+
+def print_report(report):
+    print(f"{'k':>5} {'efSearch':>10} {'recall@k':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for row in report:
+        ef_search = row['ef_search'] if row['ef_search'] != 'adaptive' else f"auto({row['effective_ef_search']})"
+        print(f"{row['k']:>5} {ef_search:>10} {row['recall']:>9.4f} {row['p50_ms']:>8.3f} {row['p99_ms']:>8.3f}")
+
+if __name__ == "__main__":
+    from database.db_init import load_encoded_frames
+    from database.index_registry import FAISS_DATABASES, read_faiss_index
+
+    parser = argparse.ArgumentParser(description="Benchmark recall@k and latency of an HNSW index over efSearch.")
+    parser.add_argument('--database_name', default='CLIP_v0',
+                        help="The index to benchmark; it must be built from the encoded frames (default is CLIP_v0).")
+    parser.add_argument('--database_path', default=None)
+    parser.add_argument('--k', type=int, nargs='+', default=[5, 50, 100, 200])
+    parser.add_argument('--ef_search', type=int, nargs='+', default=[16, 32, 64, 128, 256, 512])
+    parser.add_argument('--n_queries', type=int, default=200)
+    parser.add_argument('--num_threads', type=int, default=1,
+                        help="FAISS threads; single-query searches are measured single-threaded by default.")
+    parser.add_argument('--output', default=None, help="Optional JSON file receiving the report.")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(args.num_threads)
+    index_hnsw = read_faiss_index(args.database_path or FAISS_DATABASES[args.database_name])
+    if not isinstance(index_hnsw, faiss.IndexHNSW):
+        parser.error(f"{args.database_name} is a {type(index_hnsw).__name__}, not an HNSW index.")
+    encoded_frames = load_encoded_frames('cpu')
+
+    report = benchmark_ef_search(index_hnsw, encoded_frames,
+                                 k_values=args.k, ef_values=args.ef_search, n_queries=args.n_queries)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
@@ -16,7 +16,7 @@ def immediate_refining(initialDBIdx, initialDBScore, feedback_status, encoded_fr
         initialDBScore (list): Initial scores associated with the database entries.
         feedback_status (dict): A dictionary containing feedback status with the key as the index of the item
                                 and the value as either 'like', 'dislike', or neutral (any other value).
-        encoded_frames (Tensor): Precomputed tensor of encoded frames representing database entries for similarity calculations.
+        encoded_frames (EmbeddingStore): Precomputed encoded frames representing database entries for similarity calculations.
 
     Returns:
         tuple: A tuple containing:
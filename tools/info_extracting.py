@@ -15,7 +15,7 @@ def extract_information_w_ranking(distances, indices,
     Args:
         distances: List of scores (e.g., similarity scores) corresponding to each frame, typically returned by FAISS.
         indices: List of frame indices corresponding to the distances.
-        image_info_dict: Dictionary containing metadata for each frame, where keys are frame indices (as strings).
+        image_info_dict: AnnotationStore containing metadata for each frame, indexed by database index.
         higher_is_better: Boolean flag indicating whether higher scores are better (default is False).
 
     Returns:
@@ -38,8 +38,7 @@ def extract_information_w_ranking(distances, indices,
     
     # Group frames by their video ID
     for i, (score, idx) in enumerate(zip(distances, indices)):
-        frame_info = image_info_dict[str(idx)]  # Get frame information by its index
-        video_ID = frame_info['video_ID']  # Extract the video ID from the frame info
+        video_ID = image_info_dict.video_ID(idx)  # Get the video ID of the frame by its index
         # Initialize the list for a video if it's not already in the dictionary
         if video_ID not in info_dict:
             info_dict[video_ID] = []
@@ -47,9 +46,9 @@ def extract_information_w_ranking(distances, indices,
         info_dict[video_ID].append({'position': i + 1,  # Use 1-based index for the frame's position
                                     'score': score,  # Frame's score (e.g., similarity score from FAISS)
                                     'db_idx': idx,  # Database index of the frame
-                                    'idx': frame_info['frame_ID'],  # Frame ID
-                                    'timestamp': frame_info['timestamp'],  # Frame timestamp
-                                    'image_path': frame_info['frame_path'].replace('.jpg', '.webp')  # Path to the frame image
+                                    'idx': image_info_dict.frame_ID(idx),  # Frame ID
+                                    'timestamp': image_info_dict.timestamp(idx),  # Frame timestamp
+                                    'image_path': image_info_dict.frame_path(idx).replace('.jpg', '.webp')  # Path to the frame image
                                   })
     
     # List to store videos and their calculated ranking scores
@@ -79,7 +78,7 @@ def extract_information(distances, indices,
     Args:
         distances (list): List of distances from the query.
         indices (list): List of indices of the retrieved images.
-        image_info_dict (dict): Dictionary containing image metadata.
+        image_info_dict (AnnotationStore): Image metadata indexed by database index.
 
     Returns:
         list: A list of dictionaries containing image information.
@@ -90,10 +89,10 @@ def extract_information(distances, indices,
     for score, idx in zip(distances, indices):
         try:
             # Retrieve metadata for each image
-            frame_ID = image_info_dict[str(idx)]['frame_ID']
-            video_ID = image_info_dict[str(idx)]['video_ID']
-            frame_path = image_info_dict[str(idx)]['frame_path'].replace('.jpg', '.webp')
-            timestamp = image_info_dict[str(idx)]['timestamp']
+            frame_ID = image_info_dict.frame_ID(idx)
+            video_ID = image_info_dict.video_ID(idx)
+            frame_path = image_info_dict.frame_path(idx).replace('.jpg', '.webp')
+            timestamp = image_info_dict.timestamp(idx)
             # Append the information to the list
             info_list.append({
                 video_ID: {
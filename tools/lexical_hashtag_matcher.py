@@ -0,0 +1,124 @@
+##############################################
+#--------------Helper Functions---------------
+##############################################
+
+# tools/lexical_hashtag_matcher.py
+
+import time
+from collections import defaultdict
+
+import numpy as np
+
+import logging
+# Set up logging
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+def normalize_hashtag(hashtag):
+    """
+    Normalize a hashtag for lexical matching: no leading '#', lowercase, no surrounding whitespace.
+    """
+
+    return hashtag.strip().lstrip('#').lower()
+
+def character_ngrams(text, n=3):
+    """
+    The set of character n-grams of a text, padded with '$' so that short texts and word boundaries count.
+    """
+
+    padded = f"${text}$"
+    if len(padded) <= n:
+        return {padded}
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+def edit_distance(a, b, max_distance=None):
+    """
+    Levenshtein distance between two strings, or `max_distance + 1` as soon as it is known to exceed
+    `max_distance`.
+    """
+
+    if abs(len(a) - len(b)) > (max_distance if max_distance is not None else len(a) + len(b)):
+        return max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if max_distance is not None and min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+class LexicalHashtagMatcher:
+    """
+    A character n-gram index over the hashtag vocabulary, for matching typos, plurals and case variants of
+    vocabulary hashtags (e.g. '#boats' -> '#boat') without a CLIP forward pass.
+
+    Candidates are the vocabulary hashtags sharing the most n-grams with the query; they are verified with the
+    edit distance and scored `1 - distance / max(length)`.
+
+    Args:
+        hashtag_vocabulary (StringTable or list): The vocabulary hashtags.
+        n (int): The n-gram length (default is 3).
+        threshold (float): The minimum score of a match (default is 0.8).
+        max_candidates (int): The number of n-gram candidates verified with the edit distance (default is 20).
+    """
+
+    def __init__(self, hashtag_vocabulary, n=3, threshold=0.8, max_candidates=20):
+        self.n = n
+        self.threshold = threshold
+        self.max_candidates = max_candidates
+        start_time = time.time()
+        self.hashtags = [hashtag_vocabulary[i] for i in range(len(hashtag_vocabulary))]
+        self.normalized = [normalize_hashtag(hashtag) for hashtag in self.hashtags]
+        postings = defaultdict(list)
+        for hashtag_id, text in enumerate(self.normalized):
+            for gram in character_ngrams(text, n):
+                postings[gram].append(hashtag_id)
+        self.postings = {gram: np.asarray(ids, dtype=np.int32) for gram, ids in postings.items()}
+        self.gram_counts = np.fromiter((len(character_ngrams(text, n)) for text in self.normalized),
+                                       dtype=np.int32, count=len(self.normalized))
+        logger.info(f"Built the lexical hashtag index: {len(self.hashtags)} hashtags, {len(self.postings)} "
+                    f"{n}-grams in {time.time() - start_time:.2f}s")
+
+    def __len__(self):
+        return len(self.hashtags)
+
+    def match(self, hashtag):
+        """
+        Find the vocabulary hashtags closest to a hashtag in spelling.
+
+        Args:
+            hashtag (str): The (unseen) query hashtag.
+
+        Returns:
+            list: The vocabulary hashtags with the best score, when it is at least `threshold` (empty otherwise).
+        """
+
+        text = normalize_hashtag(hashtag)
+        grams = character_ngrams(text, self.n)
+        gram_postings = [self.postings[gram] for gram in grams if gram in self.postings]
+        if not text or not gram_postings:
+            return []
+
+        # Rank the hashtags sharing n-grams by Dice coefficient and verify the best ones
+        candidate_ids, shared = np.unique(np.concatenate(gram_postings), return_counts=True)
+        dice = 2 * shared / (len(grams) + self.gram_counts[candidate_ids])
+        top = np.argsort(-dice, kind='stable')[:self.max_candidates]
+
+        best_score, best_ids = self.threshold, []
+        for hashtag_id in candidate_ids[top].tolist():
+            candidate = self.normalized[hashtag_id]
+            length = max(len(text), len(candidate))
+            # The largest distance that can still reach the best score so far
+            max_distance = int(length * (1 - best_score) + 1e-9)
+            distance = edit_distance(text, candidate, max_distance)
+            if distance > max_distance:
+                continue
+            score = 1 - distance / length
+            if score > best_score + 1e-12 or not best_ids:
+                best_score, best_ids = score, [hashtag_id]
+            elif abs(score - best_score) <= 1e-12:
+                best_ids.append(hashtag_id)
+        return [self.hashtags[hashtag_id] for hashtag_id in best_ids]
@@ -0,0 +1,38 @@
+##############################################
+#--------------Helper Functions---------------
+##############################################
+
+# tools/nlp_pipeline.py
+
+import threading
+
+import logging
+# Set up logging
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Hashtag generation only reads POS tags and stop words: the dependency parser, the sentence recognizer,
+# the entity recognizer and the lemmatizer are not loaded
+SPACY_MODEL = 'en_core_web_sm'
+SPACY_EXCLUDE = ['parser', 'senter', 'ner', 'lemmatizer']
+
+_nlp = None
+_nlp_lock = threading.Lock()
+
+def get_nlp():
+    """
+    Return the process-wide spaCy pipeline, loading it on first use.
+
+    Returns:
+        spacy.Language: The `en_core_web_sm` pipeline with only the tokenizer, tagger and attribute ruler.
+    """
+
+    global _nlp
+    if _nlp is None:
+        with _nlp_lock:
+            if _nlp is None:
+                import spacy
+                _nlp = spacy.load(SPACY_MODEL, exclude=SPACY_EXCLUDE)
+                logger.info(f"Load spaCy {SPACY_MODEL} with components {_nlp.pipe_names}: DONE!")
+    return _nlp
@@ -7,12 +7,115 @@ import torch
 import clip
 import nltk
 nltk.download('punkt')
+from tools.text_embedding_cache import get_text_embedding_cache
+from tools.encoding_scheduler import get_text_encode_scheduler
+
+def forward_texts(model, device, texts, batch_size=256):
+    """
+    Runs the CLIP text encoder on a list of texts in batches of at most `batch_size`.
+
+    Returns:
+        torch.Tensor: A (len(texts), 512) float32 tensor of raw text features.
+    """
+
+    text_features = []
+    for start in range(0, len(texts), batch_size):
+        text_input = clip.tokenize(texts[start:start + batch_size], truncate=True).to(device)  # Tokenize the batch
+        with torch.no_grad():
+            text_features.append(model.encode_text(text_input).float())
+
+    if not text_features:
+        return torch.zeros((0, 512), dtype=torch.float32).to(device)
+    return torch.cat(text_features)
+
+def schedule_texts(model, device, texts, batch_size=256):
+    """
+    Runs the CLIP text encoder on a list of texts, through the process-wide micro-batching scheduler when
+    one is configured for this model (so that concurrent queries share forward passes), in the caller's
+    thread otherwise.
+    """
+
+    scheduler = get_text_encode_scheduler()
+    if scheduler is not None and scheduler.model is model:
+        return scheduler.encode(texts).to(device)
+    return forward_texts(model, device, texts, batch_size)
+
+def encode_texts(model, device, texts, batch_size=256, cache=None):
+    """
+    Encodes a list of texts into raw (unnormalized) CLIP text features. Texts found in the text-embedding
+    cache are not re-encoded; the others are batched into as few forward passes as possible (shared with
+    concurrent queries when a scheduler is configured) and cached.
+
+    Args:
+        model (CLIP model): The CLIP model used for encoding.
+        device (torch.device): The device (CPU or CUDA) to run the model on.
+        texts (list): The texts to encode.
+        batch_size (int): The maximum number of texts per forward pass (default is 256).
+        cache (TextEmbeddingCache, optional): The cache to use (default is the process-wide cache, if any).
+
+    Returns:
+        torch.Tensor: A (len(texts), 512) float32 tensor of text features, in the order of `texts`.
+    """
+
+    if cache is None:
+        cache = get_text_embedding_cache()
+    if cache is None:
+        return schedule_texts(model, device, texts, batch_size)
+
+    model_name = getattr(model, 'model_name', type(model).__name__)
+    vectors = cache.get_many(model_name, texts)
+
+    # Encode each missing text once, even if it appears several times
+    missing_texts = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+    if missing_texts:
+        missing_features = schedule_texts(model, device, missing_texts, batch_size)
+        cache.put_many(model_name, missing_texts, missing_features)
+        encoded = dict(zip(missing_texts, missing_features.cpu()))
+        vectors = [encoded[text] if vector is None else vector for text, vector in zip(texts, vectors)]
+
+    if not vectors:
+        return torch.zeros((0, 512), dtype=torch.float32).to(device)
+    return torch.stack(vectors).to(device)
+
+def encode_descriptions(model, device, descriptions, batch_size=256):
+    """
+    Encodes many descriptions at once (e.g. for offline jobs). The sentences of all descriptions are
+    encoded together in batches, then summed per description and normalized.
+
+    Args:
+        model (CLIP model): The CLIP model used for encoding.
+        device (torch.device): The device (CPU or CUDA) to run the model on.
+        descriptions (list): The text descriptions to encode.
+        batch_size (int): The maximum number of sentences per forward pass (default is 256).
+
+    Returns:
+        torch.Tensor: A (len(descriptions), 512) tensor of normalized text features.
+    """
+
+    # Split every description into sentences and remember which description each sentence belongs to
+    sentences = []
+    owners = []
+    for i, description in enumerate(descriptions):
+        sent_text = nltk.sent_tokenize(description)
+        sentences.extend(sent_text)
+        owners.extend([i] * len(sent_text))
+
+    sentence_features = encode_texts(model, device, sentences, batch_size)
+
+    # Sum up the sentence features of each description
+    text_features = torch.zeros((len(descriptions), 512), dtype=torch.float32).to(device)
+    text_features.index_add_(0, torch.tensor(owners, dtype=torch.long, device=sentence_features.device),
+                             sentence_features)
+
+    text_features /= text_features.norm(dim=-1, keepdim=True)  # Normalize the features
+
+    return text_features
 
 def encode_description(model, device, description):
     """
     Encodes a description into text features using the CLIP model.
-    The description is split into sentences, each sentence is tokenized
-    and encoded separately. The resulting features are averaged and normalized.
+    The description is split into sentences, which are tokenized and encoded
+    together in one forward pass. The resulting features are summed and normalized.
 
     Args:
         model (CLIP model): The CLIP model used for encoding.
@@ -27,12 +130,10 @@ def encode_description(model, device, description):
 
     text_features = torch.zeros((1, 512), dtype=torch.float32).to(device)  # Initialize feature tensor
 
-    for sent in sent_text:
-        text_input = clip.tokenize([sent], truncate=True).to(device)  # Tokenize and encode the sentence
-        with torch.no_grad():
-            text_feature = model.encode_text(text_input)
-            text_features += text_feature.sum(dim=0, keepdim=True)  # Sum up features for each sentence
+    if sent_text:
+        # Encode all sentences in one batch and sum up their features
+        text_features += encode_texts(model, device, sent_text).sum(dim=0, keepdim=True)
 
     text_features /= text_features.norm(dim=-1, keepdim=True)  # Normalize the features
 
-    return text_features
\ No newline at end of file
+    return text_features
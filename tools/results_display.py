@@ -3,10 +3,10 @@
 ##############################################
 
 # tools/results_display.py
-import json
 import logging
+import numpy as np
 from typing import Optional
-from tools.utils import str_to_timedelta
+from database.annotation_store import timestamp_to_ms
 from tools.info_extracting import extract_information_w_ranking, extract_information
 
 # Set up logging
@@ -60,7 +60,7 @@ def display_option_results(display_option,
         display_option (str): Determines how results are displayed. Options are 'group_by_videoid' or other.
         distances_hnsw (np.ndarray): Array of distances from the FAISS index search.
         indices_hnsw (np.ndarray): Array of indices from the FAISS index search.
-        image_info_dict (dict): Dictionary with image information used for result extraction.
+        image_info_dict (AnnotationStore): Image information used for result extraction.
 
     Returns:
         list: A list of results formatted for display based on the selected display option.
@@ -85,17 +85,26 @@ def display_option_results(display_option,
     logger.info(f"Results ready for display based on option: {display_option}")
     return results
 
-def get_keyframes(image_info_dict_path: str, 
+def keyframe_info(image_info_dict, idx):
+    """
+    Build the display entry of a keyframe, with the frame path converted from '.jpg' to '.webp'.
+    """
+
+    return {'frame_ID': image_info_dict.frame_ID(idx),
+            'frame_path': image_info_dict.frame_path(idx).replace('.jpg', '.webp'),
+            'video_ID': image_info_dict.video_ID(idx),
+            'timestamp': image_info_dict.timestamp(idx)}
+
+def get_keyframes(image_info_dict, 
                   page: int, 
                   per_page: int):
     """
-    Reads a JSON file containing keyframe information and returns a paginated list of keyframes
-    for a specified page and number of items per page. Each keyframe entry contains the frame ID, 
-    modified frame path (replacing image folder path and converting '.jpg' to '.webp'), video ID, 
-    and timestamp.
+    Returns a paginated list of keyframes for a specified page and number of items per page. 
+    Each keyframe entry contains the frame ID, modified frame path (converting '.jpg' to '.webp'), 
+    video ID, and timestamp.
 
     Args:
-        image_info_dict_path (str): Path to the JSON file containing the keyframe information.
+        image_info_dict (AnnotationStore): The columnar keyframe annotations.
         page (int): The page number to return.
         per_page (int): The number of keyframes to return per page.
 
@@ -103,51 +112,29 @@ def get_keyframes(image_info_dict_path: str,
         paginated_keyframes (list): A list of dictionaries, each representing a keyframe with 
         'frame_ID', 'frame_path', 'video_ID', and 'timestamp' fields.
         total_keyframes (int): The total number of keyframes available.
-
-    Raises:
-        FileNotFoundError: If the specified file does not exist.
-        json.JSONDecodeError: If there is an issue decoding the JSON file.
     """
 
-    try:
-        # Attempt to open and load the JSON file
-        with open(image_info_dict_path, 'r') as openfile:
-            image_info_dict = json.load(openfile)
-    except FileNotFoundError:
-        logger.error(f"File {image_info_dict_path} not found.")
-        raise
-    except json.JSONDecodeError:
-        logger.error(f"Error decoding JSON from file {image_info_dict_path}.")
-        raise
-
-    # Process and format keyframe information
-    keyframes = [{
-        'frame_ID': frame_info['frame_ID'],
-        'frame_path': frame_info['frame_path'].replace('.jpg', '.webp'),
-        'video_ID': frame_info['video_ID'],
-        'timestamp': frame_info['timestamp']
-    } for frame_info in image_info_dict.values()]
+    row_ids = image_info_dict.row_ids()
 
-    # Pagination logic
+    # Pagination logic: only the keyframes of the requested page are materialized
     start = (page - 1) * per_page
     end = start + per_page
-    paginated_keyframes = keyframes[start:end]
+    paginated_keyframes = [keyframe_info(image_info_dict, idx) for idx in row_ids[start:end]]
 
     # Return the paginated list of keyframes and total keyframe count
-    return paginated_keyframes, len(keyframes)
+    return paginated_keyframes, len(row_ids)
 
-def get_keyframes_w_filter(image_info_dict_path: str,
+def get_keyframes_w_filter(image_info_dict,
                            page: int,
                            per_page: int,
                            video_ID: Optional[str] = '',
                            timestamp: Optional[str] = ''):
     """
-    Retrieves a paginated list of keyframes from a JSON file, with optional filters based on 
-    video ID and timestamp. The function processes the keyframes to return only those that match 
-    the specified filters.
+    Retrieves a paginated list of keyframes, with optional filters based on video ID and timestamp. 
+    The function processes the keyframes to return only those that match the specified filters.
 
     Args:
-        image_info_dict_path (str): Path to the JSON file containing the keyframe information.
+        image_info_dict (AnnotationStore): The columnar keyframe annotations.
         page (int): The page number for pagination.
         per_page (int): The number of keyframes to return per page.
         video_ID (Optional[str]): The ID of the video to filter keyframes by. Defaults to an empty string.
@@ -158,46 +145,31 @@ def get_keyframes_w_filter(image_info_dict_path: str,
         each containing 'frame_ID', 'frame_path', 'video_ID', and 'timestamp'.
         total_keyframes (int): The total number of keyframes after applying the filters.
 
-    Raises:
-        FileNotFoundError: If the specified JSON file does not exist.
-        json.JSONDecodeError: If there is an issue decoding the JSON file.
-
     Logging:
         Logs received parameters and the modified filter time.
         Logs the number of keyframes after filtering.
     """
 
-    try:
-        # Attempt to open and load the JSON file
-        with open(image_info_dict_path, 'r') as openfile:
-            image_info_dict = json.load(openfile)
-    except FileNotFoundError:
-        logger.error(f"File {image_info_dict_path} not found.")
-        raise
-    except json.JSONDecodeError:
-        logger.error(f"Error decoding JSON from file {image_info_dict_path}.")
-        raise
-
     logger.info(f"Received video_ID: {video_ID}")
     logger.info(f"Received timestamp: {type(timestamp)}, {timestamp}")
 
-    # Convert timestamp to a timedelta if provided
-    filter_time = str_to_timedelta(timestamp) if timestamp else None
+    # Convert timestamp to milliseconds if provided
+    filter_time = timestamp_to_ms(timestamp) if timestamp else None
     logger.info(f"Modified filter_time: {type(filter_time)}, {filter_time}")
 
-    # Filter keyframes based on video_ID and timestamp
-    keyframes = [{'frame_ID': frame_info['frame_ID'],
-                  'frame_path': frame_info['frame_path'].replace('.jpg', '.webp'),
-                  'video_ID': frame_info['video_ID'],
-                  'timestamp': frame_info['timestamp']} for frame_info in image_info_dict.values() 
-                  if video_ID and frame_info['video_ID'] == video_ID and 
-                  str_to_timedelta(frame_info['timestamp']) > filter_time]
+    # Filter keyframes based on video_ID and timestamp (frames strictly after it, only when one is given)
+    if video_ID:
+        row_ids = image_info_dict.video_rows(video_ID)
+        if filter_time is not None:
+            row_ids = row_ids[np.asarray(image_info_dict.timestamp_ms)[row_ids] > filter_time]
+    else:
+        row_ids = []
 
     # Pagination logic
     start = (page - 1) * per_page
     end = start + per_page
-    paginated_keyframes = keyframes[start:end]
-    logger.info(f"Number of keyframes after filtering: {len(keyframes)}")
+    paginated_keyframes = [keyframe_info(image_info_dict, idx) for idx in row_ids[start:end]]
+    logger.info(f"Number of keyframes after filtering: {len(row_ids)}")
 
     # Return the paginated list of filtered keyframes and total count
-    return paginated_keyframes, len(keyframes)
\ No newline at end of file
+    return paginated_keyframes, len(row_ids)
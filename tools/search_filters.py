@@ -0,0 +1,108 @@
+##############################################
+#--------------Helper Functions---------------
+##############################################
+
+# tools/search_filters.py
+import re
+import numpy as np
+
+from database.annotation_store import timestamp_to_ms
+
+import logging
+# Set up logging
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# A filter timestamp: 'HH:MM:SS' with an optional fraction of up to six digits
+FILTER_TIME_PATTERN = re.compile(r'\d{1,2}:[0-5]\d:[0-5]\d(\.\d{1,6})?')
+
+def parse_filter_time(timestamp):
+    """
+    Convert a 'HH:MM:SS[.ffffff]' filter timestamp into milliseconds.
+
+    Raises:
+        ValueError: If the timestamp does not match `FILTER_TIME_PATTERN`.
+    """
+
+    if not FILTER_TIME_PATTERN.fullmatch(timestamp.strip()):
+        raise ValueError(f"Invalid timestamp {timestamp!r}, expected HH:MM:SS[.ffffff].")
+    return timestamp_to_ms(timestamp.strip())
+
+def parse_video_IDs(video_ID):
+    """
+    Split a video filter such as 'L01_V001, L01_V002' into a list of unique video IDs.
+    """
+
+    return list(dict.fromkeys(part for part in re.split(r'[,\s]+', video_ID or '') if part))
+
+def filter_row_ids(image_info_dict,
+                   video_ID='',
+                   start_time='',
+                   end_time=''):
+    """
+    Compute the database indices allowed by a video / time-range filter.
+
+    Args:
+        image_info_dict (AnnotationStore): The columnar keyframe annotations.
+        video_ID (str): One or more comma-separated video IDs (default is no video filter).
+        start_time (str): Keep the frames at or after this 'HH:MM:SS[.ffffff]' timestamp (default is no lower bound).
+        end_time (str): Keep the frames at or before this 'HH:MM:SS[.ffffff]' timestamp (default is no upper bound).
+
+    Returns:
+        np.ndarray: The sorted int64 database indices matching the filter, or None when no filter is given.
+
+    Raises:
+        ValueError: If `start_time` or `end_time` is malformed (see `parse_filter_time`).
+
+    Process:
+        1. Take the frames of the requested videos from the per-video index of the annotation store
+           (or every annotated frame without a video filter).
+        2. Keep the frames whose timestamp falls in the requested range.
+    """
+
+    video_IDs = parse_video_IDs(video_ID)
+    if not video_IDs and not start_time and not end_time:
+        return None
+    # Parse the bounds before any work so that a malformed one fails early
+    start_ms = parse_filter_time(start_time) if start_time else None
+    end_ms = parse_filter_time(end_time) if end_time else None
+
+    if video_IDs:
+        row_ids = np.sort(np.concatenate([image_info_dict.video_rows(video) for video in video_IDs]))
+    else:
+        row_ids = image_info_dict.row_ids()
+    row_ids = np.asarray(row_ids, dtype=np.int64)
+
+    if start_time or end_time:
+        timestamps = np.asarray(image_info_dict.timestamp_ms)[row_ids]
+        mask = np.ones(len(row_ids), dtype=bool)
+        if start_time:
+            mask &= timestamps >= start_ms
+        if end_time:
+            mask &= timestamps <= end_ms
+        row_ids = row_ids[mask]
+
+    logger.info(f"Filter video_ID={video_IDs}, start_time={start_time!r}, end_time={end_time!r}: {len(row_ids)} frames")
+    return row_ids
+
+def filter_results(scores, indices, row_ids, k_num=None):
+    """
+    Keep the (score, index) pairs whose index is allowed by a filter, in their original order.
+
+    Args:
+        scores (list): The scores of the results.
+        indices (list): The database indices of the results.
+        row_ids (np.ndarray): The allowed database indices (None keeps every result).
+        k_num (int, optional): Keep at most the first `k_num` allowed results.
+
+    Returns:
+        tuple: The filtered scores and indices, as lists.
+    """
+
+    if row_ids is None:
+        return scores, indices
+    keep = np.isin(np.asarray(indices, dtype=np.int64), row_ids)
+    scores = [score for score, kept in zip(scores, keep) if kept]
+    indices = [idx for idx, kept in zip(indices, keep) if kept]
+    return scores[:k_num], indices[:k_num]
@@ -5,12 +5,15 @@ import time
 from fastapi import FastAPI
 
 from tools.query_encoding import encode_description
-from tools.faiss_retrieval import k_image_search
+from tools.faiss_retrieval import k_image_search_filtered
+from tools.search_filters import filter_row_ids, filter_results
 from tools.results_display import display_option_results, get_keyframes, get_keyframes_w_filter
 from tools.utils import re_ranking
-from database.db_init import faiss_database_processing
 from tools.graph_based_image_retrieval import retrieve_by_hashtags
 from tools.calculate_weighted_exploration import calculate_weighted_exploration
+from tools.immediate_refining import immediate_refining
+from tools.aggregated_refining import aggregated_refining
+from tools.stage_graph import StageGraph
 
 import clip
 
@@ -21,7 +24,8 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 @lru_cache(maxsize=128)
-def cached_get_keyframes(page: int, 
+def cached_get_keyframes(image_info_dict,
+                         page: int, 
                          per_page: int, 
                          video_ID: Optional[str] = '', 
                          timestamp: Optional[str] = ''):
@@ -29,6 +33,7 @@ def cached_get_keyframes(page: int,
     Retrieve keyframes from the database with optional filtering by video ID and timestamp.
 
     Args:
+        image_info_dict (AnnotationStore): The columnar keyframe annotations.
         page (int): The current page number for pagination.
         per_page (int): The number of keyframes to retrieve per page.
         video_ID (Optional[str]): The ID of the video to filter keyframes (default is an empty string).
@@ -48,25 +53,43 @@ def cached_get_keyframes(page: int,
     """
 
     if not video_ID and not timestamp:
-        return get_keyframes('database/index_caption_hashtag_dict_v2.json',
+        return get_keyframes(image_info_dict,
                              page=page,
                              per_page=per_page)
     else:
-        return get_keyframes_w_filter('database/index_caption_hashtag_dict_v2.json',
+        return get_keyframes_w_filter(image_info_dict,
                                       page=page,
                                       per_page=per_page,
                                       video_ID=video_ID,
-                                      timestamp=timestamp or '00:00:00')
+                                      timestamp=timestamp)
     
+def current_frame_knn(app: FastAPI):
+    """
+    The precomputed frame neighbors, when they were built on the CLIP_v0 index being served (None otherwise).
+    """
+
+    frame_knn = app.state.frame_knn
+    index_registry = app.state.index_registry
+    if frame_knn is None or not frame_knn.matches(index_registry.get('CLIP_v0'),
+                                                  index_registry.databases.get('CLIP_v0')):
+        return None
+    return frame_knn
+
 @lru_cache(maxsize=128)
 def perform_search(db_idx: int, 
-                   app: FastAPI):
+                   app: FastAPI,
+                   video_ID: str = '',
+                   start_time: str = '',
+                   end_time: str = ''):
     """
     Perform a search for images based on a specific database index.
 
     Args:
         db_idx (int): The index of the database entry for which to perform the search.
         app (FastAPI): The FastAPI application instance, containing necessary state information.
+        video_ID (str): Restrict the search to these comma-separated video IDs (default is no filter).
+        start_time (str): Restrict the search to frames at or after this timestamp (default is no filter).
+        end_time (str): Restrict the search to frames at or before this timestamp (default is no filter).
 
     Returns:
         list: A list of results containing images sorted according to the specified display option.
@@ -74,7 +97,8 @@ def perform_search(db_idx: int,
     Process:
         1. Retrieve the encoded frames from the application state.
         2. Extract the query vector corresponding to the given database index.
-        3. Use the `k_image_search` function to perform a search in the HNSW index, retrieving the top 50 closest images.
+        3. Look up the top 50 closest images in the precomputed frame kNN store, or use the `k_image_search_filtered`
+           function to search the HNSW index when the store is missing, stale or a filter is given.
         4. Specify the display option for sorting results (in this case, by frame index).
         5. Call the `display_option_results` function to format and retrieve the search results based on the distances and indices found.
 
@@ -85,14 +109,20 @@ def perform_search(db_idx: int,
     encoded_frames = app.state.encoded_frames
     query_vector = encoded_frames[db_idx].unsqueeze(0)
 
-    clipv0_hnsw = app.state.clipv0_hnsw
+    clipv0_hnsw = app.state.index_registry.get('CLIP_v0')
     device = app.state.device
-    clipv0_distances, clipv0_indexs = k_image_search(query_vector, 
-                                                     clipv0_hnsw, 
-                                                     device, k_nums=50)
+    image_info_dict = app.state.image_info_dict
+    row_ids = filter_row_ids(image_info_dict, video_ID, start_time, end_time)
+    frame_knn = current_frame_knn(app)
+    if row_ids is None and frame_knn is not None and frame_knn.covers(db_idx, 50):
+      # Precomputed neighbors of the frame
+      clipv0_distances, clipv0_indexs = frame_knn.neighbors(db_idx, 50)
+    else:
+      clipv0_distances, clipv0_indexs = k_image_search_filtered(query_vector, 
+                                                                clipv0_hnsw, 
+                                                                device, k_nums=50, row_ids=row_ids)
     
     display_option = 'sort_by_frame_index'
-    image_info_dict = app.state.image_info_dict
     results = display_option_results(display_option, 
                                      clipv0_distances, clipv0_indexs, 
                                      image_info_dict)
@@ -102,7 +132,8 @@ def perform_search(db_idx: int,
 @lru_cache(maxsize=128)
 def cached_results(query_text: str, hiddenHashtags: str,
                    database_name: str, k: int, display_option: str,
-                   app: FastAPI):
+                   app: FastAPI,
+                   video_ID: str = '', start_time: str = '', end_time: str = ''):
     
     """
     Retrieve and cache results based on a user query and optional hashtags.
@@ -114,6 +145,9 @@ def cached_results(query_text: str, hiddenHashtags: str,
         k (int): The number of top results to return.
         display_option (str): The display option for formatting results.
         app (FastAPI): The FastAPI application instance for accessing shared state.
+        video_ID (str): Restrict the results to these comma-separated video IDs (default is no filter).
+        start_time (str): Restrict the results to frames at or after this timestamp (default is no filter).
+        end_time (str): Restrict the results to frames at or before this timestamp (default is no filter).
 
     Returns:
         tuple: A tuple containing:
@@ -125,9 +159,12 @@ def cached_results(query_text: str, hiddenHashtags: str,
         1. Parse and log incoming data for debugging.
         2. Retrieve relevant components from the FastAPI application state, including the model and embeddings.
         3. Determine which retrieval method to use based on the presence of the query text and hashtags:
-            - If both are provided, perform FAISS and graph-based retrieval.
+            - If both are provided, perform FAISS and graph-based retrieval (concurrently, see `StageGraph`).
             - If only hashtags are provided, perform graph-based retrieval.
             - If only the query text is provided, perform FAISS-based retrieval.
+           A video / time-range filter is applied inside the FAISS search and to the graph results.
+           The graph traversal of each hashtag is cached, so a query differing by one hashtag only traverses that one.
+           Hashtag-only queries read the precomputed postings of hot hashtags instead of traversing them.
         4. Filter and display the results according to the specified display option.
         5. Return the results along with the corresponding indices and scores.
 
@@ -142,37 +179,56 @@ def cached_results(query_text: str, hiddenHashtags: str,
     logger.info(f"Received database_name: {database_name}")
     logger.info(f"Received k number: {k}")
     logger.info(f"Received display_option: {display_option}")
+    logger.info(f"Received filter: video_ID={video_ID}, start_time={start_time}, end_time={end_time}")
 
     if not query_text and not hiddenHashtags:
       logger.info(f"status_code=400, detail=At least one of query text or hashtags must be provided.")
 
     model = app.state.model
     device = app.state.device
-    sparse_matrix = app.state.sparse_matrix
-    node_mapping = app.state.node_mapping
-    node_mapping = app.state.node_mapping
-    reverse_node_mapping = app.state.reverse_node_mapping
-    G = app.state.G
+    grafa = app.state.grafa
     hashtag_embeddings = app.state.hashtag_embeddings
     hashtag_index = app.state.hashtag_embedding_index
     image_info_dict = app.state.image_info_dict
+    traversal_cache = app.state.traversal_cache
+    similar_hashtag_cache = app.state.similar_hashtag_cache
+    hashtag_vocabulary = app.state.hashtag_vocabulary
+    lexical_matcher = app.state.hashtag_matcher
 
+    # Database indices allowed by the video / time-range filter (None without filter)
+    row_ids = filter_row_ids(image_info_dict, video_ID, start_time, end_time)
+    # With a filter, score every reachable keyframe and keep the top k allowed ones
+    graph_k = k if row_ids is None else 10000
 
-    start_time = time.time()
+    retrieval_start = time.time()
 
     if len(hashtags_list) != 0 and query_text != '':
-      #FAISS database Processing
-      index_hnsw = faiss_database_processing(database_name)
-      #FAISS and GRAPH based retrieval process
-      query_vector = encode_description(model, device, query_text)
-      distances_hnsw, indices_hnsw = k_image_search(query_vector, index_hnsw, device, k_nums=k)
-      graph_scores, graph_indices = retrieve_by_hashtags(sparse_matrix, node_mapping, reverse_node_mapping, G,
-                                                         hashtags_list, hashtag_embeddings, hashtag_index, clip, device, model,
-                                                         k_num=k, max_depth=5, alpha=0.7, similarity_num = 10,
-                                                         min_score_threshold=0.01, max_keyframes=10000, max_iterations=10000)
-      refined_scores, refined_indexes = re_ranking(distances_hnsw, indices_hnsw,
-                                                   graph_scores, graph_indices,
-                                                   k_num=k, boost_amount = 2)
+      #Resident FAISS index
+      index_hnsw = app.state.index_registry.get(database_name)
+
+      def graph_branch(k_num, k_filtered):
+        graph_scores, graph_indices = retrieve_by_hashtags(grafa,
+                                                           hashtags_list, hashtag_embeddings, hashtag_index, clip, device, model,
+                                                           k_num=k_num, max_depth=5, alpha=0.7, similarity_num = 10,
+                                                           min_score_threshold=0.01, max_keyframes=10000, max_iterations=10000,
+                                                           engine='frontier', traversal_cache=traversal_cache,
+                                                           similar_cache=similar_hashtag_cache, hashtag_vocabulary=hashtag_vocabulary,
+                                                           lexical_matcher=lexical_matcher)
+        return filter_results(graph_scores, graph_indices, row_ids, k_num=k_filtered)
+
+      #FAISS and GRAPH based retrieval process: the two branches only meet at the re-ranking, so they run concurrently
+      hybrid = StageGraph('hybrid')
+      hybrid.add('encode', lambda: encode_description(model, device, query_text))
+      hybrid.add('vector', lambda query_vector: k_image_search_filtered(query_vector, index_hnsw, device, k_nums=k,
+                                                                        row_ids=row_ids),
+                 after=('encode',))
+      hybrid.add('graph', lambda: graph_branch(graph_k, k))
+      hybrid.add('re_ranking', lambda vector, graph: re_ranking(*vector, *graph,
+                                                                k_num=k, boost_amount = 2),
+                 after=('vector', 'graph'))
+      stage_results = hybrid.run()
+      query_vector = stage_results['encode']
+      refined_scores, refined_indexes = stage_results['re_ranking']
 
       # Decide whether to expand the top-k
       should_expand, k_new = calculate_weighted_exploration(refined_scores, k)
@@ -180,51 +236,56 @@ def cached_results(query_text: str, hiddenHashtags: str,
       if should_expand:
         # Re-run the query with k_new and return top k results
         logger.info("Expanding the search scope to improve the results...")
-        distances_hnsw, indices_hnsw = k_image_search(query_vector, index_hnsw, device, k_nums=k_new)
-        graph_scores, graph_indices = retrieve_by_hashtags(sparse_matrix, node_mapping, reverse_node_mapping, G,
-                                                          hashtags_list, hashtag_embeddings, hashtag_index, clip, device, model,
-                                                          k_num=k_new, max_depth=5, alpha=0.7, similarity_num = 10,
-                                                          min_score_threshold=0.01, max_keyframes=10000, max_iterations=10000)
-        refined_scores, refined_indexes = re_ranking(distances_hnsw, indices_hnsw,
-                                                    graph_scores, graph_indices,
-                                                    k_num=k, boost_amount = 2)
+        hybrid = StageGraph('hybrid_expansion')
+        hybrid.add('vector', lambda: k_image_search_filtered(query_vector, index_hnsw, device, k_nums=k_new,
+                                                             row_ids=row_ids))
+        hybrid.add('graph', lambda: graph_branch(k_new if row_ids is None else graph_k, k_new))
+        hybrid.add('re_ranking', lambda vector, graph: re_ranking(*vector, *graph,
+                                                                  k_num=k, boost_amount = 2),
+                   after=('vector', 'graph'))
+        refined_scores, refined_indexes = hybrid.run()['re_ranking']
 
       #Filter and Display Results
       results = display_option_results(display_option,
                                        refined_scores, refined_indexes,
                                        image_info_dict, graph=True)
-      execution_time = time.time() - start_time
+      execution_time = time.time() - retrieval_start
       logger.info("The result-extracting process is completed!!!")
       logger.info(f"Program Executed in {execution_time}")
 
     if len(hashtags_list) != 0 and not query_text:
-      #GRAPH based retrieval process
-      graph_scores, graph_indices = retrieve_by_hashtags(sparse_matrix, node_mapping, reverse_node_mapping, G,
+      #GRAPH based retrieval process (single hashtags read the precomputed postings of hot hashtags)
+      graph_scores, graph_indices = retrieve_by_hashtags(grafa,
                                                          hashtags_list, hashtag_embeddings, hashtag_index, clip, device, model,
-                                                         k_num=k, max_depth=5, alpha=0.7, similarity_num = 10,
-                                                         min_score_threshold=0.01, max_keyframes=10000, max_iterations=10000)
+                                                         k_num=graph_k, max_depth=5, alpha=0.7, similarity_num = 10,
+                                                         min_score_threshold=0.01, max_keyframes=10000, max_iterations=10000,
+                                                         engine='frontier', traversal_cache=traversal_cache,
+                                                         similar_cache=similar_hashtag_cache, hashtag_vocabulary=hashtag_vocabulary,
+                                                         lexical_matcher=lexical_matcher,
+                                                         postings=app.state.hashtag_postings)
+      graph_scores, graph_indices = filter_results(graph_scores, graph_indices, row_ids, k_num=k)
       logger.info("The retrieval process is completed!!!")
       #Filter and Display Results
       results = display_option_results(display_option,
                                        graph_scores, graph_indices,
                                        image_info_dict, graph=True)
-      execution_time = time.time() - start_time
+      execution_time = time.time() - retrieval_start
       logger.info("The result-extracting process is completed!!!")
       logger.info(f"Program Executed in {execution_time}")
 
     if query_text != '' and len(hashtags_list) == 0:
-      #FAISS database Processing
-      index_hnsw = faiss_database_processing(database_name)
+      #Resident FAISS index
+      index_hnsw = app.state.index_registry.get(database_name)
       #FAISS based retrieval process
       query_vector = encode_description(model, device, query_text)
-      distances_hnsw, indices_hnsw = k_image_search(query_vector, index_hnsw,
-                                                    device, k_nums=k)
+      distances_hnsw, indices_hnsw = k_image_search_filtered(query_vector, index_hnsw,
+                                                             device, k_nums=k, row_ids=row_ids)
       logger.info("The retrieval process is completed!!!")
       #Filter and Display Results
       results = display_option_results(display_option,
                                        distances_hnsw, indices_hnsw,
                                        image_info_dict)
-      execution_time = time.time() - start_time
+      execution_time = time.time() - retrieval_start
       logger.info("The result-extracting process is completed!!!")
       logger.info(f"Program Executed in {execution_time}")
 
@@ -233,6 +294,72 @@ def cached_results(query_text: str, hiddenHashtags: str,
 
     return results, hiddenInitialDBIdx, hiddenInitialDBScore
 
+def search_and_refine(query_text: str, hiddenHashtags: str,
+                      database_name: str, k: int, display_option: str,
+                      feedback_status: dict, refine_status: bool,
+                      app: FastAPI,
+                      video_ID: str = '', start_time: str = '', end_time: str = ''):
+    """
+    Retrieve the (cached) results of a query and refine them with the feedback of the session.
+    This is the blocking compute stage shared by the /home and /update_results routes.
+
+    Args:
+        query_text (str): The text query provided by the user.
+        hiddenHashtags (str): A comma-separated string of hashtags.
+        database_name (str): The name of the database to query.
+        k (int): The number of top results to retrieve.
+        display_option (str): The option for displaying results.
+        feedback_status (dict): The feedback of the session.
+        refine_status (bool): Whether the user asked for aggregated refining.
+        app (FastAPI): The FastAPI application instance, containing necessary state information.
+        video_ID, start_time, end_time (str): The optional video / time-range filter of the query.
+
+    Returns:
+        list: The refined results, formatted according to the display option.
+
+    Process:
+        1. Retrieve the initial results with `cached_results`.
+        2. Without a refine request, re-rank them with the immediate feedback (if any).
+        3. Otherwise, aggregate the feedback and explore the CLIP_v0 index around the results.
+    """
+
+    device = app.state.device
+    image_info_dict = app.state.image_info_dict
+    encoded_frames = app.state.encoded_frames
+    clipv0_hnsw = app.state.index_registry.get('CLIP_v0')
+
+    results, hiddenInitialDBIdx, hiddenInitialDBScore = cached_results(query_text, hiddenHashtags,
+                                                                       database_name, k, display_option,
+                                                                       app, video_ID, start_time, end_time)
+    logger.info(f"hiddenInitialDBIdx: {hiddenInitialDBIdx}")
+
+    if refine_status == False and feedback_status:
+      logger.info(f"Received feedback: {feedback_status}")
+      refined_DBScore, refined_DBIdx = immediate_refining(hiddenInitialDBIdx, hiddenInitialDBScore,
+                                                          feedback_status, encoded_frames)
+      results = display_option_results(display_option,
+                                      refined_DBScore, refined_DBIdx,
+                                      image_info_dict)
+      logger.info(f"hiddenRefinedDBIdx: {refined_DBIdx}")
+
+    else:
+      logger.info(f"Received feedback: {feedback_status}")
+      logger.info(f"Refine status: {refine_status}")
+      aggregated_DBScore, aggregated_DBIdx = aggregated_refining(hiddenInitialDBIdx, hiddenInitialDBScore,
+                                                                  feedback_status, encoded_frames, clipv0_hnsw, device,
+                                                                  exploration_ratio=0.2, original_weight=0.7,
+                                                                  decay_factor=0.9, window_size=50, time_weight_ratio=0.5,
+                                                                  frame_knn=current_frame_knn(app))
+      # The exploration searches the whole CLIP_v0 index: drop the frames outside the filter
+      aggregated_DBScore, aggregated_DBIdx = filter_results(aggregated_DBScore, aggregated_DBIdx,
+                                                            filter_row_ids(image_info_dict, video_ID, start_time, end_time))
+      results = display_option_results(display_option,
+                                      aggregated_DBScore, aggregated_DBIdx,
+                                      image_info_dict)
+      logger.info(f"hiddenAggregatedDBIdx: {aggregated_DBIdx}")
+
+    return results
+
 def paginate_results(results, 
                      page: int, 
                      images_per_page: int):
@@ -0,0 +1,122 @@
+##############################################
+#--------------Helper Functions---------------
+##############################################
+
+# tools/similar_hashtag_cache.py
+
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import logging
+# Set up logging
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+class SimilarHashtagCache:
+    """
+    A bounded LRU cache of the vocabulary hashtags resolved for unseen query hashtags, keyed by
+    (hashtag, k, vocabulary size) and optionally backed by a sqlite file so that it survives restarts.
+
+    The vocabulary size is part of the key because an ingestion that adds hashtags to the vocabulary can change
+    the similar hashtags of an unseen one; resolutions made on another vocabulary are simply not found.
+
+    Args:
+        max_entries (int): The maximum number of resolutions kept in memory (default is 10000).
+        db_path (str, optional): The sqlite file of the on-disk store (default is None: memory only).
+    """
+
+    def __init__(self, max_entries=10000, db_path=None):
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS similar_hashtags ("
+                             "hashtag TEXT NOT NULL, k INTEGER NOT NULL, vocabulary_size INTEGER NOT NULL, "
+                             "similar TEXT NOT NULL, PRIMARY KEY (hashtag, k, vocabulary_size))")
+            self._db.commit()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _remember(self, key, similar_hashtags):
+        self._entries[key] = similar_hashtags
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get_many(self, hashtags, k, vocabulary_size):
+        """
+        Look up the similar hashtags of several unseen hashtags.
+
+        Returns:
+            list: One list of similar hashtags per hashtag, or None for hashtags that are not cached.
+        """
+
+        results = []
+        with self._lock:
+            for hashtag in hashtags:
+                key = (hashtag, k, vocabulary_size)
+                similar_hashtags = self._entries.get(key)
+                if similar_hashtags is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                elif self._db is not None:
+                    row = self._db.execute("SELECT similar FROM similar_hashtags "
+                                           "WHERE hashtag = ? AND k = ? AND vocabulary_size = ?", key).fetchone()
+                    if row is not None:
+                        similar_hashtags = tuple(json.loads(row[0]))
+                        self._remember(key, similar_hashtags)
+                        self.disk_hits += 1
+                if similar_hashtags is None:
+                    self.misses += 1
+                results.append(list(similar_hashtags) if similar_hashtags is not None else None)
+        return results
+
+    def put_many(self, hashtags, similar_hashtags_lists, k, vocabulary_size):
+        """
+        Store the similar hashtags of several unseen hashtags.
+
+        Args:
+            hashtags (list): The unseen hashtags.
+            similar_hashtags_lists (list): The similar hashtags of each unseen hashtag.
+            k (int): The number of neighbors that were searched.
+            vocabulary_size (int): The size of the vocabulary that was searched.
+        """
+
+        with self._lock:
+            for hashtag, similar_hashtags in zip(hashtags, similar_hashtags_lists):
+                self._remember((hashtag, k, vocabulary_size), tuple(similar_hashtags))
+            if self._db is not None:
+                try:
+                    self._db.executemany("INSERT OR REPLACE INTO similar_hashtags "
+                                         "(hashtag, k, vocabulary_size, similar) VALUES (?, ?, ?, ?)",
+                                         [(hashtag, k, vocabulary_size, json.dumps(list(similar_hashtags)))
+                                          for hashtag, similar_hashtags in zip(hashtags, similar_hashtags_lists)])
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    # Another worker may hold the write lock; the in-memory entries are still valid
+                    logger.warning(f"Could not persist similar hashtags to {self.db_path}: {e}")
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                'persistent': self._db is not None}
@@ -0,0 +1,135 @@
+##############################################
+#--------------Helper Functions---------------
+##############################################
+
+# tools/stage_graph.py
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import logging
+# Set up logging
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+class StageGraph:
+    """
+    A small DAG of pipeline stages. Each stage runs as soon as the stages it depends on are done, so independent
+    branches (e.g. the FAISS search and the graph traversal of a hybrid query) run concurrently and the pipeline
+    takes about as long as its slowest path rather than the sum of its stages.
+
+    Stages run on threads: CLIP encoding (torch), FAISS searches and the array operations of the graph engine
+    release the GIL in their heavy loops and share the loaded databases, which processes could not.
+
+    Args:
+        name (str): The name of the pipeline, used in the logs and the stage statistics.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._stages = {}
+        self.timings = {}
+
+    def add(self, name, fn, after=()):
+        """
+        Register a stage.
+
+        Args:
+            name (str): The name of the stage.
+            fn (callable): Called with the results of the `after` stages, in order.
+            after (tuple): Names of the stages this one depends on (they must already be registered).
+        """
+
+        missing = [dependency for dependency in after if dependency not in self._stages]
+        if missing:
+            raise ValueError(f"Stage {name} depends on unknown stages {missing}.")
+        self._stages[name] = {'fn': fn, 'after': tuple(after)}
+        return self
+
+    def _call(self, name, args):
+        started_at = time.perf_counter()
+        try:
+            return self._stages[name]['fn'](*args)
+        finally:
+            self.timings[name] = (time.perf_counter() - started_at) * 1000
+
+    def run(self, executor=None):
+        """
+        Run every stage, concurrently where the dependencies allow it.
+
+        Args:
+            executor (concurrent.futures.Executor, optional): The pool running the stages (default is None: the
+                                                              shared stage pool).
+
+        Returns:
+            dict: The result of every stage.
+
+        Raises:
+            Exception: The first exception raised by a stage; the stages already running are awaited first.
+        """
+
+        executor = executor or get_stage_executor()
+        started_at = time.perf_counter()
+        results = {}
+        pending = {}
+        remaining = dict(self._stages)
+        try:
+            while remaining or pending:
+                for name in [name for name, stage in remaining.items()
+                             if all(dependency in results for dependency in stage['after'])]:
+                    args = [results[dependency] for dependency in remaining.pop(name)['after']]
+                    pending[executor.submit(self._call, name, args)] = name
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[pending.pop(future)] = future.result()
+        finally:
+            # Do not leave stages running on data the caller is about to drop
+            wait(pending)
+        self.timings['total'] = (time.perf_counter() - started_at) * 1000
+        stage_stats.record(self.name, self.timings)
+        logger.info(f"{self.name} stages (ms): " + ', '.join(f"{name}={elapsed:.1f}"
+                                                            for name, elapsed in self.timings.items()))
+        return results
+
+class StageStats:
+    """
+    Running count, mean and maximum duration of the stages of each pipeline, for `/metrics`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, pipeline, timings):
+        with self._lock:
+            stats = self._stats.setdefault(pipeline, {})
+            for name, elapsed in timings.items():
+                stage = stats.setdefault(name, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+                stage['count'] += 1
+                stage['total_ms'] += elapsed
+                stage['max_ms'] = max(stage['max_ms'], elapsed)
+
+    def stats(self):
+        with self._lock:
+            return {pipeline: {name: {'count': stage['count'],
+                                      'mean_ms': stage['total_ms'] / stage['count'],
+                                      'max_ms': stage['max_ms']}
+                               for name, stage in stats.items()}
+                    for pipeline, stats in self._stats.items()}
+
+# The process-wide stage statistics
+stage_stats = StageStats()
+
+# The pool running the pipeline stages. It is separate from the compute executor: the pipelines themselves run
+# on compute threads, and waiting there for jobs queued on the same bounded pool could deadlock.
+_stage_executor = None
+_stage_executor_lock = threading.Lock()
+
+def get_stage_executor(max_workers=8):
+    global _stage_executor
+    with _stage_executor_lock:
+        if _stage_executor is None:
+            _stage_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='stage')
+        return _stage_executor
@@ -0,0 +1,134 @@
+##############################################
+#--------------Helper Functions---------------
+##############################################
+
+# tools/text_embedding_cache.py
+
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+import logging
+# Set up logging
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+def normalize_text(text):
+    """
+    Normalize a text for caching. CLIP lowercases and collapses whitespace before tokenizing,
+    so texts differing only in case or spacing share one embedding.
+    """
+
+    return ' '.join(text.split()).lower()
+
+class TextEmbeddingCache:
+    """
+    A bounded LRU cache of raw CLIP text features keyed by (model name, normalized text), optionally backed by
+    a sqlite file so that the embeddings survive restarts.
+
+    Args:
+        max_entries (int): The maximum number of embeddings kept in memory (default is 50000).
+        db_path (str, optional): The sqlite file of the on-disk store (default is None: memory only).
+    """
+
+    def __init__(self, max_entries=50000, db_path=None):
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS text_embeddings ("
+                             "model TEXT NOT NULL, text TEXT NOT NULL, vector BLOB NOT NULL, "
+                             "PRIMARY KEY (model, text))")
+            self._db.commit()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remember(self, key, vector):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get_many(self, model_name, texts):
+        """
+        Look up the embeddings of several texts.
+
+        Returns:
+            list: One float32 CPU tensor per text, or None for texts that are not cached.
+        """
+
+        results = []
+        with self._lock:
+            for text in texts:
+                key = (model_name, normalize_text(text))
+                vector = self._entries.get(key)
+                if vector is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                elif self._db is not None:
+                    row = self._db.execute("SELECT vector FROM text_embeddings WHERE model = ? AND text = ?",
+                                           key).fetchone()
+                    if row is not None:
+                        vector = torch.from_numpy(np.frombuffer(row[0], dtype=np.float32).copy())
+                        self._remember(key, vector)
+                        self.disk_hits += 1
+                if vector is None:
+                    self.misses += 1
+                results.append(vector)
+        return results
+
+    def put_many(self, model_name, texts, features):
+        """
+        Store the embeddings of several texts.
+
+        Args:
+            model_name (str): The name of the model that produced the features.
+            texts (list): The texts.
+            features (torch.Tensor): A (len(texts), dim) tensor of raw text features.
+        """
+
+        features = features.detach().float().cpu()
+        with self._lock:
+            for text, vector in zip(texts, features):
+                self._remember((model_name, normalize_text(text)), vector.clone())
+            if self._db is not None:
+                try:
+                    self._db.executemany("INSERT OR REPLACE INTO text_embeddings (model, text, vector) VALUES (?, ?, ?)",
+                                         [(model_name, normalize_text(text), vector.numpy().tobytes())
+                                          for text, vector in zip(texts, features)])
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    # Another worker may hold the write lock; the in-memory entries are still valid
+                    logger.warning(f"Could not persist text embeddings to {self.db_path}: {e}")
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                'persistent': self._db is not None}
+
+# The process-wide cache used by the text encoders (None disables caching)
+_text_embedding_cache = None
+
+def set_text_embedding_cache(cache):
+    global _text_embedding_cache
+    _text_embedding_cache = cache
+
+def get_text_embedding_cache():
+    return _text_embedding_cache
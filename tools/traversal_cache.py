@@ -0,0 +1,153 @@
+##############################################
+#--------------Helper Functions---------------
+##############################################
+
+# tools/traversal_cache.py
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import logging
+# Set up logging
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+class TraversalCache:
+    """
+    A memory-bounded LRU cache of per-hashtag graph traversals.
+
+    A traversal is stored as a sparse vector: the keyframe node ids reached from one seed hashtag (in first-arrival
+    order) and their raw weights. Single-seed queries are answered from the cache; with `compose_seeds` (see
+    `retrieve_by_hashtags`), multi-hashtag queries merge the vectors of their hashtags (see `merge_traversals`), so
+    changing one hashtag of a query only traverses the new one.
+
+    Args:
+        max_bytes (int): The maximum memory held by the cached vectors (default is 128 MiB).
+    """
+
+    def __init__(self, max_bytes=128 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._traversals = OrderedDict()
+        self._graph = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._traversals)
+
+    def clear(self):
+        with self._lock:
+            self._traversals.clear()
+            self.nbytes = 0
+            self._graph = None
+
+    def _check_graph(self, grafa):
+        # Traversals are only valid on the graph they were computed on (a new generation swaps the graph)
+        if grafa is not self._graph:
+            self._traversals.clear()
+            self.nbytes = 0
+            self._graph = grafa
+
+    def get_traversal(self, grafa, key):
+        """
+        Look up the traversal of one seed hashtag.
+
+        Args:
+            grafa (GrafaGraph): The graph being traversed.
+            key (tuple): The seed node id and the traversal parameters.
+
+        Returns:
+            tuple: The (node ids, weights) arrays, or None when the traversal is not cached.
+        """
+
+        with self._lock:
+            self._check_graph(grafa)
+            vector = self._traversals.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._traversals.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put_traversal(self, grafa, key, weight_dict):
+        """
+        Store the traversal of one seed hashtag.
+
+        Args:
+            grafa (GrafaGraph): The graph being traversed.
+            key (tuple): The seed node id and the traversal parameters.
+            weight_dict (dict): The raw weight of every reached keyframe node, in first-arrival order.
+
+        Returns:
+            tuple: The stored (node ids, weights) arrays.
+        """
+
+        vector = weight_vector(weight_dict)
+        nodes, weights = vector
+        size = nodes.nbytes + weights.nbytes
+        with self._lock:
+            self._check_graph(grafa)
+            if size > self.max_bytes:
+                return vector
+            previous = self._traversals.pop(key, None)
+            if previous is not None:
+                self.nbytes -= previous[0].nbytes + previous[1].nbytes
+            self._traversals[key] = vector
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (old_nodes, old_weights) = self._traversals.popitem(last=False)
+                self.nbytes -= old_nodes.nbytes + old_weights.nbytes
+                self.evictions += 1
+        return vector
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'entries': len(self._traversals),
+                'bytes': self.nbytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0}
+
+def weight_vector(weight_dict):
+    """
+    Convert the raw keyframe weights of a traversal into a sparse (int32 node ids, float64 weights) vector,
+    keeping the first-arrival order.
+    """
+
+    nodes = np.fromiter(weight_dict.keys(), dtype=np.int32, count=len(weight_dict))
+    weights = np.fromiter(weight_dict.values(), dtype=np.float64, count=len(weight_dict))
+    return nodes, weights
+
+def merge_traversals(vectors):
+    """
+    Merge the traversals of several seed hashtags into one weight dictionary.
+
+    Args:
+        vectors (list): The (node ids, weights) arrays of each seed hashtag, in query order.
+
+    Returns:
+        dict: The summed raw weight of every reached keyframe node, ordered by first arrival across the seeds
+              (so ties are broken as in a traversal of the seeds in query order).
+    """
+
+    vectors = [vector for vector in vectors if len(vector[0])]
+    if not vectors:
+        return {}
+    if len(vectors) == 1:
+        nodes, weights = vectors[0]
+        return dict(zip(nodes.tolist(), weights.tolist()))
+    nodes = np.concatenate([vector[0] for vector in vectors])
+    weights = np.concatenate([vector[1] for vector in vectors])
+    unique_nodes, first_positions, inverse = np.unique(nodes, return_index=True, return_inverse=True)
+    sums = np.bincount(inverse, weights=weights, minlength=len(unique_nodes))
+    order = np.argsort(first_positions, kind='stable')
+    return dict(zip(unique_nodes[order].tolist(), sums[order].tolist()))
@@ -127,14 +127,19 @@ def re_ranking(faiss_scores, faiss_indices,
     graph_scores = np.array(graph_scores)
 
     # Normalize FAISS scores (lower original scores are better, so we invert the scale)
-    faiss_min = np.min(faiss_scores)
-    faiss_max = np.max(faiss_scores)
-    normalized_faiss_scores = (faiss_max - faiss_scores) / (faiss_max - faiss_min)
+    # Either side may be empty when a video / time-range filter removed all of its results
+    normalized_faiss_scores = faiss_scores
+    if faiss_scores.size:
+        faiss_min = np.min(faiss_scores)
+        faiss_max = np.max(faiss_scores)
+        normalized_faiss_scores = (faiss_max - faiss_scores) / (faiss_max - faiss_min)
 
     # Normalize Graph scores (higher original scores are better, so we keep the scale)
-    graph_min = np.min(graph_scores)
-    graph_max = np.max(graph_scores)
-    normalized_graph_scores = (graph_scores - graph_min) / (graph_max - graph_min)
+    normalized_graph_scores = graph_scores
+    if graph_scores.size:
+        graph_min = np.min(graph_scores)
+        graph_max = np.max(graph_scores)
+        normalized_graph_scores = (graph_scores - graph_min) / (graph_max - graph_min)
 
     # Create dictionaries for easy lookup of normalized scores by their indices
     faiss_dict = dict(zip(faiss_indices, normalized_faiss_scores))